@@ -0,0 +1,158 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+from app.db.database import get_db, get_db_cursor
+from app.api.auth import get_current_user
+from app.core.config import settings
+from app.core import profiler, slow_queries
+
+router = APIRouter(prefix="/admin", tags=["Administration"])
+
+
+@router.get("/slow-queries")
+def get_slow_queries(
+    limit: int = 20,
+    source: str = "memory",
+    days: int = 7,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Slowest statements grouped by fingerprint, highest total time first.
+    source=memory: ring buffer of this process; source=table: slow_query_log
+    over the last `days` days. Admin only.
+    """
+    if current_user['role'] != 'ADMIN':
+        raise HTTPException(status_code=403, detail="Accès administrateur requis")
+    
+    if source == "memory":
+        return {
+            'source': source,
+            'threshold_ms': settings.SLOW_QUERY_THRESHOLD_MS,
+            'captured': len(slow_queries.entries()),
+            'items': slow_queries.worst_offenders(limit)
+        }
+    
+    if source != "table":
+        raise HTTPException(status_code=400, detail="source doit être 'memory' ou 'table'")
+    
+    with get_db() as conn:
+        cur = get_db_cursor(conn)
+        try:
+            cur.execute("""
+                SELECT
+                    g.fingerprint, g.query, g.count, g.total_ms, g.mean_ms, g.max_ms,
+                    g.routes, g.last_seen, w.bind_shapes, w.plan
+                FROM (
+                    SELECT
+                        fingerprint,
+                        MIN(query) AS query,
+                        COUNT(*) AS count,
+                        SUM(duration_ms) AS total_ms,
+                        ROUND(AVG(duration_ms), 1) AS mean_ms,
+                        MAX(duration_ms) AS max_ms,
+                        ARRAY_AGG(DISTINCT route) AS routes,
+                        MAX(captured_at) AS last_seen
+                    FROM slow_query_log
+                    WHERE captured_at >= CURRENT_TIMESTAMP - make_interval(days => %s)
+                    GROUP BY fingerprint
+                    ORDER BY total_ms DESC
+                    LIMIT %s
+                ) g
+                CROSS JOIN LATERAL (
+                    SELECT l.bind_shapes, l.plan
+                    FROM slow_query_log l
+                    WHERE l.fingerprint = g.fingerprint
+                    ORDER BY l.duration_ms DESC
+                    LIMIT 1
+                ) w
+                ORDER BY g.total_ms DESC
+            """, (days, limit))
+            results = cur.fetchall()
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        'source': source,
+        'threshold_ms': settings.SLOW_QUERY_THRESHOLD_MS,
+        'items': [{
+            **dict(r),
+            'total_ms': float(r['total_ms']),
+            'mean_ms': float(r['mean_ms']),
+            'max_ms': float(r['max_ms'])
+        } for r in results]
+    }
+
+
+@router.delete("/slow-queries")
+async def clear_slow_queries(current_user: dict = Depends(get_current_user)):
+    """Empty the in-memory slow query buffer (admin only)"""
+    if current_user['role'] != 'ADMIN':
+        raise HTTPException(status_code=403, detail="Accès administrateur requis")
+    
+    slow_queries.clear()
+    return {"success": True, "message": "Journal des requêtes lentes vidé"}
+
+
+@router.get("/profiles")
+def get_profiles(current_user: dict = Depends(get_current_user)):
+    """Stored request profiles, newest first (admin only)"""
+    if current_user['role'] != 'ADMIN':
+        raise HTTPException(status_code=403, detail="Accès administrateur requis")
+    
+    return {'items': profiler.list_profiles()}
+
+
+@router.get("/profiles/compare")
+def compare_profiles(
+    a: str,
+    b: str,
+    limit: int = 30,
+    current_user: dict = Depends(get_current_user)
+):
+    """Per-function share of samples in two profiles, biggest changes first (admin only)"""
+    if current_user['role'] != 'ADMIN':
+        raise HTTPException(status_code=403, detail="Accès administrateur requis")
+    
+    profile_a = profiler.load_profile(a)
+    profile_b = profiler.load_profile(b)
+    if profile_a is None or profile_b is None:
+        raise HTTPException(status_code=404, detail="Profil non trouvé")
+    
+    return {
+        'a': {k: profile_a[k] for k in ('id', 'path', 'duration_ms', 'samples')},
+        'b': {k: profile_b[k] for k in ('id', 'path', 'duration_ms', 'samples')},
+        'functions': profiler.compare_profiles(profile_a, profile_b, limit)
+    }
+
+
+@router.get("/profiles/{profile_id}")
+def get_profile(
+    profile_id: str,
+    format: str = "json",
+    current_user: dict = Depends(get_current_user)
+):
+    """One profile: format=json (call tree) or folded (flamegraph.pl / speedscope) (admin only)"""
+    if current_user['role'] != 'ADMIN':
+        raise HTTPException(status_code=403, detail="Accès administrateur requis")
+    
+    report = profiler.load_profile(profile_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Profil non trouvé")
+    
+    if format == "folded":
+        lines = [f"{stack} {count}" for stack, count in report['folded'].items()]
+        return PlainTextResponse("\n".join(lines) + "\n")
+    return report
+
+
+@router.delete("/profiles/{profile_id}")
+def delete_profile(
+    profile_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Delete a stored profile (admin only)"""
+    if current_user['role'] != 'ADMIN':
+        raise HTTPException(status_code=403, detail="Accès administrateur requis")
+    
+    if not profiler.delete_profile(profile_id):
+        raise HTTPException(status_code=404, detail="Profil non trouvé")
+    return {"success": True, "message": "Profil supprimé"}
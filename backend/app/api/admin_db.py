@@ -0,0 +1,361 @@
+from fastapi import APIRouter, Depends, HTTPException
+import psycopg2
+from app.db.database import get_db, get_db_cursor
+from app.api.auth import get_current_user
+from app.core import scheduler
+
+router = APIRouter(prefix="/admin/db", tags=["Administration"])
+
+# Tables watched for index advice
+WATCHED_TABLES = ('approvisionnement', 'dotation', 'vehicule')
+
+# Tables (and their indexes) read by the pump search, warmed before the shift
+WARM_TABLES = ('dotation', 'vehicule', 'benificiaire', 'service')
+
+
+def fetch_statements(cur, limit: int, order: str):
+    """Top statements of the current database from pg_stat_statements,
+    or None when the extension is not usable"""
+    cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_stat_statements'")
+    if not cur.fetchone():
+        return None
+    
+    # Column names changed in PostgreSQL 13
+    cur.execute("SELECT current_setting('server_version_num')::int AS version")
+    suffix = "_exec_time" if cur.fetchone()['version'] >= 130000 else "_time"
+    order_column = {"total": f"total{suffix}", "mean": f"mean{suffix}", "calls": "calls"}[order]
+    
+    cur.execute("SAVEPOINT pg_stat_statements_check")
+    try:
+        cur.execute(f"""
+            SELECT
+                s.queryid::text AS queryid,
+                s.query,
+                s.calls,
+                ROUND(s.total{suffix}::numeric, 1) AS total_ms,
+                ROUND(s.mean{suffix}::numeric, 2) AS mean_ms,
+                s.rows,
+                ROUND(100.0 * s.shared_blks_hit / NULLIF(s.shared_blks_hit + s.shared_blks_read, 0), 1) AS cache_hit_pct
+            FROM pg_stat_statements s
+            WHERE s.dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+              AND s.query NOT ILIKE '%%pg_stat%%'
+            ORDER BY s.{order_column} DESC
+            LIMIT %s
+        """, (limit,))
+    except psycopg2.Error:
+        # Extension created but not in shared_preload_libraries
+        cur.execute("ROLLBACK TO SAVEPOINT pg_stat_statements_check")
+        return None
+    
+    return [{
+        **dict(r),
+        'total_ms': float(r['total_ms']),
+        'mean_ms': float(r['mean_ms']),
+        'cache_hit_pct': float(r['cache_hit_pct']) if r['cache_hit_pct'] is not None else None
+    } for r in cur.fetchall()]
+
+
+@router.get("/statements")
+def get_top_statements(
+    limit: int = 20,
+    order: str = "total",
+    current_user: dict = Depends(get_current_user)
+):
+    """Top statements from pg_stat_statements: order=total|mean|calls (admin only)"""
+    if current_user['role'] != 'ADMIN':
+        raise HTTPException(status_code=403, detail="Accès administrateur requis")
+    
+    if order not in ("total", "mean", "calls"):
+        raise HTTPException(status_code=400, detail="order doit être total, mean ou calls")
+    
+    with get_db() as conn:
+        cur = get_db_cursor(conn)
+        items = fetch_statements(cur, limit, order)
+    
+    if items is None:
+        return {
+            'available': False,
+            'message': "pg_stat_statements n'est pas installé (CREATE EXTENSION pg_stat_statements "
+                       "et shared_preload_libraries = 'pg_stat_statements')",
+            'items': []
+        }
+    return {'available': True, 'items': items}
+
+
+@router.get("/indexes")
+def get_index_advice(current_user: dict = Depends(get_current_user)):
+    """Unused indexes and missing index candidates on the main tables (admin only)"""
+    if current_user['role'] != 'ADMIN':
+        raise HTTPException(status_code=403, detail="Accès administrateur requis")
+    
+    with get_db() as conn:
+        cur = get_db_cursor(conn)
+        
+        # Never scanned since the statistics reset, and not enforcing a constraint
+        cur.execute("""
+            SELECT
+                s.relname AS table_name,
+                s.indexrelname AS index_name,
+                s.idx_scan,
+                pg_size_pretty(pg_relation_size(s.indexrelid)) AS size,
+                pg_relation_size(s.indexrelid) AS size_bytes
+            FROM pg_stat_user_indexes s
+            JOIN pg_index i ON i.indexrelid = s.indexrelid
+            WHERE s.relname = ANY(%s)
+              AND s.idx_scan = 0
+              AND NOT i.indisunique
+              AND NOT i.indisprimary
+            ORDER BY pg_relation_size(s.indexrelid) DESC
+        """, (list(WATCHED_TABLES),))
+        unused = [dict(r) for r in cur.fetchall()]
+        
+        # Foreign key columns without an index starting with them
+        cur.execute("""
+            SELECT
+                c.conrelid::regclass::text AS table_name,
+                a.attname AS column_name,
+                c.conname AS constraint_name
+            FROM pg_constraint c
+            JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = c.conkey[1]
+            WHERE c.contype = 'f'
+              AND c.conrelid::regclass::text = ANY(%s)
+              AND NOT EXISTS (
+                  SELECT 1 FROM pg_index i
+                  WHERE i.indrelid = c.conrelid
+                    AND i.indkey[0] = c.conkey[1]
+              )
+            ORDER BY 1, 2
+        """, (list(WATCHED_TABLES),))
+        unindexed_fks = [dict(r) for r in cur.fetchall()]
+        
+        # Tables mostly read by sequential scans
+        cur.execute("""
+            SELECT
+                relname AS table_name,
+                seq_scan,
+                seq_tup_read,
+                COALESCE(idx_scan, 0) AS idx_scan,
+                n_live_tup,
+                ROUND(seq_tup_read::numeric / NULLIF(seq_scan, 0)) AS avg_rows_per_seq_scan
+            FROM pg_stat_user_tables
+            WHERE relname = ANY(%s)
+            ORDER BY seq_tup_read DESC
+        """, (list(WATCHED_TABLES),))
+        scans = []
+        for r in cur.fetchall():
+            row = dict(r)
+            row['avg_rows_per_seq_scan'] = int(row['avg_rows_per_seq_scan'] or 0)
+            row['candidate'] = (
+                row['seq_scan'] > row['idx_scan']
+                and row['n_live_tup'] > 1000
+                and row['avg_rows_per_seq_scan'] > 1000
+            )
+            scans.append(row)
+    
+    return {
+        'unused_indexes': unused,
+        'unindexed_foreign_keys': unindexed_fks,
+        'sequential_scans': scans
+    }
+
+
+@router.get("/bloat")
+def get_bloat_estimates(current_user: dict = Depends(get_current_user)):
+    """Dead tuples per table and index size estimates (admin only)"""
+    if current_user['role'] != 'ADMIN':
+        raise HTTPException(status_code=403, detail="Accès administrateur requis")
+    
+    with get_db() as conn:
+        cur = get_db_cursor(conn)
+        cur.execute("""
+            SELECT
+                relname AS table_name,
+                n_live_tup,
+                n_dead_tup,
+                ROUND(100.0 * n_dead_tup / NULLIF(n_live_tup + n_dead_tup, 0), 1) AS dead_pct,
+                pg_size_pretty(pg_table_size(relid)) AS table_size,
+                pg_size_pretty(pg_indexes_size(relid)) AS indexes_size,
+                last_vacuum,
+                last_autovacuum
+            FROM pg_stat_user_tables
+            ORDER BY n_dead_tup DESC
+        """)
+        tables = []
+        for r in cur.fetchall():
+            row = dict(r)
+            row['dead_pct'] = float(row['dead_pct']) if row['dead_pct'] is not None else 0.0
+            tables.append(row)
+        
+        # Rough estimate: actual size vs. rows * (key width + tuple overhead)
+        # at the default btree fillfactor
+        cur.execute("""
+            SELECT
+                t.relname AS table_name,
+                ic.relname AS index_name,
+                pg_relation_size(ic.oid) AS size_bytes,
+                pg_size_pretty(pg_relation_size(ic.oid)) AS size,
+                GREATEST(ic.reltuples, 0)::bigint AS rows,
+                (
+                    GREATEST(ic.reltuples, 0) * (COALESCE(w.key_width, 8) + 16) / 0.9
+                    + current_setting('block_size')::int
+                )::bigint AS expected_bytes
+            FROM pg_index i
+            JOIN pg_class ic ON ic.oid = i.indexrelid
+            JOIN pg_class t ON t.oid = i.indrelid
+            JOIN pg_namespace n ON n.oid = t.relnamespace
+            JOIN pg_am am ON am.oid = ic.relam
+            LEFT JOIN LATERAL (
+                SELECT SUM(st.avg_width) AS key_width
+                FROM pg_attribute a
+                JOIN pg_stats st ON st.schemaname = n.nspname
+                                AND st.tablename = t.relname
+                                AND st.attname = a.attname
+                WHERE a.attrelid = t.oid
+                  AND a.attnum = ANY(i.indkey)
+            ) w ON TRUE
+            WHERE n.nspname = 'public'
+              AND am.amname = 'btree'
+            ORDER BY pg_relation_size(ic.oid) DESC
+        """)
+        indexes = []
+        for r in cur.fetchall():
+            row = dict(r)
+            row['bloat_pct'] = round(max(0.0, 100.0 * (1 - row['expected_bytes'] / row['size_bytes'])), 1) if row['size_bytes'] else 0.0
+            indexes.append(row)
+    
+    return {'tables': tables, 'indexes': indexes}
+
+
+@router.get("/cache")
+def get_cache_hit_ratio(current_user: dict = Depends(get_current_user)):
+    """Buffer cache hit ratio for the database and each table (admin only)"""
+    if current_user['role'] != 'ADMIN':
+        raise HTTPException(status_code=403, detail="Accès administrateur requis")
+    
+    with get_db() as conn:
+        cur = get_db_cursor(conn)
+        cur.execute("""
+            SELECT
+                ROUND(100.0 * blks_hit / NULLIF(blks_hit + blks_read, 0), 2) AS hit_pct,
+                blks_hit,
+                blks_read
+            FROM pg_stat_database
+            WHERE datname = current_database()
+        """)
+        database = dict(cur.fetchone())
+        
+        cur.execute("""
+            SELECT
+                relname AS table_name,
+                ROUND(100.0 * heap_blks_hit / NULLIF(heap_blks_hit + heap_blks_read, 0), 2) AS heap_hit_pct,
+                ROUND(100.0 * idx_blks_hit / NULLIF(idx_blks_hit + idx_blks_read, 0), 2) AS index_hit_pct,
+                heap_blks_read + COALESCE(idx_blks_read, 0) AS blks_read
+            FROM pg_statio_user_tables
+            ORDER BY heap_blks_read + COALESCE(idx_blks_read, 0) DESC
+        """)
+        tables = [dict(r) for r in cur.fetchall()]
+    
+    def pct(value):
+        return float(value) if value is not None else None
+    
+    database['hit_pct'] = pct(database['hit_pct'])
+    for t in tables:
+        t['heap_hit_pct'] = pct(t['heap_hit_pct'])
+        t['index_hit_pct'] = pct(t['index_hit_pct'])
+    
+    return {'database': database, 'tables': tables}
+
+
+@router.get("/triggers")
+def get_trigger_stats(current_user: dict = Depends(get_current_user)):
+    """Triggers with their function call counts (admin only).
+    Counts need track_functions = 'pl' or 'all'."""
+    if current_user['role'] != 'ADMIN':
+        raise HTTPException(status_code=403, detail="Accès administrateur requis")
+    
+    with get_db() as conn:
+        cur = get_db_cursor(conn)
+        cur.execute("SELECT current_setting('track_functions') AS track_functions")
+        track_functions = cur.fetchone()['track_functions']
+        
+        cur.execute("""
+            SELECT
+                tg.tgname AS trigger_name,
+                tg.tgrelid::regclass::text AS table_name,
+                p.proname AS function_name,
+                tg.tgenabled <> 'D' AS enabled,
+                f.calls,
+                ROUND(f.total_time::numeric, 1) AS total_ms,
+                ROUND(f.self_time::numeric, 1) AS self_ms
+            FROM pg_trigger tg
+            JOIN pg_proc p ON p.oid = tg.tgfoid
+            LEFT JOIN pg_stat_user_functions f ON f.funcid = tg.tgfoid
+            WHERE NOT tg.tgisinternal
+            ORDER BY f.total_time DESC NULLS LAST, tg.tgrelid::regclass::text, tg.tgname
+        """)
+        triggers = []
+        for r in cur.fetchall():
+            row = dict(r)
+            row['total_ms'] = float(row['total_ms']) if row['total_ms'] is not None else None
+            row['self_ms'] = float(row['self_ms']) if row['self_ms'] is not None else None
+            triggers.append(row)
+    
+    result = {'track_functions': track_functions, 'triggers': triggers}
+    if track_functions == 'none':
+        result['message'] = "Compteurs indisponibles: activer track_functions = 'pl'"
+    return result
+
+
+@router.get("/")
+def get_db_overview(current_user: dict = Depends(get_current_user)):
+    """Database size, connections, cache hit ratio and extension availability (admin only)"""
+    if current_user['role'] != 'ADMIN':
+        raise HTTPException(status_code=403, detail="Accès administrateur requis")
+    
+    with get_db() as conn:
+        cur = get_db_cursor(conn)
+        cur.execute("""
+            SELECT
+                current_database() AS database,
+                current_setting('server_version') AS version,
+                pg_size_pretty(pg_database_size(current_database())) AS size,
+                (SELECT COUNT(*) FROM pg_stat_activity WHERE datname = current_database()) AS connections,
+                current_setting('max_connections')::int AS max_connections,
+                (
+                    SELECT ROUND(100.0 * blks_hit / NULLIF(blks_hit + blks_read, 0), 2)
+                    FROM pg_stat_database WHERE datname = current_database()
+                ) AS cache_hit_pct,
+                EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_stat_statements') AS pg_stat_statements,
+                current_setting('track_functions') AS track_functions,
+                (SELECT stats_reset FROM pg_stat_database WHERE datname = current_database()) AS stats_reset
+        """)
+        overview = dict(cur.fetchone())
+    
+    if overview['cache_hit_pct'] is not None:
+        overview['cache_hit_pct'] = float(overview['cache_hit_pct'])
+    return overview
+
+
+@scheduler.scheduled("warm_caches", "45 6 * * 1-6")
+def warm_caches():
+    """Read the pump tables and their indexes into shared_buffers before the
+    morning shift, for every worker; indexes only with pg_prewarm"""
+    with get_db() as conn:
+        cur = get_db_cursor(conn)
+        cur.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_prewarm') AS prewarm")
+        prewarm = cur.fetchone()['prewarm']
+        
+        blocks = 0
+        for table in WARM_TABLES:
+            if prewarm:
+                cur.execute("""
+                    SELECT SUM(pg_prewarm(c.oid)) AS blocks
+                    FROM pg_class c
+                    WHERE c.oid = %s::regclass
+                       OR c.oid IN (SELECT indexrelid FROM pg_index WHERE indrelid = %s::regclass)
+                """, (table, table))
+            else:
+                cur.execute(f"SELECT COUNT(*) AS n, pg_relation_size('{table}') / current_setting('block_size')::int AS blocks FROM {table}")
+            blocks += cur.fetchone()['blocks'] or 0
+        conn.rollback()
+    return {"tables": len(WARM_TABLES), "blocks": int(blocks), "pg_prewarm": prewarm}
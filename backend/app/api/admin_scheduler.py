@@ -0,0 +1,56 @@
+from fastapi import APIRouter, Depends, HTTPException
+from app.db.database import get_db, get_db_cursor
+from app.api.auth import get_current_user
+from app.core import scheduler
+
+router = APIRouter(prefix="/admin/scheduler", tags=["Administration"])
+
+
+@router.get("")
+def get_scheduler_status(current_user: dict = Depends(get_current_user)):
+    """Scheduled tasks (spec, next slot, last run) and the worker leading
+    the scheduler (admin only)"""
+    if current_user['role'] != 'ADMIN':
+        raise HTTPException(status_code=403, detail="Accès administrateur requis")
+    
+    with get_db() as conn:
+        return scheduler.status(conn)
+
+
+@router.get("/runs")
+def get_scheduler_runs(
+    task: str = None,
+    limit: int = 50,
+    current_user: dict = Depends(get_current_user)
+):
+    """Run history of the scheduled tasks, latest first, with their
+    durations (admin only)"""
+    if current_user['role'] != 'ADMIN':
+        raise HTTPException(status_code=403, detail="Accès administrateur requis")
+    
+    with get_db() as conn:
+        cur = get_db_cursor(conn)
+        cur.execute("""
+            SELECT id, task, scheduled_for, status, worker, started_at, finished_at,
+                   duration_ms, result, error
+            FROM scheduler_run
+            WHERE %(task)s::text IS NULL OR task = %(task)s
+            ORDER BY started_at DESC
+            LIMIT %(limit)s
+        """, {"task": task, "limit": min(limit, 500)})
+        runs = [dict(r) for r in cur.fetchall()]
+        
+        cur.execute("""
+            SELECT
+                task,
+                COUNT(*) AS runs,
+                COUNT(*) FILTER (WHERE status = 'failed') AS failed,
+                ROUND(AVG(duration_ms)) AS mean_ms,
+                MAX(duration_ms) AS max_ms
+            FROM scheduler_run
+            GROUP BY task
+            ORDER BY task
+        """)
+        tasks = [{**r, 'mean_ms': int(r['mean_ms']) if r['mean_ms'] is not None else None} for r in cur.fetchall()]
+    
+    return {'tasks': tasks, 'runs': runs}
@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from typing import List, Optional
 from app.schemas.schemas import (
     ApprovisionnementSearch,
@@ -7,12 +8,64 @@ from app.schemas.schemas import (
     ApprovisionnementDetail,
     VehicleSearchResult
 )
-from app.db.database import get_db, get_db_cursor
+from app.db.database import get_db, get_db_cursor, get_tuple_cursor
 from app.api.auth import get_current_user
+from app.core import jobs, ref_cache, table_versions
+from app.core.conditional import conditional
+from app.core.json_rows import fetch_rows, list_format, list_response
+from app.utils.fields import Projection
+from datetime import datetime
+from openpyxl.utils import get_column_letter
+import logging
+import openpyxl
 import psycopg2
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/approvisionnement", tags=["Approvisionnement"])
 
+# Tables read by /list (dotation_all is dotation + dotation_archive); the
+# reference tables are versioned by their ref_cache snapshots
+LIST_TABLES = ("approvisionnement", "dotation", "dotation_archive")
+LIST_REF_TABLES = (ref_cache.VEHICULES, ref_cache.BENIFICIAIRES, ref_cache.SERVICES)
+
+# ?fields= of /list; joins not needed by the requested fields are left out
+LIST_FIELDS = Projection(
+    {
+        "id": "a.id",
+        "type_approvi": "a.type_approvi",
+        "date": "a.date",
+        "qte": "a.qte",
+        "km_precedent": "a.km_precedent",
+        "km": "a.km",
+        "anomalie": "a.anomalie",
+        "dotation_id": "a.dotation_id",
+        "vhc_provisoire": "a.vhc_provisoire",
+        "km_provisoire": "a.km_provisoire",
+        "matricule_conducteur": "a.matricule_conducteur",
+        "service_externe": "a.service_affecte",
+        "ville_origine": "a.destination",
+        "ordre_mission": "a.ordre_mission",
+        "observations": "a.observations",
+        "numero_bon": "a.numero_bon",
+        "ncivil": "v.ncivil",
+        "marque": "v.marque",
+        "carburant": "v.carburant",
+        "police": "v.police",
+        "police_vehicule": "a.police_vehicule",
+        "benificiaire_nom": "b.nom",
+        "service_nom": "s.nom",
+        "fonction": "b.fonction",
+        "direction": "s.direction",
+    },
+    {
+        "d": ("LEFT JOIN dotation_all d ON a.dotation_id = d.id", None),
+        "v": ("LEFT JOIN vehicule v ON d.vehicule_id = v.id", "d"),
+        "b": ("LEFT JOIN benificiaire b ON d.benificiaire_id = b.id", "d"),
+        "s": ("LEFT JOIN service s ON b.service_id = s.id", "b"),
+    }
+)
+
 @router.post("/search", response_model=VehicleSearchResult)
 async def search_vehicle(
     search: ApprovisionnementSearch,
@@ -121,12 +174,12 @@ async def create_dotation_approvisionnement(
                     
                     updated = cur.fetchone()
                     if updated:
-                        print(f"✅ Updated provisoire vehicle {appro.vhc_provisoire} KM to {appro.km_provisoire}")
+                        logger.info("Km du véhicule provisoire mis à jour", extra={"police": appro.vhc_provisoire, "km": appro.km_provisoire})
                     else:
-                        print(f"ℹ️ Provisoire vehicle {appro.vhc_provisoire} not found in DB - continuing without update")
+                        logger.debug("Véhicule provisoire absent de la base, km non mis à jour", extra={"police": appro.vhc_provisoire})
                 except Exception as e:
                     # Don't fail the entire operation if provisoire update fails
-                    print(f"⚠️ Could not update provisoire vehicle KM: {str(e)}")
+                    logger.warning("Mise à jour du km du véhicule provisoire impossible: %s", e, extra={"police": appro.vhc_provisoire})
             
             # Auto-close dotation if quota reached
             cur.execute("""
@@ -137,6 +190,8 @@ async def create_dotation_approvisionnement(
                 AND cloture = FALSE
             """, (appro.dotation_id,))
             
+            # This worker's next /list must not be a 304 while the NOTIFY is on its way
+            table_versions.expect(cur, "approvisionnement")
             conn.commit()
             
             return {
@@ -183,6 +238,7 @@ async def create_mission_approvisionnement(
             ))
             
             result = cur.fetchone()
+            table_versions.expect(cur, "approvisionnement")
             conn.commit()
             
             return {
@@ -195,8 +251,53 @@ async def create_mission_approvisionnement(
             conn.rollback()
             raise HTTPException(status_code=500, detail=f"Erreur: {str(e)}")
 
+def list_where(type_filter: str = None, date_from: str = None, date_to: str = None,
+               mois: int = None, annee: int = None, search: str = None):
+    """WHERE clause and params of the /list filters (and of the export)"""
+    where_clauses = []
+    params = []
+    
+    if type_filter and type_filter != 'all':
+        where_clauses.append("a.type_approvi = %s")
+        params.append(type_filter)
+    
+    if date_from:
+        where_clauses.append("a.date >= %s")
+        params.append(date_from)
+    
+    if date_to:
+        where_clauses.append("a.date <= %s")
+        params.append(date_to)
+    
+    if mois and annee:
+        where_clauses.append("EXTRACT(MONTH FROM a.date) = %s AND EXTRACT(YEAR FROM a.date) = %s")
+        params.extend([mois, annee])
+    elif annee:
+        where_clauses.append("EXTRACT(YEAR FROM a.date) = %s")
+        params.append(annee)
+    
+    if search:
+        # Same columns as the search box of the bons list
+        where_clauses.append("""(
+            v.police ILIKE %s OR b.nom ILIKE %s OR s.nom ILIKE %s
+            OR a.police_vehicule ILIKE %s OR a.matricule_conducteur ILIKE %s
+        )""")
+        params.extend([f"%{search}%"] * 5)
+    
+    where_clause = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
+    return where_clause, params
+
+def list_etag():
+    """ETag of /list, the same in every worker for the same data; None when unknown"""
+    versions = table_versions.version(*LIST_TABLES)
+    if versions is None:
+        return None
+    return ref_cache.etag(*(table.snapshot() for table in LIST_REF_TABLES), live=versions)
+
 @router.get("/list", response_model=dict)
-async def list_approvisionnements(
+def list_approvisionnements(
+    request: Request,
+    response: Response,
     page: int = 1,
     per_page: int = 20,
     type_filter: str = None,
@@ -204,110 +305,142 @@ async def list_approvisionnements(
     date_to: str = None,
     mois: int = None,
     annee: int = None,
+    fields: str = None,
     current_user: dict = Depends(get_current_user)
 ):
-    """List all approvisionnements with filters and pagination - WITH JOINED DATA including marque and ncivil"""
+    """List all approvisionnements with filters and pagination - WITH JOINED DATA including marque and ncivil
+    
+    Items as objects, or columnar with ?format=columns / ?format=msgpack (or Accept)
+    fields: comma-separated item keys (e.g. id,date,qte,police), all by default
+    """
+    select, joins = LIST_FIELDS.build(fields)
+    fmt = list_format(request)
+    cached = conditional(request, response, list_etag(), fmt)
+    if cached:
+        return cached
+    
     with get_db() as conn:
-        cur = get_db_cursor(conn)
-        
-        # Build WHERE clauses
-        where_clauses = []
-        params = []
-        
-        if type_filter and type_filter != 'all':
-            where_clauses.append("a.type_approvi = %s")
-            params.append(type_filter)
-        
-        if date_from:
-            where_clauses.append("a.date >= %s")
-            params.append(date_from)
+        cur = get_tuple_cursor(conn)
         
-        if date_to:
-            where_clauses.append("a.date <= %s")
-            params.append(date_to)
-        
-        if mois and annee:
-            where_clauses.append("EXTRACT(MONTH FROM a.date) = %s AND EXTRACT(YEAR FROM a.date) = %s")
-            params.extend([mois, annee])
-        elif annee:
-            where_clauses.append("EXTRACT(YEAR FROM a.date) = %s")
-            params.append(annee)
-        
-        where_clause = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
+        where_clause, params = list_where(type_filter, date_from, date_to, mois, annee)
         
         # Count total
         count_query = f"""
             SELECT COUNT(*) as total 
             FROM approvisionnement a
-            LEFT JOIN dotation d ON a.dotation_id = d.id AND a.type_approvi = 'DOTATION'
             {where_clause}
         """
         cur.execute(count_query, params)
-        total = cur.fetchone()['total']
+        total = cur.fetchone()[0]
         
-        # Get paginated results WITH JOINS - including ncivil and marque
+        # Get paginated results, joining only the tables the fields need
         offset = (page - 1) * per_page
         list_query = f"""
-            SELECT 
-                a.id,
-                a.type_approvi,
-                a.date,
-                a.qte,
-                a.km_precedent,
-                a.km,
-                a.anomalie,
-                a.dotation_id,
-                a.vhc_provisoire,
-                a.km_provisoire,
-                a.matricule_conducteur,
-                a.service_affecte as service_externe,
-                a.destination as ville_origine,
-                a.ordre_mission,
-                a.observations,
-                a.numero_bon,
-                v.ncivil,
-                v.marque,
-                v.carburant,
-                v.police,
-                a.police_vehicule,
-                b.nom as benificiaire_nom,
-                s.nom as service_nom,
-                b.fonction,
-                s.direction
+            SELECT {select}
             FROM approvisionnement a
-            LEFT JOIN dotation d ON a.dotation_id = d.id
-            LEFT JOIN vehicule v ON d.vehicule_id = v.id
-            LEFT JOIN benificiaire b ON d.benificiaire_id = b.id
-            LEFT JOIN service s ON b.service_id = s.id
+            {joins}
             {where_clause}
             ORDER BY a.date DESC, a.id DESC
             LIMIT %s OFFSET %s
         """
         cur.execute(list_query, params + [per_page, offset])
         
-        results = cur.fetchall()
-        return {
-            "items": [dict(r) for r in results],
+        return list_response(fmt, {
+            "items": fetch_rows(cur),
             "page": page,
             "per_page": per_page,
             "total": total,
             "pages": (total + per_page - 1) // per_page if total > 0 else 0
-        }
+        }, response)
+
+# Columns of the Excel export (same as the export of the bons list in the SPA)
+EXPORT_COLUMNS = (
+    ("Date", 18), ("Type", 10), ("Véhicule", 12), ("Responsable", 20), ("Service", 15),
+    ("Quantité (L)", 12), ("KM Précédent", 12), ("KM Actuel", 12), ("Distance (km)", 12),
+    ("Véhicule Provisoire", 18), ("KM Provisoire", 12), ("Observations", 30)
+)
+EXPORT_BATCH = 2000
+
+@router.post("/export", status_code=202)
+async def export_approvisionnements(
+    type_filter: str = None,
+    date_from: str = None,
+    date_to: str = None,
+    mois: int = None,
+    annee: int = None,
+    search: str = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Excel export of the bons matching the /list filters (and `search`), built
+    in the background: 202 with the job id, file at /api/jobs/{id}/file"""
+    params = {"type_filter": type_filter, "date_from": date_from, "date_to": date_to,
+              "mois": mois, "annee": annee, "search": search}
+    job_id = await run_in_threadpool(
+        jobs.submit, "export_approvisionnement", {k: v for k, v in params.items() if v is not None}, current_user
+    )
+    return {"job_id": job_id, "status": "queued"}
+
+@jobs.task("export_approvisionnement")
+def export_job(job: jobs.Job, **filters):
+    where_clause, params = list_where(**filters)
+    
+    with get_db() as conn:
+        cur = get_tuple_cursor(conn)
+        cur.execute(f"""
+            SELECT COUNT(*)
+            FROM approvisionnement a
+            {LIST_FIELDS.joins_for(("v", "b", "s"))}
+            {where_clause}
+        """, params)
+        total = cur.fetchone()[0]
+        job.progress(0, f"{total} bon(s) à exporter")
+        
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet("Approvisionnements")
+        for index, (_, width) in enumerate(EXPORT_COLUMNS, start=1):
+            sheet.column_dimensions[get_column_letter(index)].width = width
+        sheet.append([name for name, _ in EXPORT_COLUMNS])
+        
+        # Server-side cursor: the rows are never all in memory
+        with conn.cursor(name="export_approvisionnement") as rows:
+            rows.itersize = EXPORT_BATCH
+            rows.execute(f"""
+                SELECT a.date, a.type_approvi, COALESCE(v.police, a.police_vehicule),
+                       COALESCE(b.nom, a.matricule_conducteur), COALESCE(s.nom, a.service_affecte),
+                       a.qte, a.km_precedent, a.km, a.km - a.km_precedent,
+                       a.vhc_provisoire, a.km_provisoire, a.observations
+                FROM approvisionnement a
+                {LIST_FIELDS.joins_for(("v", "b", "s"))}
+                {where_clause}
+                ORDER BY a.date DESC, a.id DESC
+            """, params)
+            written = 0
+            for row in rows:
+                sheet.append((row[0].strftime("%d/%m/%Y %H:%M") if row[0] else None,) + tuple(row[1:]))
+                written += 1
+                if written % EXPORT_BATCH == 0:
+                    job.progress(95 * written / max(total, 1), f"{written}/{total} bon(s)")
+        conn.rollback()
+    
+    job.progress(95, "Écriture du fichier")
+    workbook.save(job.result_path(f"approvisionnements_{datetime.now():%Y%m%d_%H%M%S}.xlsx"))
+    return {"rows": written, "message": f"{written} bon(s) exporté(s)"}
 
 @router.get("/dotation-list", response_model=List[dict])
-async def list_dotation_approvisionnements(
+def list_dotation_approvisionnements(
+    request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     """Get list of DOTATION approvisionnements"""
     with get_db() as conn:
-        cur = get_db_cursor(conn)
+        cur = get_tuple_cursor(conn)
         cur.execute("""
             SELECT 
                 a.id, a.type_approvi, a.date, a.qte, a.km_precedent, a.km,
                 v.police, v.ncivil, v.marque, v.carburant,
                 b.nom as benificiaire_nom, s.nom as service_nom
             FROM approvisionnement a
-            LEFT JOIN dotation d ON a.dotation_id = d.id
+            LEFT JOIN dotation_all d ON a.dotation_id = d.id
             LEFT JOIN vehicule v ON d.vehicule_id = v.id
             LEFT JOIN benificiaire b ON d.benificiaire_id = b.id
             LEFT JOIN service s ON b.service_id = s.id
@@ -315,16 +448,16 @@ async def list_dotation_approvisionnements(
             ORDER BY a.date DESC
             LIMIT 100
         """)
-        results = cur.fetchall()
-        return [dict(r) for r in results]
+        return list_response(list_format(request), fetch_rows(cur))
 
 @router.get("/mission-list", response_model=List[dict])
-async def list_mission_approvisionnements(
+def list_mission_approvisionnements(
+    request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     """Get list of MISSION approvisionnements"""
     with get_db() as conn:
-        cur = get_db_cursor(conn)
+        cur = get_tuple_cursor(conn)
         cur.execute("""
             SELECT 
                 id, type_approvi, date, qte, km_precedent, km,
@@ -335,8 +468,7 @@ async def list_mission_approvisionnements(
             ORDER BY date DESC
             LIMIT 100
         """)
-        results = cur.fetchall()
-        return [dict(r) for r in results]
+        return list_response(list_format(request), fetch_rows(cur))
 
 @router.delete("/{appro_id}", response_model=dict)
 async def delete_approvisionnement(
@@ -358,17 +490,19 @@ async def delete_approvisionnement(
         if not result:
             raise HTTPException(status_code=404, detail="Approvisionnement non trouvé")
         
+        table_versions.expect(cur, "approvisionnement")
         conn.commit()
         return {"success": True, "message": "Approvisionnement supprimé"}
 
 @router.get("/by-dotation/{dotation_id}", response_model=List[dict])
 async def get_approvisionnements_by_dotation(
     dotation_id: int,
+    request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     """Get all approvisionnements for a specific dotation"""
     with get_db() as conn:
-        cur = get_db_cursor(conn)
+        cur = get_tuple_cursor(conn)
         cur.execute("""
             SELECT 
                 a.id, a.type_approvi, a.date, a.qte, a.km_precedent, a.km,
@@ -377,15 +511,14 @@ async def get_approvisionnements_by_dotation(
                 b.nom as benificiaire_nom,
                 s.nom as service_nom
             FROM approvisionnement a
-            JOIN dotation d ON a.dotation_id = d.id
+            JOIN dotation_all d ON a.dotation_id = d.id
             JOIN vehicule v ON d.vehicule_id = v.id
             JOIN benificiaire b ON d.benificiaire_id = b.id
             JOIN service s ON b.service_id = s.id
             WHERE a.dotation_id = %s
             ORDER BY a.date DESC
         """, (dotation_id,))
-        results = cur.fetchall()
-        return [dict(r) for r in results]
+        return list_response(list_format(request), fetch_rows(cur))
 
 @router.get("/last-km/{police}")
 async def get_last_km_for_vehicle(
@@ -400,7 +533,7 @@ async def get_last_km_for_vehicle(
         cur.execute("""
             SELECT a.km
             FROM approvisionnement a
-            JOIN dotation d ON a.dotation_id = d.id
+            JOIN dotation_all d ON a.dotation_id = d.id
             JOIN vehicule v ON d.vehicule_id = v.id
             WHERE v.police = %s AND a.type_approvi = 'DOTATION'
             ORDER BY a.date DESC, a.id DESC
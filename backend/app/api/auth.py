@@ -1,37 +1,71 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Optional
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from app.schemas.schemas import Token, UserInfo, UserLogin
-from app.core.security import create_access_token, decode_access_token
+from app.core.security import create_access_token, decode_access_token, check_password_off_loop, PasswordCheckBusy
 from app.db.database import get_db, get_db_cursor
+from app.core.metrics import timed_auth
+from app.core.log import set_user
+from app.core import user_cache
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
+oauth2_scheme_optional = OAuth2PasswordBearer(tokenUrl="/api/auth/token", auto_error=False)
 
-def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
-    """Get current authenticated user from JWT token"""
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    
-    payload = decode_access_token(token)
-    if payload is None:
+# Scope of the short-lived tickets of the events stream (POST /api/events/ticket)
+STREAM_SCOPE = "stream"
+
+credentials_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+def user_from_token(token: str, scope: Optional[str] = None) -> dict:
+    """User of a JWT of the given scope (None: a regular access token)"""
+    with timed_auth():
+        payload = decode_access_token(token)
+    if payload is None or payload.get("scope") != scope:
         raise credentials_exception
     
     username: str = payload.get("sub")
     if username is None:
         raise credentials_exception
     
-    return {"username": username, "role": payload.get("role")}
+    # Current status and role, not the ones at login time
+    user = user_cache.get_user(username)
+    if user is None or user['statut'] != 'ACTIF':
+        raise credentials_exception
+    
+    set_user(username)
+    return {"username": username, "role": user['role']}
+
+def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
+    """Get current authenticated user from JWT token"""
+    return user_from_token(token)
+
+def get_stream_user(
+    token: Optional[str] = Depends(oauth2_scheme_optional),
+    access_token: Optional[str] = None
+) -> dict:
+    """get_current_user(), or a stream ticket as ?access_token= (EventSource
+    cannot set headers): never the access token itself, which the access
+    logs of uvicorn and the proxies would keep"""
+    if token:
+        return user_from_token(token)
+    return user_from_token(access_token or "", STREAM_SCOPE)
 
 @router.post("/login", response_model=Token)
 async def login(credentials: UserLogin):
     """Login endpoint - returns JWT token
     
-    IMPORTANT: v3.0 database uses PLAIN TEXT passwords!
-    This should be fixed in production by hashing passwords.
+    Passwords are checked with bcrypt in the password-hash pool. Plain text
+    passwords of the v3.0 database and $2y$ hashes are replaced by a $2b$
+    hash on the first successful login.
     """
     with get_db() as conn:
         cur = get_db_cursor(conn)
@@ -40,27 +74,39 @@ async def login(credentials: UserLogin):
             (credentials.username,)
         )
         user = cur.fetchone()
-        
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Nom d'utilisateur ou mot de passe incorrect"
-            )
-        
-        # IMPORTANT: Plain text password comparison (v3.0 database structure)
-        # TODO: In production, hash passwords and use verify_password()
-        if user['password'] != credentials.password:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Nom d'utilisateur ou mot de passe incorrect"
-            )
-        
-        # Create JWT access token
-        access_token = create_access_token(
-            data={"sub": user['username'], "role": user['role']}
+    
+    try:
+        ok, new_hash = await check_password_off_loop(credentials.password, user['password'] if user else None)
+    except PasswordCheckBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Trop de connexions simultanées, réessayez dans un instant",
+            headers={"Retry-After": "1"}
+        )
+    
+    if not user or not ok:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Nom d'utilisateur ou mot de passe incorrect"
         )
-        
-        return {"access_token": access_token, "token_type": "bearer"}
+    
+    if new_hash:
+        with get_db() as conn:
+            cur = get_db_cursor(conn)
+            # Only if unchanged since it was read
+            cur.execute(
+                "UPDATE users SET password = %s WHERE id_user = %s AND password = %s",
+                (new_hash, user['id_user'], user['password'])
+            )
+            conn.commit()
+        logger.info("Mot de passe migré vers bcrypt", extra={"username": user['username']})
+    
+    # Create JWT access token
+    access_token = create_access_token(
+        data={"sub": user['username'], "role": user['role']}
+    )
+    
+    return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
@@ -71,15 +117,8 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 @router.get("/me", response_model=UserInfo)
 async def get_user_info(current_user: dict = Depends(get_current_user)):
     """Get current user information"""
-    with get_db() as conn:
-        cur = get_db_cursor(conn)
-        cur.execute(
-            "SELECT id_user, username, role, statut FROM users WHERE username = %s",
-            (current_user['username'],)
-        )
-        user = cur.fetchone()
-        
-        if not user:
-            raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
-        
-        return user
\ No newline at end of file
+    user = user_cache.get_user(current_user['username'])
+    if not user:
+        raise HTTPException(status_code=404, detail="Utilisateur non trouvé")
+    
+    return user
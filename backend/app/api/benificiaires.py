@@ -1,33 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from typing import List
 from app.schemas.schemas import Benificiaire, BenificiaireCreate
 from app.db.database import get_db, get_db_cursor
 from app.api.auth import get_current_user
+from app.core import ref_cache
+from app.core.conditional import conditional
+from app.core.json_rows import Rows, list_format, list_response
+from app.utils.fields import requested_fields
 
 # redirect_slashes=False → accepts both /benificiaires and /benificiaires/
 router = APIRouter(prefix="/benificiaires", tags=["Benificiaires"], redirect_slashes=False)
 
+# ?fields= of the list
+LIST_FIELDS = ("id", "matricule", "nom", "fonction", "service_id", "service_nom", "direction")
+
 
 # ── GET list ──────────────────────────────────────────────────────────────────
-@router.get("")
-async def list_benificiaires(
-    page: int = 1,
-    per_page: int = 20,
-    search: str = None,
-    current_user: dict = Depends(get_current_user)
-):
+def paged_benificiaires(page: int, per_page: int, search: str = None):
+    """Page of the list and total, queried (cache disabled)"""
     with get_db() as conn:
         cur = get_db_cursor(conn)
 
-        base_query = """
-            SELECT
-                b.id, b.matricule, b.nom, b.fonction, b.service_id,
-                COALESCE(s.nom, 'N/A')       AS service_nom,
-                COALESCE(s.direction, 'N/A') AS direction
-            FROM benificiaire b
-            LEFT JOIN service s ON b.service_id = s.id
-        """
-
         where_clause = ""
         params = []
 
@@ -44,39 +37,93 @@ async def list_benificiaires(
             sp = f"%{search}%"
             params = [sp, sp, sp, sp, sp]
 
-        count_query = f"""
-            SELECT COUNT(*) FROM benificiaire b
+        cur.execute(f"""
+            SELECT COUNT(*) AS total FROM benificiaire b
             LEFT JOIN service s ON b.service_id = s.id
             {where_clause}
-        """
-        cur.execute(count_query, params)
-        row = cur.fetchone()
-        total = row[0] if isinstance(row, tuple) else row['count']
+        """, params)
+        total = cur.fetchone()['total']
 
         offset = (page - 1) * per_page
-        cur.execute(
-            f"{base_query} {where_clause} ORDER BY b.nom LIMIT %s OFFSET %s",
-            params + [per_page, offset]
-        )
-        results = cur.fetchall()
-
-        items = [{
-            'id':          r['id'],
-            'matricule':   r['matricule'],
-            'nom':         r['nom'],
-            'fonction':    r['fonction'],
-            'service_id':  r['service_id'],
-            'service_nom': r.get('service_nom', 'N/A'),
-            'direction':   r.get('direction',   'N/A'),
-        } for r in results]
-
-        return {
-            "items": items,
+        cur.execute(f"""
+            SELECT
+                b.id, b.matricule, b.nom, b.fonction, b.service_id,
+                COALESCE(s.nom, 'N/A')       AS service_nom,
+                COALESCE(s.direction, 'N/A') AS direction
+            FROM benificiaire b
+            LEFT JOIN service s ON b.service_id = s.id
+            {where_clause}
+            ORDER BY b.nom, b.id LIMIT %s OFFSET %s
+        """, params + [per_page, offset])
+        return [dict(r) for r in cur.fetchall()], total
+
+
+@router.get("")
+def list_benificiaires(
+    request: Request,
+    response: Response,
+    page: int = 1,
+    per_page: int = 20,
+    search: str = None,
+    fields: str = None,
+    current_user: dict = Depends(get_current_user)
+):
+    columns = requested_fields(fields, LIST_FIELDS)
+    fmt = list_format(request)
+    if not ref_cache.enabled():
+        items, total = paged_benificiaires(page, per_page, search)
+        return list_response(fmt, {
+            "items": Rows.from_records(items, columns),
             "page": page,
             "per_page": per_page,
             "total": total,
             "pages": (total + per_page - 1) // per_page if total > 0 else 0
-        }
+        }, response)
+
+    benificiaires = ref_cache.BENIFICIAIRES.snapshot()
+    services = ref_cache.SERVICES.snapshot()
+    cached = conditional(request, response, ref_cache.etag(benificiaires, services), fmt)
+    if cached:
+        return cached
+
+    # Rows are ordered by nom; LEFT JOIN service on the cached services
+    items = []
+    for b in benificiaires.rows:
+        s = services.by_id.get(b['service_id'])
+        items.append({
+            'id':          b['id'],
+            'matricule':   b['matricule'],
+            'nom':         b['nom'],
+            'fonction':    b['fonction'],
+            'service_id':  b['service_id'],
+            'service_nom': s['nom'] if s else None,
+            'direction':   s['direction'] if s else None,
+        })
+
+    if search:
+        match = ref_cache.ilike(search)
+        items = [
+            i for i in items
+            if match(i['nom']) or match(i['matricule']) or match(i['fonction'])
+            or match(i['service_nom']) or match(i['direction'])
+        ]
+
+    total = len(items)
+    offset = (page - 1) * per_page
+    items = items[offset:offset + per_page]
+    for i in items:
+        if i['service_nom'] is None:
+            i['service_nom'] = 'N/A'
+        if i['direction'] is None:
+            i['direction'] = 'N/A'
+
+    return list_response(fmt, {
+        "items": Rows.from_records(items, columns),
+        "page": page,
+        "per_page": per_page,
+        "total": total,
+        "pages": (total + per_page - 1) // per_page if total > 0 else 0
+    }, response)
 
 
 # ── POST create ───────────────────────────────────────────────────────────────
@@ -105,6 +152,7 @@ async def create_benificiaire(
 
             result = cur.fetchone()
             conn.commit()
+            ref_cache.BENIFICIAIRES.invalidate()
             return {"success": True, "message": "Bénéficiaire créé", "id": result['id']}
         except Exception as e:
             conn.rollback()
@@ -115,19 +163,33 @@ async def create_benificiaire(
 @router.get("/by-service/{service_id}")
 async def get_benificiaires_by_service(
     service_id: int,
+    request: Request,
+    response: Response,
     current_user: dict = Depends(get_current_user)
 ):
-    with get_db() as conn:
-        cur = get_db_cursor(conn)
-        cur.execute("""
-            SELECT b.*, COALESCE(s.nom,'') AS service_nom,
-                        COALESCE(s.direction,'') AS direction
-            FROM benificiaire b
-            LEFT JOIN service s ON b.service_id = s.id
-            WHERE b.service_id = %s
-            ORDER BY b.nom
-        """, (service_id,))
-        return [dict(r) for r in cur.fetchall()]
+    if not ref_cache.enabled():
+        with get_db() as conn:
+            cur = get_db_cursor(conn)
+            cur.execute("""
+                SELECT b.*, COALESCE(s.nom,'') AS service_nom,
+                            COALESCE(s.direction,'') AS direction
+                FROM benificiaire b
+                LEFT JOIN service s ON b.service_id = s.id
+                WHERE b.service_id = %s
+                ORDER BY b.nom, b.id
+            """, (service_id,))
+            return [dict(r) for r in cur.fetchall()]
+
+    benificiaires = ref_cache.BENIFICIAIRES.snapshot()
+    services = ref_cache.SERVICES.snapshot()
+    cached = conditional(request, response, ref_cache.etag(benificiaires, services))
+    if cached:
+        return cached
+    s = services.by_id.get(service_id)
+    return [
+        {**b, 'service_nom': s['nom'] if s else '', 'direction': s['direction'] if s else ''}
+        for b in benificiaires.rows if b['service_id'] == service_id
+    ]
 
 
 # ── GET single ────────────────────────────────────────────────────────────────
@@ -169,6 +231,7 @@ async def update_benificiaire(
             if not result:
                 raise HTTPException(status_code=404, detail="Bénéficiaire non trouvé")
             conn.commit()
+            ref_cache.BENIFICIAIRES.invalidate()
             return {"success": True, "message": "Bénéficiaire modifié"}
         except Exception as e:
             conn.rollback()
@@ -191,4 +254,5 @@ async def delete_benificiaire(
         if not result:
             raise HTTPException(status_code=404, detail="Bénéficiaire non trouvé")
         conn.commit()
+        ref_cache.BENIFICIAIRES.invalidate()
         return {"success": True, "message": "Bénéficiaire supprimé"}
\ No newline at end of file
@@ -1,11 +1,46 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
-from app.schemas.schemas import DotationCreate, DotationDetail
-from app.db.database import get_db, get_db_cursor
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from datetime import date
+from typing import List, Optional, Tuple
+from app.schemas.schemas import BulkFilter, DotationBulkQuota, DotationCreate, DotationDetail
+from app.db.database import get_db, get_db_cursor, get_tuple_cursor
 from app.api.auth import get_current_user
+from app.core.config import settings
+from app.core import jobs, ref_cache, scheduler
+from app.core.json_rows import Rows, fetch_rows, list_format, list_response
+from app.utils.bulk import dotation_filter
+from app.utils.fields import Projection, aliases
 
 router = APIRouter(prefix="/dotation", tags=["Dotation"])
 
+# ?fields= of /active and /archived; a join is also kept when the sort reads
+# its table
+LIST_FIELDS = Projection(
+    {
+        "id": "d.id",
+        "vehicule_id": "d.vehicule_id",
+        "police": "v.police",
+        "nCivil": "v.ncivil",
+        "marque": "v.marque",
+        "carburant": "v.carburant",
+        "benificiaire_nom": "b.nom",
+        "benificiaire_fonction": "b.fonction",
+        "service_nom": "s.nom",
+        "direction": "s.direction",
+        "mois": "d.mois",
+        "annee": "d.annee",
+        "qte": "d.qte",
+        "qte_consomme": "d.qte_consomme::float8",
+        "reste": "d.reste::float8",
+        "cloture": "d.cloture",
+    },
+    {
+        "v": ("JOIN vehicule v ON d.vehicule_id = v.id", None),
+        "b": ("JOIN benificiaire b ON d.benificiaire_id = b.id", None),
+        "s": ("JOIN service s ON b.service_id = s.id", "b"),
+    }
+)
+
 @router.post("/", response_model=dict)
 async def create_dotation(
     dotation: DotationCreate,
@@ -17,6 +52,14 @@ async def create_dotation(
     
     with get_db() as conn:
         cur = get_db_cursor(conn)
+        # The month may already be in the archive (also enforced by a trigger)
+        cur.execute("""
+            SELECT 1 FROM dotation_archive
+            WHERE vehicule_id = %s AND mois = %s AND annee = %s
+        """, (dotation.vehicule_id, dotation.mois, dotation.annee))
+        if cur.fetchone():
+            raise HTTPException(status_code=400, detail="Une dotation archivée existe déjà pour ce véhicule et ce mois")
+        
         try:
             cur.execute("""
                 INSERT INTO dotation (vehicule_id, benificiaire_id, mois, annee, qte)
@@ -35,36 +78,54 @@ async def create_dotation(
 async def get_available_vehicles(
     mois: int,
     annee: int,
+    request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     """Get vehicles without active dotation for given month/year"""
+    if not ref_cache.enabled():
+        with get_db() as conn:
+            cur = get_tuple_cursor(conn)
+            cur.execute("""
+                SELECT v.id, v.police, v.ncivil, v.marque, v.carburant
+                FROM vehicule v
+                WHERE v.actif = TRUE
+                AND NOT EXISTS (
+                    SELECT 1 FROM dotation d
+                    WHERE d.vehicule_id = v.id
+                    AND d.mois = %s
+                    AND d.annee = %s
+                    AND d.cloture = FALSE
+                )
+                ORDER BY v.police
+            """, (mois, annee))
+            return list_response(list_format(request), fetch_rows(cur))
+    
     with get_db() as conn:
         cur = get_db_cursor(conn)
         cur.execute("""
-            SELECT v.id, v.police, v.ncivil, v.marque, v.carburant
-            FROM vehicule v
-            WHERE v.actif = TRUE
-            AND NOT EXISTS (
-                SELECT 1 FROM dotation d
-                WHERE d.vehicule_id = v.id
-                AND d.mois = %s
-                AND d.annee = %s
-                AND d.cloture = FALSE
-            )
-            ORDER BY v.police
+            SELECT vehicule_id FROM dotation
+            WHERE mois = %s AND annee = %s AND cloture = FALSE
         """, (mois, annee))
-        results = cur.fetchall()
-        return [dict(r) for r in results]
+        taken = {r['vehicule_id'] for r in cur.fetchall()}
+    
+    # Vehicles from the reference cache, ordered by police
+    columns = ('id', 'police', 'ncivil', 'marque', 'carburant')
+    return list_response(list_format(request), Rows(columns, [
+        (v['id'], v['police'], v['ncivil'], v['marque'], v['carburant'])
+        for v in ref_cache.VEHICULES.snapshot().rows
+        if v['actif'] and v['id'] not in taken
+    ]))
 
 @router.get("/available-benificiaires", response_model=List[dict])
 async def get_available_benificiaires(
     mois: int,
     annee: int,
+    request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     """Get beneficiaires without active dotation for given month/year"""
     with get_db() as conn:
-        cur = get_db_cursor(conn)
+        cur = get_tuple_cursor(conn)
         cur.execute("""
             SELECT b.id, b.matricule, b.nom, b.fonction, b.service_id,
                    s.nom as service_nom, s.direction
@@ -79,171 +140,162 @@ async def get_available_benificiaires(
             )
             ORDER BY b.nom
         """, (mois, annee))
-        results = cur.fetchall()
-        return [dict(r) for r in results]
+        return list_response(list_format(request), fetch_rows(cur))
+
+# ORDER BY of ?sort= (d.id last: pages do not overlap on ties)
+LIST_SORTS = {
+    "service": "s.nom, v.police, d.id",
+    "police": "v.police, d.id",
+    "periode": "d.annee DESC, d.mois DESC, s.nom, v.police, d.id",
+    "reste": "d.reste, d.id",
+    "consommation": "d.qte_consomme DESC, d.id",
+}
+
+
+def list_filters(
+    mois: Optional[int] = Query(None, ge=1, le=12),
+    annee: Optional[int] = Query(None, ge=2020),
+    direction: Optional[str] = None,
+    service_id: Optional[int] = None,
+    carburant: Optional[str] = None,
+    benificiaire_id: Optional[int] = None,
+    conso_min: Optional[float] = Query(None, ge=0),
+    conso_max: Optional[float] = Query(None, ge=0),
+    search: Optional[str] = None
+) -> Tuple[List[str], list]:
+    """Conditions of the list filters on `dotation d`: vehicle, beneficiary
+    and service through subqueries (as the bulk operations), so counting
+    joins nothing and the reference tables are matched once
+    
+    conso_min / conso_max: consumed share of the quota, in %
+    """
+    clauses, params = dotation_filter(
+        BulkFilter(mois=mois, annee=annee, service_id=service_id, direction=direction, carburant=carburant)
+    )
+    
+    if benificiaire_id:
+        clauses.append("d.benificiaire_id = %s")
+        params.append(benificiaire_id)
+    
+    # Without dividing: qte may be 0
+    if conso_min is not None:
+        clauses.append("d.qte_consomme * 100 >= %s * d.qte")
+        params.append(conso_min)
+    
+    if conso_max is not None:
+        clauses.append("d.qte_consomme * 100 <= %s * d.qte")
+        params.append(conso_max)
+    
+    if search:
+        clauses.append("""(
+            d.vehicule_id IN (SELECT v.id FROM vehicule v WHERE v.police ILIKE %s OR v.marque ILIKE %s)
+            OR d.benificiaire_id IN (
+                SELECT b.id FROM benificiaire b
+                JOIN service s ON s.id = b.service_id
+                WHERE b.nom ILIKE %s OR s.nom ILIKE %s OR s.direction ILIKE %s
+            )
+        )""")
+        params.extend([f"%{search}%"] * 5)
+    
+    return clauses, params
+
+
+def list_dotations(request: Request, table: str, cloture: bool, where: Tuple[List[str], list],
+                   sort: str, page: int, per_page: int, fields: Optional[str]):
+    """Page of the dotations of `table` (dotation or dotation_all) matching
+    the filters, with the total and the quota sums of all matching rows.
+    
+    One statement: the totals CTE reads `table` alone and the page query
+    joins only the tables the fields and the sort read, so an indexed sort
+    (periode, police) stops after the page.
+    """
+    if sort not in LIST_SORTS:
+        raise HTTPException(status_code=400, detail=f"Tri inconnu: {sort} ({', '.join(LIST_SORTS)})")
+    clauses, params = where
+    clauses = ["d.cloture = %s"] + clauses
+    params = [cloture] + params
+    where_clause = " AND ".join(clauses)
+    select, joins = LIST_FIELDS.build(fields, needed=aliases(LIST_SORTS[sort]))
+    totals_query = f"""
+        SELECT
+            COUNT(*) AS total,
+            COALESCE(SUM(d.qte), 0) AS sum_qte,
+            COALESCE(SUM(d.qte_consomme), 0)::float8 AS sum_consomme,
+            COALESCE(SUM(d.reste), 0)::float8 AS sum_reste
+        FROM {table} d
+        WHERE {where_clause}
+    """
+    offset = (page - 1) * per_page
+    
+    with get_db() as conn:
+        cur = get_tuple_cursor(conn)
+        cur.execute(f"""
+            WITH totals AS ({totals_query})
+            SELECT {select}, t.*
+            FROM {table} d
+            {joins}
+            CROSS JOIN totals t
+            WHERE {where_clause}
+            ORDER BY {LIST_SORTS[sort]}
+            LIMIT %s OFFSET %s
+        """, params + params + [per_page, offset])
+        rows = cur.fetchall()
+        n = len(cur.description) - 4
+        columns = [column.name for column in cur.description[:n]]
+        
+        if rows:
+            total, sum_qte, sum_consomme, sum_reste = rows[0][n:]
+        else:
+            # Empty page: no row carries the totals
+            cur.execute(totals_query, params)
+            total, sum_qte, sum_consomme, sum_reste = cur.fetchone()
+    
+    return list_response(list_format(request), {
+        "items": Rows(columns, [row[:n] for row in rows]),
+        "page": page,
+        "per_page": per_page,
+        "total": total,
+        "pages": (total + per_page - 1) // per_page if total > 0 else 0,
+        "sums": {"qte": sum_qte, "qte_consomme": sum_consomme, "reste": sum_reste}
+    })
 
 @router.get("/active", response_model=dict)
 async def get_active_dotations(
+    request: Request,
     page: int = 1,
     per_page: int = 10,
-    search: str = None,
+    sort: str = "service",
+    fields: str = None,
+    where: tuple = Depends(list_filters),
     current_user: dict = Depends(get_current_user)
 ):
-    """Get all active (non-closed) dotations with pagination and search"""
-    with get_db() as conn:
-        cur = get_db_cursor(conn)
-        
-        # Build base query
-        base_query = """
-            SELECT 
-                d.id, d.vehicule_id, v.police, v.nCivil, v.marque, v.carburant,
-                b.nom AS benificiaire_nom, b.fonction AS benificiaire_fonction,
-                s.nom AS service_nom, s.direction, d.mois, d.annee,
-                d.qte, d.qte_consomme, d.reste, d.cloture
-            FROM dotation d
-            JOIN vehicule v ON d.vehicule_id = v.id
-            JOIN benificiaire b ON d.benificiaire_id = b.id
-            JOIN service s ON b.service_id = s.id
-            WHERE d.cloture = FALSE
-        """
-        
-        params = []
-        if search:
-            base_query += """ AND (
-                v.police ILIKE %s OR 
-                b.nom ILIKE %s OR 
-                s.nom ILIKE %s
-            )"""
-            search_param = f"%{search}%"
-            params = [search_param, search_param, search_param]
-        
-        # Get total count - corrected for dict cursor
-        count_query = "SELECT COUNT(*) as total FROM dotation WHERE cloture = FALSE"
-        
-        if search:
-            count_query += """ AND (
-                EXISTS (SELECT 1 FROM vehicule v WHERE v.id = dotation.vehicule_id AND v.police ILIKE %s) OR
-                EXISTS (SELECT 1 FROM benificiaire b WHERE b.id = dotation.benificiaire_id AND b.nom ILIKE %s) OR
-                EXISTS (SELECT 1 FROM benificiaire b JOIN service s ON b.service_id = s.id WHERE b.id = dotation.benificiaire_id AND s.nom ILIKE %s)
-            )"""
-            cur.execute(count_query, [search_param, search_param, search_param])
-        else:
-            cur.execute(count_query)
-        
-        result = cur.fetchone()
-        total = result['total'] if result else 0
-        
-        # Get paginated results
-        offset = (page - 1) * per_page
-        list_query = base_query + " ORDER BY s.nom, v.police LIMIT %s OFFSET %s"
-        cur.execute(list_query, params + [per_page, offset])
-        results = cur.fetchall()
-        
-        return {
-            "items": [{
-                "id": row['id'],
-                "vehicule_id": row['vehicule_id'],
-                "police": row['police'],
-                "nCivil": row['ncivil'],
-                "marque": row['marque'],
-                "carburant": row['carburant'],
-                "benificiaire_nom": row['benificiaire_nom'],
-                "benificiaire_fonction": row['benificiaire_fonction'],
-                "service_nom": row['service_nom'],
-                "direction": row['direction'],
-                "mois": row['mois'],
-                "annee": row['annee'],
-                "qte": row['qte'],
-                "qte_consomme": float(row['qte_consomme']),
-                "reste": float(row['reste']),
-                "cloture": row['cloture']
-            } for row in results],
-            "page": page,
-            "per_page": per_page,
-            "total": total,
-            "pages": (total + per_page - 1) // per_page if total > 0 else 0
-        }
+    """Get active (non-closed) dotations, a page at a time
+    
+    Filters: mois, annee, direction, service_id, carburant, benificiaire_id,
+    conso_min / conso_max (consumed %), search (police, marque, bénéficiaire,
+    service, direction). sort: service (default), police, periode, reste,
+    consommation. sums: quota, consumed and remaining of all matching rows.
+    fields: comma-separated item keys (e.g. id,police,reste), all by default
+    """
+    return list_dotations(request, "dotation", False, where, sort, page, per_page, fields)
 
 @router.get("/archived", response_model=dict)
-async def get_archived_dotations(
+def get_archived_dotations(
+    request: Request,
     page: int = 1,
     per_page: int = 10,
-    search: str = None,
+    sort: str = "periode",
+    fields: str = None,
+    where: tuple = Depends(list_filters),
     current_user: dict = Depends(get_current_user)
 ):
-    """Get all archived (closed) dotations with pagination"""
-    with get_db() as conn:
-        cur = get_db_cursor(conn)
-        
-        base_query = """
-            SELECT 
-                d.id, d.vehicule_id, v.police, v.nCivil, v.marque, v.carburant,
-                b.nom AS benificiaire_nom, b.fonction AS benificiaire_fonction,
-                s.nom AS service_nom, s.direction, d.mois, d.annee,
-                d.qte, d.qte_consomme, d.reste, d.cloture
-            FROM dotation d
-            JOIN vehicule v ON d.vehicule_id = v.id
-            JOIN benificiaire b ON d.benificiaire_id = b.id
-            JOIN service s ON b.service_id = s.id
-            WHERE d.cloture = TRUE
-        """
-        
-        params = []
-        if search:
-            base_query += """ AND (
-                v.police ILIKE %s OR 
-                b.nom ILIKE %s OR 
-                s.nom ILIKE %s
-            )"""
-            search_param = f"%{search}%"
-            params = [search_param, search_param, search_param]
-        
-        # Count - corrected for dict cursor
-        count_query = "SELECT COUNT(*) as total FROM dotation WHERE cloture = TRUE"
-        
-        if search:
-            count_query += """ AND (
-                EXISTS (SELECT 1 FROM vehicule v WHERE v.id = dotation.vehicule_id AND v.police ILIKE %s) OR
-                EXISTS (SELECT 1 FROM benificiaire b WHERE b.id = dotation.benificiaire_id AND b.nom ILIKE %s) OR
-                EXISTS (SELECT 1 FROM benificiaire b JOIN service s ON b.service_id = s.id WHERE b.id = dotation.benificiaire_id AND s.nom ILIKE %s)
-            )"""
-            cur.execute(count_query, [search_param, search_param, search_param])
-        else:
-            cur.execute(count_query)
-        
-        result = cur.fetchone()
-        total = result['total'] if result else 0
-        
-        # Paginated results
-        offset = (page - 1) * per_page
-        list_query = base_query + " ORDER BY d.annee DESC, d.mois DESC, s.nom, v.police LIMIT %s OFFSET %s"
-        cur.execute(list_query, params + [per_page, offset])
-        results = cur.fetchall()
-        
-        return {
-            "items": [{
-                "id": row['id'],
-                "vehicule_id": row['vehicule_id'],
-                "police": row['police'],
-                "nCivil": row['ncivil'],
-                "marque": row['marque'],
-                "carburant": row['carburant'],
-                "benificiaire_nom": row['benificiaire_nom'],
-                "benificiaire_fonction": row['benificiaire_fonction'],
-                "service_nom": row['service_nom'],
-                "direction": row['direction'],
-                "mois": row['mois'],
-                "annee": row['annee'],
-                "qte": row['qte'],
-                "qte_consomme": float(row['qte_consomme']),
-                "reste": float(row['reste']),
-                "cloture": row['cloture']
-            } for row in results],
-            "page": page,
-            "per_page": per_page,
-            "total": total,
-            "pages": (total + per_page - 1) // per_page if total > 0 else 0
-        }
+    """Get archived (closed) dotations, a page at a time
+
+    Reads both closed rows still in `dotation` and rows moved to
+    `dotation_archive` (through the `dotation_all` view).
+    Filters, sort and fields as /active; sort: periode by default.
+    """
+    return list_dotations(request, "dotation_all", True, where, sort, page, per_page, fields)
 
 @router.delete("/{dotation_id}")
 async def delete_dotation(
@@ -277,6 +329,14 @@ async def update_dotation(
     
     with get_db() as conn:
         cur = get_db_cursor(conn)
+        # A quota under the quantity already consumed would leave a negative reste
+        cur.execute("SELECT qte_consomme FROM dotation WHERE id = %s FOR UPDATE", (dotation_id,))
+        current = cur.fetchone()
+        if not current:
+            raise HTTPException(status_code=404, detail="Dotation non trouvée")
+        if dotation.qte < current['qte_consomme']:
+            raise HTTPException(status_code=400, detail="Le quota ne peut pas être inférieur à la quantité consommée")
+        
         try:
             cur.execute("""
                 UPDATE dotation 
@@ -318,4 +378,173 @@ async def close_dotation(
             raise HTTPException(status_code=404, detail="Dotation non trouvée")
         
         conn.commit()
-        return {"success": True, "message": "Dotation clôturée"}
\ No newline at end of file
+        return {"success": True, "message": "Dotation clôturée"}
+
+@router.post("/archive", response_model=dict)
+async def archive_dotations(
+    older_than_months: int = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Move closed dotations older than N months to the archive table (admin only)"""
+    if current_user['role'] != 'ADMIN':
+        raise HTTPException(status_code=403, detail="Accès administrateur requis")
+    
+    if older_than_months is None:
+        older_than_months = settings.DOTATION_ARCHIVE_AFTER_MONTHS
+    if older_than_months < 1:
+        raise HTTPException(status_code=400, detail="older_than_months doit être >= 1")
+    
+    try:
+        archived = await run_in_threadpool(archive_closed, older_than_months)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "success": True,
+        "message": f"{archived} dotation(s) archivée(s)",
+        "archived": archived
+    }
+
+@jobs.task("archive_dotations", maintenance=True)
+def archive_job(job: jobs.Job, older_than_months: int = None):
+    archived = archive_closed(older_than_months or settings.DOTATION_ARCHIVE_AFTER_MONTHS)
+    return {"archived": archived, "message": f"{archived} dotation(s) archivée(s)"}
+
+@scheduler.scheduled("archive_dotations", "0 3 2 * *")
+def monthly_archive():
+    archived = archive_closed(settings.DOTATION_ARCHIVE_AFTER_MONTHS)
+    return {"archived": archived}
+
+@scheduler.scheduled("close_previous_months", "5 0 1 * *")
+def close_previous_months():
+    """On the 1st, dotations of past months still open although their vehicle
+    already has the dotation of a later month are closed. A vehicle not
+    rolled over yet keeps its open dotation (the pump search needs it, the
+    rollover starts from it) until the new one is inserted"""
+    today = date.today()
+    with get_db() as conn:
+        cur = get_db_cursor(conn)
+        cur.execute("""
+            UPDATE dotation d SET cloture = TRUE
+            WHERE d.cloture = FALSE AND (d.annee, d.mois) < (%s, %s)
+              AND EXISTS (
+                  SELECT 1 FROM dotation n
+                  WHERE n.vehicule_id = d.vehicule_id
+                    AND (n.annee, n.mois) > (d.annee, d.mois)
+              )
+        """, (today.year, today.month))
+        closed = cur.rowcount
+        conn.commit()
+    return {"closed": closed}
+
+def archive_closed(older_than_months: int) -> int:
+    """archive_closed_dotations() in its own transaction; the count archived"""
+    with get_db() as conn:
+        cur = get_db_cursor(conn)
+        cur.execute("SELECT archive_closed_dotations(%s) AS archived", (older_than_months,))
+        archived = cur.fetchone()['archived']
+        conn.commit()
+        return archived
+
+def run_bulk_update(cur, set_clause: str, set_params: list, where_clauses: list, where_params: list, dry_run: bool):
+    """Apply one UPDATE to every matching dotation, or only count them"""
+    where_sql = " AND ".join(where_clauses)
+    
+    if dry_run:
+        cur.execute(f"SELECT COUNT(*) AS total FROM dotation d WHERE {where_sql}", where_params)
+        count = cur.fetchone()['total']
+        return {"success": True, "dry_run": True, "count": count, "message": f"{count} dotation(s) concernée(s)"}
+    
+    cur.execute(f"""
+        UPDATE dotation d
+        SET {set_clause}
+        WHERE {where_sql}
+        RETURNING d.id
+    """, set_params + where_params)
+    ids = sorted(row['id'] for row in cur.fetchall())
+    return {"success": True, "dry_run": False, "count": len(ids), "ids": ids}
+
+@router.post("/bulk/close", response_model=dict)
+def bulk_close_dotations(
+    bulk: BulkFilter,
+    current_user: dict = Depends(get_current_user)
+):
+    """Close every open dotation matching the filter (admin only)"""
+    if current_user['role'] != 'ADMIN':
+        raise HTTPException(status_code=403, detail="Accès administrateur requis")
+    
+    where_clauses, where_params = dotation_filter(bulk)
+    if not where_clauses:
+        raise HTTPException(status_code=400, detail="Au moins un critère de filtre est requis")
+    where_clauses.append("d.cloture = FALSE")
+    
+    with get_db() as conn:
+        cur = get_db_cursor(conn)
+        try:
+            result = run_bulk_update(cur, "cloture = TRUE", [], where_clauses, where_params, bulk.dry_run)
+            conn.commit()
+            if not bulk.dry_run:
+                result["message"] = f"{result['count']} dotation(s) clôturée(s)"
+            return result
+        except Exception as e:
+            conn.rollback()
+            raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/bulk/quota", response_model=dict)
+def bulk_update_quota(
+    bulk: DotationBulkQuota,
+    current_user: dict = Depends(get_current_user)
+):
+    """Set or adjust the quota of every open dotation matching the filter (admin only)"""
+    if current_user['role'] != 'ADMIN':
+        raise HTTPException(status_code=403, detail="Accès administrateur requis")
+    
+    if (bulk.qte is None) == (bulk.increment is None):
+        raise HTTPException(status_code=400, detail="Indiquer soit qte, soit increment")
+    
+    where_clauses, where_params = dotation_filter(bulk)
+    if not where_clauses:
+        raise HTTPException(status_code=400, detail="Au moins un critère de filtre est requis")
+    where_clauses.append("d.cloture = FALSE")
+    
+    if bulk.qte is not None:
+        new_qte, new_params = "%s", [bulk.qte]
+    else:
+        # A quota never drops to 0 or below
+        new_qte, new_params = "d.qte + %s", [bulk.increment]
+        where_clauses.append("d.qte + %s > 0")
+        where_params.append(bulk.increment)
+    
+    with get_db() as conn:
+        cur = get_db_cursor(conn)
+        try:
+            # A quota under the quantity already consumed would leave a
+            # negative reste: those dotations are left unchanged and reported.
+            # Every matching row is locked once, so a bon cannot raise its
+            # qte_consomme before the UPDATE (a preview locks nothing)
+            cur.execute(f"""
+                SELECT d.id, d.qte_consomme > {new_qte} AS rejected
+                FROM dotation d
+                WHERE {" AND ".join(where_clauses)}
+                ORDER BY d.id
+                {"" if bulk.dry_run else "FOR UPDATE"}
+            """, new_params + where_params)
+            rows = cur.fetchall()
+            rejected = [row['id'] for row in rows if row['rejected']]
+            accepted = [row['id'] for row in rows if not row['rejected']]
+            
+            if bulk.dry_run:
+                count = len(accepted)
+                result = {"success": True, "dry_run": True, "count": count, "message": f"{count} dotation(s) concernée(s)"}
+            else:
+                result = run_bulk_update(
+                    cur, f"qte = {new_qte}", new_params, ["d.id = ANY(%s)"], [accepted], False
+                )
+                result["message"] = f"Quota modifié pour {result['count']} dotation(s)"
+            conn.commit()
+            result["rejected"] = rejected
+            if rejected:
+                result["message"] += f", {len(rejected)} ignorée(s) : quota inférieur à la quantité consommée"
+            return result
+        except Exception as e:
+            conn.rollback()
+            raise HTTPException(status_code=400, detail=str(e))
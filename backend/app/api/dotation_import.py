@@ -1,12 +1,22 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request
-from typing import List, Dict, Any
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from typing import List, Dict, Any, Optional
 import openpyxl
 from io import BytesIO
+import logging
 from app.db.database import get_db, get_db_cursor
 from app.api.auth import get_current_user
+from app.core.log import RowSampler
+from app.core import jobs, ref_cache
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/dotation/import-excel", tags=["Dotation Import"])
 
+# Progress of background imports (jobs) reported every PROGRESS_ROWS rows
+PROGRESS_ROWS = 50
+
 
 def normalize_carburant(value: str) -> str:
     """Normalize carburant value to 'gazoil' or 'essence'"""
@@ -21,7 +31,7 @@ def normalize_carburant(value: str) -> str:
 
 
 @router.post("/analyze")
-async def analyze_excel(
+def analyze_excel(
     file: UploadFile = File(...),
     current_user: dict = Depends(get_current_user)
 ):
@@ -37,13 +47,14 @@ async def analyze_excel(
     - NOM ET PRENOM DU BENEFICIAIRE (required)
     - QTE (required)
     - QUALITE (required - fonction)
+    Plain def: parsing and matching run in the threadpool, off the event loop.
     """
     if current_user['role'] != 'ADMIN':
         raise HTTPException(status_code=403, detail="Accès administrateur requis")
     
     try:
         # Read Excel file
-        contents = await file.read()
+        contents = file.file.read()
         wb = openpyxl.load_workbook(BytesIO(contents))
         ws = wb.active
         
@@ -92,6 +103,7 @@ async def analyze_excel(
         
         # Parse rows
         rows_data = []
+        sampler = RowSampler(logger)
         with get_db() as conn:
             cur = get_db_cursor(conn)
             
@@ -118,6 +130,9 @@ async def analyze_excel(
                 if not all([police, service_name, nom, qte, fonction]):
                     continue
                 
+                # Per-row debug output for a sample of the rows only
+                debug = sampler.next()
+                
                 # Validate
                 errors = []
                 warnings = []
@@ -160,7 +175,8 @@ async def analyze_excel(
                         )
                         service = cur.fetchone()
                         if service:
-                            print(f"  → Service trouvé avec partie: '{service_name}' -> '{part}'")
+                            if debug:
+                                logger.debug("Service trouvé avec partie: '%s' -> '%s'", service_name, part, extra={"row": row_idx})
                             break
                 
                 # If still not found, try partial match
@@ -170,11 +186,11 @@ async def analyze_excel(
                         (f'%{service_name}%', f'%{service_name}%')
                     )
                     service = cur.fetchone()
-                    if service:
-                        print(f"  → Service trouvé avec recherche partielle: '{service_name}'")
+                    if service and debug:
+                        logger.debug("Service trouvé avec recherche partielle: '%s'", service_name, extra={"row": row_idx})
                 
-                if not service:
-                    print(f"  ✗ Service introuvable: '{service_name}'")
+                if not service and debug:
+                    logger.debug("Service introuvable: '%s'", service_name, extra={"row": row_idx})
                 
                 service_id = service['id'] if service else None
                 service_status = "exists" if service else "not_found"
@@ -188,9 +204,8 @@ async def analyze_excel(
                 nom_search = nom_clean
                 
                 # DEBUG: Show exact bytes
-                print(f"  → Recherche bénéficiaire:")
-                print(f"     Excel: '{nom}' (len={len(nom)})")
-                print(f"     Bytes: {nom.encode('utf-8')}")
+                if debug:
+                    logger.debug("Recherche bénéficiaire '%s'", nom, extra={"row": row_idx, "bytes": repr(nom.encode('utf-8'))})
                 
                 # Remove common prefixes
                 for prefix in ['MR ', 'MME ', 'M. ', 'MME. ', 'MONSIEUR ', 'MADAME ']:
@@ -203,11 +218,11 @@ async def analyze_excel(
                 benef = cur.fetchone()
                 
                 if benef:
-                    print(f"     ✓ Trouvé (exact): '{benef['nom']}'")
-                    print(f"     DB Bytes: {benef['nom'].encode('utf-8')}")
+                    if debug:
+                        logger.debug("Bénéficiaire trouvé (exact): '%s'", benef['nom'], extra={"row": row_idx, "bytes": repr(benef['nom'].encode('utf-8'))})
                 else:
                     # Show what's in DB that starts with first 3 chars
-                    if len(nom_search) >= 3:
+                    if debug and len(nom_search) >= 3:
                         search_start = nom_search[:3]
                         cur.execute("""
                             SELECT id, nom
@@ -217,27 +232,27 @@ async def analyze_excel(
                         """, (f'{search_start}%',))
                         similar = cur.fetchall()
                         if similar:
-                            print(f"     ℹ Bénéficiaires commençant par '{search_start}':")
-                            for s in similar:
-                                print(f"       - DB: '{s['nom']}' (len={len(s['nom'])})")
-                                print(f"         Bytes: {s['nom'].encode('utf-8')}")
+                            logger.debug(
+                                "Bénéficiaires commençant par '%s'", search_start,
+                                extra={"row": row_idx, "similar": [repr(s['nom'].encode('utf-8')) for s in similar]}
+                            )
                 
                 # If not found, try without MR/MME
                 if not benef and nom_search != nom:
                     cur.execute("SELECT id, nom FROM benificiaire WHERE nom ILIKE %s", (nom_search,))
                     benef = cur.fetchone()
-                    if benef:
-                        print(f"     ✓ Trouvé (sans préfixe): '{benef['nom']}'")
+                    if benef and debug:
+                        logger.debug("Bénéficiaire trouvé (sans préfixe): '%s'", benef['nom'], extra={"row": row_idx})
                 
                 # If still not found, try partial match (contains)
                 if not benef:
                     cur.execute("SELECT id, nom FROM benificiaire WHERE nom ILIKE %s", (f'%{nom_search}%',))
                     benef = cur.fetchone()
-                    if benef:
-                        print(f"     ✓ Trouvé (partiel): '{benef['nom']}'")
+                    if benef and debug:
+                        logger.debug("Bénéficiaire trouvé (partiel): '%s'", benef['nom'], extra={"row": row_idx})
                 
-                if not benef:
-                    print(f"     ✗ AUCUN bénéficiaire trouvé pour '{nom}'")
+                if not benef and debug:
+                    logger.debug("Aucun bénéficiaire trouvé pour '%s'", nom, extra={"row": row_idx})
                 
                 benef_id = None
                 benef_status = "exists"
@@ -302,11 +317,14 @@ async def execute_import(
     request: Request,
     mois: int,
     annee: int,
+    background: bool = False,
     current_user: dict = Depends(get_current_user)
 ):
     """
     Execute the import based on analyzed rows.
     Body: { rows: [...] } - Array of validated row objects from analyze endpoint
+    background=true: queued as a job (202 with its id, see /api/jobs/{id});
+    the job's result is this endpoint's response.
     """
     if current_user['role'] != 'ADMIN':
         raise HTTPException(status_code=403, detail="Accès administrateur requis")
@@ -322,26 +340,50 @@ async def execute_import(
         if not isinstance(rows, list):
             raise HTTPException(status_code=400, detail="Format de données invalide")
         
-        print(f"[IMPORT] Début import: {len(rows)} ligne(s), mois={mois}, annee={annee}")
+        logger.info("Début import", extra={"rows": len(rows), "mois": mois, "annee": annee, "background": background})
             
     except Exception as e:
-        print(f"[IMPORT ERROR] Erreur parsing body: {str(e)}")
+        logger.warning("Erreur parsing body: %s", e)
         raise HTTPException(status_code=400, detail=f"Erreur parsing body: {str(e)}")
     
+    if background:
+        job_id = await run_in_threadpool(
+            jobs.submit, "dotation_import", {"rows": rows, "mois": mois, "annee": annee}, current_user
+        )
+        return JSONResponse(status_code=202, content={"job_id": job_id, "status": "queued"})
+    
+    return await run_in_threadpool(import_rows, rows, mois, annee)
+
+
+@jobs.task("dotation_import", max_attempts=1)
+def import_job(job: jobs.Job, rows: List[dict], mois: int, annee: int):
+    """Background /execute: not retried, a failed import is fixed and resubmitted"""
+    return import_rows(rows, mois, annee, job)
+
+
+def import_rows(rows: List[dict], mois: int, annee: int, job: Optional[jobs.Job] = None) -> Dict[str, Any]:
+    """Create the vehicles, beneficiaires and dotations of the analyzed rows,
+    all or nothing; job: reports the progress every PROGRESS_ROWS rows"""
     created_vehicles = 0
     created_benefs = 0
     created_dotations = 0
     errors = []
     warnings = []
     
+    sampler = RowSampler(logger)
     with get_db() as conn:
         cur = get_db_cursor(conn)
         
-        for row in rows:
+        for index, row in enumerate(rows):
+            if job is not None and index % PROGRESS_ROWS == 0:
+                job.progress(100 * index / len(rows), f"Ligne {index}/{len(rows)}")
+            
             if not row['valid']:
                 continue
             
-            print(f"[IMPORT] Traitement ligne {row['row_number']}: police={row['police']}, nom={row['nom']}")
+            debug = sampler.next()
+            if debug:
+                logger.debug("Traitement ligne", extra={"row": row['row_number'], "police": row['police'], "nom": row['nom']})
             
             try:
                 vehicle_id = row['vehicle_id']
@@ -350,7 +392,6 @@ async def execute_import(
                 # Create vehicle if needed
                 if row['vehicle_status'] == 'create':
                     try:
-                        print(f"  → Création véhicule {row['police']}")
                         cur.execute("""
                             INSERT INTO vehicule (police, ncivil, marque, carburant, km, actif)
                             VALUES (%s, %s, %s, %s, %s, TRUE)
@@ -358,9 +399,10 @@ async def execute_import(
                         """, (row['police'], row['civil'], row['marque'], row['carburant'], row['km']))
                         vehicle_id = cur.fetchone()['id']
                         created_vehicles += 1
-                        print(f"  ✓ Véhicule créé: id={vehicle_id}")
+                        if debug:
+                            logger.debug("Véhicule créé", extra={"row": row['row_number'], "vehicule_id": vehicle_id})
                     except Exception as e:
-                        print(f"  ✗ Erreur création véhicule: {str(e)}")
+                        logger.warning("Erreur création véhicule: %s", e, extra={"row": row['row_number'], "police": row['police']})
                         errors.append({
                             'row': row['row_number'],
                             'message': f"Erreur création véhicule {row['police']}: {str(e)}"
@@ -370,7 +412,6 @@ async def execute_import(
                 # Create beneficiaire if needed
                 if row['benef_status'] == 'create':
                     try:
-                        print(f"  → Création bénéficiaire {row['nom']}")
                         # Auto-generate matricule
                         cur.execute("SELECT COUNT(*) as cnt FROM benificiaire")
                         cnt = cur.fetchone()['cnt']
@@ -383,24 +424,26 @@ async def execute_import(
                         """, (matricule, row['nom'], row['fonction'], row['service_id']))
                         benef_id = cur.fetchone()['id']
                         created_benefs += 1
-                        print(f"  ✓ Bénéficiaire créé: id={benef_id}")
+                        if debug:
+                            logger.debug("Bénéficiaire créé", extra={"row": row['row_number'], "benificiaire_id": benef_id})
                     except Exception as e:
-                        print(f"  ✗ Erreur création bénéficiaire: {str(e)}")
+                        logger.warning("Erreur création bénéficiaire: %s", e, extra={"row": row['row_number'], "nom": row['nom']})
                         errors.append({
                             'row': row['row_number'],
                             'message': f"Erreur création bénéficiaire {row['nom']}: {str(e)}"
                         })
                         continue
                 
-                # Check if dotation already exists
+                # Check if dotation already exists (archived months included)
                 cur.execute("""
-                    SELECT id FROM dotation 
+                    SELECT id FROM dotation_all 
                     WHERE vehicule_id=%s AND mois=%s AND annee=%s
                 """, (vehicle_id, mois, annee))
                 existing = cur.fetchone()
                 
                 if existing:
-                    print(f"  ⚠ Dotation existe déjà")
+                    if debug:
+                        logger.debug("Dotation existe déjà", extra={"row": row['row_number'], "police": row['police']})
                     warnings.append({
                         'row': row['row_number'],
                         'message': f"Dotation existe déjà pour véhicule {row['police']} (mois {mois}/{annee}) - ignorée"
@@ -409,7 +452,6 @@ async def execute_import(
                 
                 # Create dotation
                 try:
-                    print(f"  → Création dotation: vehicule_id={vehicle_id}, benef_id={benef_id}, qte={row['qte']}")
                     cur.execute("""
                         INSERT INTO dotation (
                             vehicule_id, benificiaire_id, mois, annee, 
@@ -420,9 +462,10 @@ async def execute_import(
                     """, (vehicle_id, benef_id, mois, annee, row['qte']))
                     
                     created_dotations += 1
-                    print(f"  ✓ Dotation créée")
+                    if debug:
+                        logger.debug("Dotation créée", extra={"row": row['row_number'], "vehicule_id": vehicle_id, "benificiaire_id": benef_id, "qte": row['qte']})
                 except Exception as e:
-                    print(f"  ✗ Erreur création dotation: {str(e)}")
+                    logger.warning("Erreur création dotation: %s", e, extra={"row": row['row_number'], "police": row['police']})
                     errors.append({
                         'row': row['row_number'],
                         'message': f"Erreur création dotation: {str(e)}"
@@ -430,7 +473,7 @@ async def execute_import(
                     continue
                 
             except Exception as e:
-                print(f"  ✗ Erreur inattendue: {str(e)}")
+                logger.exception("Erreur inattendue", extra={"row": row['row_number']})
                 errors.append({
                     'row': row['row_number'],
                     'message': f"Erreur inattendue: {str(e)}"
@@ -438,9 +481,7 @@ async def execute_import(
         
         if errors:
             conn.rollback()
-            print(f"[IMPORT] ✗ Échec: {len(errors)} erreur(s)")
-            for err in errors:
-                print(f"  - Ligne {err['row']}: {err['message']}")
+            logger.warning("Import annulé", extra={"errors": errors[:20], "error_count": len(errors)})
             return {
                 'success': False,
                 'errors': errors,
@@ -448,7 +489,9 @@ async def execute_import(
             }
         
         conn.commit()
-        print(f"[IMPORT] ✓ Succès: {created_dotations} dotation(s), {created_vehicles} véhicule(s), {created_benefs} bénéficiaire(s)")
+        ref_cache.VEHICULES.invalidate()
+        ref_cache.BENIFICIAIRES.invalidate()
+        logger.info("Import réussi", extra={"dotations": created_dotations, "vehicules": created_vehicles, "beneficiaires": created_benefs})
         
         return {
             'success': True,
@@ -0,0 +1,114 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from app.db.database import get_db, get_db_cursor
+from app.api.auth import get_current_user
+from app.core import jobs, scheduler
+
+router = APIRouter(prefix="/dotation/reconcile", tags=["Dotation Reconciliation"])
+
+
+@router.post("/")
+async def reconcile_dotations(
+    incremental: bool = False,
+    repair: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Compare qte_consomme of every dotation, archived ones included, with the
+    sum of its bons (admin only).
+    incremental: only dotations whose bons changed since the last run.
+    repair: also correct the mismatching counters.
+    """
+    if current_user['role'] != 'ADMIN':
+        raise HTTPException(status_code=403, detail="Accès administrateur requis")
+    
+    try:
+        return await run_in_threadpool(reconcile, incremental, repair)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@jobs.task("reconcile_dotations", maintenance=True)
+def reconcile_job(job: jobs.Job, incremental: bool = False, repair: bool = False):
+    return reconcile(incremental, repair)
+
+
+@scheduler.scheduled("reconcile_dotations", "30 2 * * *")
+def nightly_reconciliation():
+    """Counters of the dotations whose bons changed during the day, corrected"""
+    result = reconcile(incremental=True, repair=True)
+    return {"checked": result['checked'], "mismatches": result['mismatches']}
+
+
+def reconcile(incremental: bool, repair: bool) -> dict:
+    """One reconcile_dotations() run, committed; the response of POST /"""
+    with get_db() as conn:
+        cur = get_db_cursor(conn)
+        # One run at a time, the queue is consumed by the run
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('dotation_reconciliation'))")
+        
+        cur.execute("SELECT * FROM reconcile_dotations(%s, %s)", (incremental, repair))
+        results = cur.fetchall()
+        
+        cur.execute("""
+            SELECT checked FROM dotation_reconciliation_run
+            ORDER BY id DESC
+            LIMIT 1
+        """)
+        checked = cur.fetchone()['checked']
+        
+        conn.commit()
+    
+    rows = [{
+        'dotation_id': r['dotation_id'],
+        'qte': r['qte'],
+        'qte_consomme': float(r['qte_consomme']),
+        'qte_reelle': float(r['qte_reelle']),
+        'ecart': float(r['ecart']),
+        'cloture': r['cloture'],
+        'archive': r['archive']
+    } for r in results]
+    
+    if repair:
+        message = f"{len(rows)} compteur(s) corrigé(s) sur {checked} dotation(s)"
+    else:
+        message = f"{len(rows)} écart(s) sur {checked} dotation(s)"
+    
+    return {
+        'success': True,
+        'incremental': incremental,
+        'repair': repair,
+        'checked': checked,
+        'mismatches': len(rows),
+        'message': message,
+        'rows': rows
+    }
+
+
+@router.get("/runs")
+def get_reconciliation_runs(
+    limit: int = 20,
+    current_user: dict = Depends(get_current_user)
+):
+    """Latest reconciliation runs (admin only)"""
+    if current_user['role'] != 'ADMIN':
+        raise HTTPException(status_code=403, detail="Accès administrateur requis")
+    
+    with get_db() as conn:
+        cur = get_db_cursor(conn)
+        cur.execute("""
+            SELECT id, started_at, finished_at, incremental, repair,
+                   checked, mismatches, repaired
+            FROM dotation_reconciliation_run
+            ORDER BY id DESC
+            LIMIT %s
+        """, (limit,))
+        results = cur.fetchall()
+        
+        cur.execute("SELECT COUNT(*) AS total FROM dotation_reconciliation_queue")
+        pending = cur.fetchone()['total']
+    
+    return {
+        'pending': pending,
+        'runs': [dict(r) for r in results]
+    }
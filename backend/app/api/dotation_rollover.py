@@ -0,0 +1,206 @@
+from fastapi import APIRouter, Depends, HTTPException
+from app.schemas.schemas import DotationRollover
+from app.db.database import get_db, get_db_cursor
+from app.api.auth import get_current_user
+
+router = APIRouter(prefix="/dotation/rollover", tags=["Dotation Rollover"])
+
+# Source of the rollover: for every active vehicle, its latest dotation before
+# the target month that is still open or belongs to the previous month (one
+# branch each, so both are read through the partial indexes of migration 001).
+# `plan` adds the new quota (per-service override or previous qte) and
+# whether the target month already exists for the vehicle.
+PLAN_CTE = """
+    WITH source AS (
+        SELECT DISTINCT ON (d.vehicule_id)
+            d.id, d.vehicule_id, d.benificiaire_id, d.mois, d.annee, d.qte
+        FROM (
+            SELECT * FROM dotation
+            WHERE cloture = FALSE
+              AND (annee, mois) < (%(annee)s, %(mois)s)
+            UNION ALL
+            SELECT * FROM dotation
+            WHERE cloture = TRUE
+              AND annee = %(prev_annee)s AND mois = %(prev_mois)s
+        ) d
+        JOIN vehicule v ON v.id = d.vehicule_id
+        WHERE v.actif = TRUE
+        ORDER BY d.vehicule_id, d.annee DESC, d.mois DESC
+    ), quotas AS (
+        SELECT * FROM unnest(%(service_ids)s::int[], %(quotas)s::int[]) AS q(service_id, qte)
+    ), plan AS (
+        SELECT
+            src.id AS source_id, src.vehicule_id, src.benificiaire_id,
+            src.mois AS source_mois, src.annee AS source_annee,
+            src.qte AS qte_precedente,
+            COALESCE(q.qte, src.qte) AS qte,
+            b.service_id,
+            EXISTS (
+                SELECT 1 FROM dotation t
+                WHERE t.vehicule_id = src.vehicule_id
+                  AND t.mois = %(mois)s
+                  AND t.annee = %(annee)s
+            ) AS existe
+        FROM source src
+        JOIN benificiaire b ON b.id = src.benificiaire_id
+        LEFT JOIN quotas q ON q.service_id = b.service_id
+    )
+"""
+
+# Open dotations the trigger close_previous_dotation() will close
+TO_CLOSE_QUERY = PLAN_CTE + """
+    SELECT COUNT(*) AS total
+    FROM dotation d
+    WHERE d.cloture = FALSE
+      AND (d.annee, d.mois) < (%(annee)s, %(mois)s)
+      AND d.vehicule_id IN (SELECT vehicule_id FROM plan WHERE NOT existe)
+"""
+
+
+def build_params(rollover: DotationRollover) -> dict:
+    """Query parameters shared by preview and execute"""
+    if rollover.mois == 1:
+        prev_mois, prev_annee = 12, rollover.annee - 1
+    else:
+        prev_mois, prev_annee = rollover.mois - 1, rollover.annee
+
+    for service_id, qte in rollover.quotas.items():
+        if qte <= 0:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Quota invalide pour le service {service_id} : {qte}"
+            )
+
+    return {
+        "mois": rollover.mois,
+        "annee": rollover.annee,
+        "prev_mois": prev_mois,
+        "prev_annee": prev_annee,
+        "service_ids": list(rollover.quotas.keys()),
+        "quotas": list(rollover.quotas.values()),
+    }
+
+
+@router.post("/preview")
+def preview_rollover(
+    rollover: DotationRollover,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Preview the monthly rollover without writing anything.
+    Returns one row per vehicle with action 'create' or 'skip'
+    (a dotation already exists for the target month).
+    """
+    if current_user['role'] != 'ADMIN':
+        raise HTTPException(status_code=403, detail="Accès administrateur requis")
+    
+    params = build_params(rollover)
+    
+    with get_db() as conn:
+        cur = get_db_cursor(conn)
+        
+        cur.execute(PLAN_CTE + """
+            SELECT
+                p.vehicule_id, v.police, v.marque, v.carburant,
+                p.benificiaire_id, b.nom AS benificiaire_nom,
+                s.id AS service_id, s.nom AS service_nom, s.direction,
+                p.source_mois, p.source_annee, p.qte_precedente, p.qte, p.existe
+            FROM plan p
+            JOIN vehicule v ON v.id = p.vehicule_id
+            JOIN benificiaire b ON b.id = p.benificiaire_id
+            JOIN service s ON s.id = b.service_id
+            ORDER BY s.direction, s.nom, v.police
+        """, params)
+        results = cur.fetchall()
+        
+        cur.execute(TO_CLOSE_QUERY, params)
+        to_close = cur.fetchone()['total']
+    
+    rows = [{
+        'vehicule_id': r['vehicule_id'],
+        'police': r['police'],
+        'marque': r['marque'],
+        'carburant': r['carburant'],
+        'benificiaire_id': r['benificiaire_id'],
+        'benificiaire_nom': r['benificiaire_nom'],
+        'service_id': r['service_id'],
+        'service_nom': r['service_nom'],
+        'direction': r['direction'],
+        'source_mois': r['source_mois'],
+        'source_annee': r['source_annee'],
+        'qte_precedente': r['qte_precedente'],
+        'qte': r['qte'],
+        'action': 'skip' if r['existe'] else 'create'
+    } for r in results]
+    
+    to_create = [r for r in rows if r['action'] == 'create']
+    
+    return {
+        'success': True,
+        'mois': rollover.mois,
+        'annee': rollover.annee,
+        'summary': {
+            'dotations_to_create': len(to_create),
+            'dotations_to_skip': len(rows) - len(to_create),
+            'dotations_to_close': to_close,
+            'qte_totale': sum(r['qte'] for r in to_create),
+            'quotas_modifies': sum(1 for r in to_create if r['qte'] != r['qte_precedente'])
+        },
+        'rows': rows
+    }
+
+
+@router.post("/execute")
+def execute_rollover(
+    rollover: DotationRollover,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Create the target month's dotations in one transaction.
+    Existing (vehicule_id, mois, annee) rows are skipped; previous months are
+    closed by the statement-level close_previous_dotation() trigger.
+    """
+    if current_user['role'] != 'ADMIN':
+        raise HTTPException(status_code=403, detail="Accès administrateur requis")
+    
+    params = build_params(rollover)
+    
+    with get_db() as conn:
+        cur = get_db_cursor(conn)
+        try:
+            # Serialize concurrent rollovers; regular writes are not blocked
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext('dotation_rollover'))")
+            
+            cur.execute(TO_CLOSE_QUERY, params)
+            closed = cur.fetchone()['total']
+            
+            cur.execute(PLAN_CTE + """
+                , created AS (
+                    INSERT INTO dotation (vehicule_id, benificiaire_id, mois, annee, qte)
+                    SELECT vehicule_id, benificiaire_id, %(mois)s, %(annee)s, qte
+                    FROM plan
+                    WHERE NOT existe
+                    ORDER BY vehicule_id
+                    ON CONFLICT (vehicule_id, mois, annee) DO NOTHING
+                    RETURNING id
+                )
+                SELECT
+                    (SELECT COUNT(*) FROM created) AS created,
+                    (SELECT COUNT(*) FROM plan) AS total
+            """, params)
+            result = cur.fetchone()
+            
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    created = result['created']
+    
+    return {
+        'success': True,
+        'created': created,
+        'skipped': result['total'] - created,
+        'closed': closed,
+        'message': f"Reconduction {rollover.mois:02d}/{rollover.annee} : {created} dotation(s) créée(s)"
+    }
@@ -0,0 +1,59 @@
+from datetime import timedelta
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from typing import Optional
+from app.api.auth import STREAM_SCOPE, get_current_user, get_stream_user
+from app.core import events
+from app.core.config import settings
+from app.core.security import create_access_token
+
+router = APIRouter(prefix="/events", tags=["Events"])
+
+
+@router.post("/ticket", response_model=dict)
+async def stream_ticket(current_user: dict = Depends(get_current_user)):
+    """Short-lived ticket opening the stream, for ?access_token= (accepted
+    by /events/stream only)"""
+    ticket = create_access_token(
+        {"sub": current_user['username'], "scope": STREAM_SCOPE},
+        timedelta(seconds=settings.EVENTS_TICKET_SECONDS)
+    )
+    return {"ticket": ticket, "expires_in": settings.EVENTS_TICKET_SECONDS}
+
+
+@router.get("/stream")
+async def stream(
+    service_id: Optional[int] = None,
+    direction: Optional[str] = None,
+    current_user: dict = Depends(get_stream_user)
+):
+    """
+    Server-sent events (migration 009), optionally limited to a service or
+    a direction:
+    - bon: new approvisionnement (id, type_approvi, qte, date, dotation_id,
+      police, service_id, direction)
+    - dotation: dotation created, quota or closure changed (op, id, qte,
+      cloture, vehicule_id, service_id, direction)
+    - refresh: bulk change of `table` (import, rollover)
+    - overflow, resync: events were lost, refetch
+    EventSource cannot set headers: pass a ticket of POST /events/ticket as
+    ?access_token= (the access token itself is refused there).
+    """
+    subscriber = events.subscribe(service_id, direction)
+    if subscriber is None:
+        raise HTTPException(status_code=503, detail="Trop de connexions au flux d'événements", headers={"Retry-After": "30"})
+    
+    async def frames():
+        try:
+            yield b"retry: 5000\n\n"
+            while True:
+                data = await subscriber.next(settings.EVENTS_HEARTBEAT_SECONDS)
+                yield data or b": ping\n\n"
+        finally:
+            events.unsubscribe(subscriber)
+    
+    return StreamingResponse(
+        frames(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
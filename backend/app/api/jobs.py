@@ -0,0 +1,140 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+import os
+from app.schemas.schemas import JobSubmit
+from app.db.database import get_db, get_db_cursor
+from app.api.auth import get_current_user
+from app.core import jobs
+from app.core.config import settings
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+# Columns returned for a job (params left out: an import carries all its rows)
+JOB_COLUMNS = """
+    id, kind, status, progress, message, result, result_file IS NOT NULL AS has_file,
+    attempts, max_attempts, cancel_requested, created_by,
+    created_at, started_at, finished_at, expires_at
+"""
+
+
+def get_job(cur, job_id: int, current_user: dict, columns: str = JOB_COLUMNS) -> dict:
+    """The job if the user may see it (its creator, or an admin), else 404"""
+    cur.execute(f"SELECT {columns}, created_by AS owner FROM job WHERE id = %s", (job_id,))
+    job = cur.fetchone()
+    if not job or (current_user['role'] != 'ADMIN' and job['owner'] != current_user['username']):
+        raise HTTPException(status_code=404, detail="Tâche introuvable")
+    job = dict(job)
+    del job['owner']
+    return job
+
+
+@router.get("", response_model=dict)
+async def list_jobs(
+    status: str = None,
+    limit: int = 50,
+    current_user: dict = Depends(get_current_user)
+):
+    """Latest jobs of the user (of everyone for admins)"""
+    where_clauses = []
+    params = []
+    if current_user['role'] != 'ADMIN':
+        where_clauses.append("created_by = %s")
+        params.append(current_user['username'])
+    if status:
+        where_clauses.append("status = %s")
+        params.append(status)
+    where_clause = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
+    
+    with get_db() as conn:
+        cur = get_db_cursor(conn)
+        cur.execute(f"""
+            SELECT {JOB_COLUMNS}
+            FROM job
+            {where_clause}
+            ORDER BY id DESC
+            LIMIT %s
+        """, params + [min(limit, 200)])
+        return {"items": [dict(r) for r in cur.fetchall()]}
+
+
+@router.post("", status_code=202, response_model=dict)
+async def submit_job(
+    body: JobSubmit,
+    current_user: dict = Depends(get_current_user)
+):
+    """Queue a maintenance task (admin only): archive_dotations,
+    reconcile_dotations, prune_sync_log"""
+    if current_user['role'] != 'ADMIN':
+        raise HTTPException(status_code=403, detail="Accès administrateur requis")
+    
+    task = jobs.TASKS.get(body.kind)
+    if task is None or not task.maintenance:
+        maintenance = sorted(name for name, t in jobs.TASKS.items() if t.maintenance)
+        raise HTTPException(
+            status_code=400,
+            detail=f"Tâche inconnue: {body.kind} (tâches possibles: {', '.join(maintenance)})"
+        )
+    
+    try:
+        jobs.check_params(body.kind, body.params or {})
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    job_id = jobs.submit(body.kind, body.params, current_user)
+    return {"job_id": job_id, "status": "queued"}
+
+
+@router.get("/{job_id}", response_model=dict)
+async def get_job_status(
+    job_id: int,
+    current_user: dict = Depends(get_current_user)
+):
+    """Status, progress and (once succeeded) result of a job"""
+    with get_db() as conn:
+        cur = get_db_cursor(conn)
+        return get_job(cur, job_id, current_user)
+
+
+@router.post("/{job_id}/cancel", response_model=dict)
+async def cancel_job(
+    job_id: int,
+    current_user: dict = Depends(get_current_user)
+):
+    """Cancel a job: at once if still queued, at its next progress report if running"""
+    with get_db() as conn:
+        cur = get_db_cursor(conn)
+        get_job(cur, job_id, current_user, "id")
+        cur.execute("""
+            UPDATE job SET
+                cancel_requested = TRUE,
+                status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE status END,
+                finished_at = CASE WHEN status = 'queued' THEN now() ELSE finished_at END,
+                expires_at = CASE WHEN status = 'queued' THEN now() + make_interval(hours => %s) ELSE expires_at END
+            WHERE id = %s AND status IN ('queued', 'running')
+            RETURNING status
+        """, (settings.JOBS_RESULT_TTL_HOURS, job_id))
+        updated = cur.fetchone()
+        conn.commit()
+    
+    if not updated:
+        raise HTTPException(status_code=409, detail="Tâche déjà terminée")
+    if updated['status'] == 'cancelled':
+        return {"success": True, "status": "cancelled", "message": "Tâche annulée"}
+    return {"success": True, "status": "running", "message": "Annulation demandée"}
+
+
+@router.get("/{job_id}/file")
+async def get_job_file(
+    job_id: int,
+    current_user: dict = Depends(get_current_user)
+):
+    """File produced by a succeeded job (exports), until the job expires"""
+    with get_db() as conn:
+        cur = get_db_cursor(conn)
+        job = get_job(cur, job_id, current_user, "status, result_file")
+    
+    if job['status'] != 'succeeded' or not job['result_file']:
+        raise HTTPException(status_code=404, detail="Aucun fichier pour cette tâche")
+    if not os.path.isfile(job['result_file']):
+        raise HTTPException(status_code=410, detail="Fichier expiré")
+    return FileResponse(job['result_file'], filename=os.path.basename(job['result_file']))
@@ -1,8 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from typing import List
 from app.schemas.schemas import Service, ServiceCreate, Benificiaire
 from app.db.database import get_db, get_db_cursor
 from app.api.auth import get_current_user
+from app.core import ref_cache
+from app.core.conditional import conditional
 
 router = APIRouter(tags=["Services"])
 
@@ -26,44 +28,70 @@ async def create_service(
             
             result = cur.fetchone()
             conn.commit()
+            ref_cache.SERVICES.invalidate()
             return {"success": True, "message": "Service créé", "id": result['id']}
         except Exception as e:
             conn.rollback()
             raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/services", response_model=List[Service])
-async def list_services(current_user: dict = Depends(get_current_user)):
+async def list_services(request: Request, response: Response, current_user: dict = Depends(get_current_user)):
     """List all services"""
-    with get_db() as conn:
-        cur = get_db_cursor(conn)
-        cur.execute("SELECT * FROM service ORDER BY direction, nom")
-        results = cur.fetchall()
-        return [dict(r) for r in results]
+    if not ref_cache.enabled():
+        with get_db() as conn:
+            cur = get_db_cursor(conn)
+            cur.execute("SELECT * FROM service ORDER BY direction, nom")
+            return [dict(r) for r in cur.fetchall()]
+    
+    services = ref_cache.SERVICES.snapshot()
+    cached = conditional(request, response, ref_cache.etag(services))
+    if cached:
+        return cached
+    return services.rows
 
 @router.get("/services/{service_id}", response_model=Service)
 async def get_service(
     service_id: int,
+    request: Request,
+    response: Response,
     current_user: dict = Depends(get_current_user)
 ):
     """Get service by ID"""
-    with get_db() as conn:
-        cur = get_db_cursor(conn)
-        cur.execute("SELECT * FROM service WHERE id=%s", (service_id,))
-        result = cur.fetchone()
-        
-        if not result:
-            raise HTTPException(status_code=404, detail="Service non trouvé")
-        
-        return dict(result)
+    if not ref_cache.enabled():
+        with get_db() as conn:
+            cur = get_db_cursor(conn)
+            cur.execute("SELECT * FROM service WHERE id=%s", (service_id,))
+            result = cur.fetchone()
+            if not result:
+                raise HTTPException(status_code=404, detail="Service non trouvé")
+            return dict(result)
+    
+    services = ref_cache.SERVICES.snapshot()
+    result = services.by_id.get(service_id)
+    
+    if not result:
+        raise HTTPException(status_code=404, detail="Service non trouvé")
+    
+    cached = conditional(request, response, ref_cache.etag(services))
+    if cached:
+        return cached
+    return result
 
 @router.get("/directions", response_model=List[str])
-async def list_directions(current_user: dict = Depends(get_current_user)):
+async def list_directions(request: Request, response: Response, current_user: dict = Depends(get_current_user)):
     """List all unique directions"""
-    with get_db() as conn:
-        cur = get_db_cursor(conn)
-        cur.execute("SELECT DISTINCT direction FROM service ORDER BY direction")
-        results = cur.fetchall()
-        return [r['direction'] for r in results]
+    if not ref_cache.enabled():
+        with get_db() as conn:
+            cur = get_db_cursor(conn)
+            cur.execute("SELECT DISTINCT direction FROM service ORDER BY direction")
+            return [r['direction'] for r in cur.fetchall()]
+    
+    services = ref_cache.SERVICES.snapshot()
+    cached = conditional(request, response, ref_cache.etag(services))
+    if cached:
+        return cached
+    # Services are ordered by direction
+    return list(dict.fromkeys(s['direction'] for s in services.rows))
 
 
 
@@ -86,14 +114,22 @@ async def get_benificiaire(
 @router.get("/benificiaires/by-service/{service_id}", response_model=List[Benificiaire])
 async def get_benificiaires_by_service(
     service_id: int,
+    request: Request,
+    response: Response,
     current_user: dict = Depends(get_current_user)
 ):
     """Get beneficiaires by service"""
-    with get_db() as conn:
-        cur = get_db_cursor(conn)
-        cur.execute(
-            "SELECT * FROM benificiaire WHERE service_id=%s ORDER BY nom",
-            (service_id,)
-        )
-        results = cur.fetchall()
-        return [dict(r) for r in results]
\ No newline at end of file
+    if not ref_cache.enabled():
+        with get_db() as conn:
+            cur = get_db_cursor(conn)
+            cur.execute(
+                "SELECT * FROM benificiaire WHERE service_id=%s ORDER BY nom, id",
+                (service_id,)
+            )
+            return [dict(r) for r in cur.fetchall()]
+    
+    benificiaires = ref_cache.BENIFICIAIRES.snapshot()
+    cached = conditional(request, response, ref_cache.etag(benificiaires))
+    if cached:
+        return cached
+    return [b for b in benificiaires.rows if b['service_id'] == service_id]
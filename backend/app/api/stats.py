@@ -13,7 +13,7 @@ from typing import List
 router = APIRouter(prefix="/stats", tags=["Statistics"])
 
 @router.get("/dashboard", response_model=DashboardStats)
-async def get_dashboard_stats(current_user: dict = Depends(get_current_user)):
+def get_dashboard_stats(current_user: dict = Depends(get_current_user)):
     """Get dashboard statistics"""
     with get_db() as conn:
         cur = get_db_cursor(conn)
@@ -60,7 +60,7 @@ async def get_dashboard_stats(current_user: dict = Depends(get_current_user)):
         }
 
 @router.get("/consommation-par-jour", response_model=List[ConsommationParJour])
-async def get_consommation_par_jour(current_user: dict = Depends(get_current_user)):
+def get_consommation_par_jour(current_user: dict = Depends(get_current_user)):
     """Get consumption by day (last 30 days)"""
     with get_db() as conn:
         cur = get_db_cursor(conn)
@@ -78,7 +78,7 @@ async def get_consommation_par_jour(current_user: dict = Depends(get_current_use
         return [{"date": r['date'], "total": float(r['total'])} for r in results]
 
 @router.get("/consommation-par-carburant", response_model=List[ConsommationParCarburant])
-async def get_consommation_par_carburant(current_user: dict = Depends(get_current_user)):
+def get_consommation_par_carburant(current_user: dict = Depends(get_current_user)):
     """Get consumption by fuel type (DOTATION only)"""
     with get_db() as conn:
         cur = get_db_cursor(conn)
@@ -88,7 +88,7 @@ async def get_consommation_par_carburant(current_user: dict = Depends(get_curren
                 v.carburant,
                 SUM(a.qte) as total
             FROM approvisionnement a
-            JOIN dotation d ON a.dotation_id = d.id
+            JOIN dotation_all d ON a.dotation_id = d.id
             JOIN vehicule v ON d.vehicule_id = v.id
             WHERE a.type_approvi = 'DOTATION'
             GROUP BY v.carburant
@@ -99,7 +99,7 @@ async def get_consommation_par_carburant(current_user: dict = Depends(get_curren
         return [{"carburant": r['carburant'], "total": float(r['total'])} for r in results]
 
 @router.get("/consommation-par-service", response_model=List[ConsommationParService])
-async def get_consommation_par_service(current_user: dict = Depends(get_current_user)):
+def get_consommation_par_service(current_user: dict = Depends(get_current_user)):
     """Get consumption by service (DOTATION only)"""
     with get_db() as conn:
         cur = get_db_cursor(conn)
@@ -110,7 +110,7 @@ async def get_consommation_par_service(current_user: dict = Depends(get_current_
                 s.direction,
                 SUM(a.qte) as total
             FROM approvisionnement a
-            JOIN dotation d ON a.dotation_id = d.id
+            JOIN dotation_all d ON a.dotation_id = d.id
             JOIN benificiaire b ON d.benificiaire_id = b.id
             JOIN service s ON b.service_id = s.id
             WHERE a.type_approvi = 'DOTATION'
@@ -126,7 +126,7 @@ async def get_consommation_par_service(current_user: dict = Depends(get_current_
         } for r in results]
 
 @router.get("/consommation-par-type", response_model=List[ConsommationParType])
-async def get_consommation_par_type(current_user: dict = Depends(get_current_user)):
+def get_consommation_par_type(current_user: dict = Depends(get_current_user)):
     """Get consumption by type (DOTATION vs MISSION)"""
     with get_db() as conn:
         cur = get_db_cursor(conn)
@@ -147,7 +147,7 @@ async def get_consommation_par_type(current_user: dict = Depends(get_current_use
         } for r in results]
 
 @router.get("/anomalies", response_model=List[dict])
-async def get_anomalies(current_user: dict = Depends(get_current_user)):
+def get_anomalies(current_user: dict = Depends(get_current_user)):
     """Get anomalous approvisionnements"""
     with get_db() as conn:
         cur = get_db_cursor(conn)
@@ -164,7 +164,7 @@ async def get_anomalies(current_user: dict = Depends(get_current_user)):
                 b.nom as benificiaire,
                 s.nom as service
             FROM approvisionnement a
-            JOIN dotation d ON a.dotation_id = d.id
+            JOIN dotation_all d ON a.dotation_id = d.id
             JOIN vehicule v ON d.vehicule_id = v.id
             JOIN benificiaire b ON d.benificiaire_id = b.id
             JOIN service s ON b.service_id = s.id
@@ -0,0 +1,95 @@
+from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+from app.db.database import get_db, get_db_cursor
+from app.api.auth import get_current_user
+from app.core import jobs, scheduler
+
+router = APIRouter(prefix="/sync", tags=["Sync"])
+
+# Synced tables and the rows of each a replica holds
+SYNC_TABLES = {
+    "service": "TRUE",
+    "vehicule": "TRUE",
+    "benificiaire": "TRUE",
+    "dotation": "cloture = FALSE",
+}
+
+
+@router.get("", response_model=dict)
+async def sync(
+    since: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Local replica of services, vehicles, beneficiaires and open dotations
+    (change log of migration 008).
+    Without `since` (or with a token too old): every row, reset=true.
+    With the token of the previous call: rows inserted or updated since in
+    `upserted`, ids to drop in `deleted` (deleted rows, dotations closed or
+    archived). Rows may come again in a later delta; apply them as upserts.
+    """
+    token = None
+    if since:
+        try:
+            token = int(since)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Jeton de synchronisation invalide")
+    
+    with get_db() as conn:
+        cur = get_db_cursor(conn)
+        # One snapshot for the token and every table
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+        cur.execute("""
+            SELECT txid_snapshot_xmin(txid_current_snapshot()) AS xmin,
+                   txid_snapshot_xmax(txid_current_snapshot()) AS xmax,
+                   (SELECT xid FROM sync_horizon) AS horizon
+        """)
+        snapshot = cur.fetchone()
+        reset = token is None or token < snapshot['horizon'] or token > snapshot['xmax']
+        
+        changes = {}
+        if reset:
+            for table, scope in SYNC_TABLES.items():
+                cur.execute(f"SELECT * FROM {table} WHERE {scope} ORDER BY id")
+                changes[table] = {"upserted": [dict(r) for r in cur.fetchall()], "deleted": []}
+        else:
+            cur.execute("SELECT table_name, row_id, deleted FROM sync_log WHERE xid >= %s", (token,))
+            touched = {table: ([], []) for table in SYNC_TABLES}
+            for entry in cur.fetchall():
+                written, deleted = touched[entry['table_name']]
+                (deleted if entry['deleted'] else written).append(entry['row_id'])
+            
+            for table, scope in SYNC_TABLES.items():
+                written, deleted = touched[table]
+                upserted = []
+                if written:
+                    cur.execute(f"SELECT * FROM {table} WHERE {scope} AND id = ANY(%s) ORDER BY id", (written,))
+                    upserted = [dict(r) for r in cur.fetchall()]
+                    # Written but out of the replica (closed dotations)
+                    kept = {r['id'] for r in upserted}
+                    deleted += [i for i in written if i not in kept]
+                changes[table] = {"upserted": upserted, "deleted": sorted(deleted)}
+        
+        conn.rollback()
+    
+    return {"token": str(snapshot['xmin']), "reset": reset, "changes": changes}
+
+
+@jobs.task("prune_sync_log", maintenance=True)
+def prune_job(job: jobs.Job, keep_days: int = 30):
+    return prune(keep_days)
+
+
+@scheduler.scheduled("prune_sync_log", "0 4 * * 0")
+def weekly_prune():
+    return prune(30)
+
+
+def prune(keep_days: int) -> dict:
+    """Tombstones older than keep_days dropped; older tokens get a full resync"""
+    with get_db() as conn:
+        cur = get_db_cursor(conn)
+        cur.execute("SELECT prune_sync_log(make_interval(days => %s)) AS pruned", (keep_days,))
+        pruned = cur.fetchone()['pruned']
+        conn.commit()
+    return {"pruned": pruned, "message": f"{pruned} suppression(s) purgée(s) du journal"}
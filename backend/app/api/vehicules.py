@@ -1,24 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from typing import List
-from app.schemas.schemas import Vehicule, VehiculeCreate
+from app.schemas.schemas import BulkFilter, Vehicule, VehiculeCreate
 from app.db.database import get_db, get_db_cursor
 from app.api.auth import get_current_user
+from app.utils.bulk import vehicule_filter
+from app.core import ref_cache
+from app.core.conditional import conditional
+from app.core.json_rows import Rows, list_format, list_response
+from app.utils.fields import requested_fields
 
 router = APIRouter(prefix="/vehicules", tags=["Vehicules"])
 
-@router.get("/", response_model=dict)
-async def list_vehicules(
-    page: int = 1,
-    per_page: int = 10,
-    active_only: bool = True,
-    search: str = None,
-    current_user: dict = Depends(get_current_user)
-):
-    """List all vehicles with pagination and search"""
+# ?fields= of the list (columns of the cached rows)
+LIST_FIELDS = ("id", "police", "ncivil", "marque", "carburant", "km", "actif", "created_at")
+
+def paged_vehicules(page: int, per_page: int, active_only: bool, search: str):
+    """Page of the list and total, queried (cache disabled)"""
     with get_db() as conn:
         cur = get_db_cursor(conn)
         
-        # Build query
         where_clauses = []
         params = []
         
@@ -32,24 +32,71 @@ async def list_vehicules(
         
         where_clause = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
         
-        # Get total count
-        count_query = f"SELECT COUNT(*) as total FROM vehicule {where_clause}"
-        cur.execute(count_query, params)
+        cur.execute(f"SELECT COUNT(*) as total FROM vehicule {where_clause}", params)
         total = cur.fetchone()['total']
         
-        # Get paginated results
         offset = (page - 1) * per_page
-        list_query = f"SELECT * FROM vehicule {where_clause} ORDER BY police LIMIT %s OFFSET %s"
-        cur.execute(list_query, params + [per_page, offset])
-        results = cur.fetchall()
-        
-        return {
-            "items": [dict(r) for r in results],
-            "page": page,
-            "per_page": per_page,
-            "total": total,
-            "pages": (total + per_page - 1) // per_page if total > 0 else 0
-        }
+        cur.execute(f"SELECT * FROM vehicule {where_clause} ORDER BY police LIMIT %s OFFSET %s", params + [per_page, offset])
+        return [dict(r) for r in cur.fetchall()], total
+
+def current_km(ids: List[int]) -> dict:
+    """km of these vehicles (updated by every bon, not in the cached rows)"""
+    if not ids:
+        return {}
+    with get_db() as conn:
+        cur = get_db_cursor(conn)
+        cur.execute("SELECT id, km FROM vehicule WHERE id = ANY(%s)", (ids,))
+        return {r['id']: r['km'] for r in cur.fetchall()}
+
+@router.get("/", response_model=dict)
+def list_vehicules(
+    request: Request,
+    response: Response,
+    page: int = 1,
+    per_page: int = 10,
+    active_only: bool = True,
+    search: str = None,
+    fields: str = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """List all vehicles with pagination and search
+    
+    fields: comma-separated item keys (e.g. id,police), all by default
+    """
+    columns = requested_fields(fields, LIST_FIELDS)
+    fmt = list_format(request)
+    offset = (page - 1) * per_page
+    
+    if not ref_cache.enabled():
+        items, total = paged_vehicules(page, per_page, active_only, search)
+    else:
+        # Same filters as the former SQL, on the cached rows (ordered by police)
+        vehicules = ref_cache.VEHICULES.snapshot()
+        results = vehicules.rows
+        if active_only:
+            results = [v for v in results if v['actif']]
+        if search:
+            match = ref_cache.ilike(search)
+            results = [v for v in results if match(v['police']) or match(v['ncivil']) or match(v['marque'])]
+        
+        total = len(results)
+        items = results[offset:offset + per_page]
+        kms = None
+        if "km" in columns:
+            kms = current_km([v['id'] for v in items])
+            items = [{**v, 'km': kms.get(v['id'])} for v in items]
+        
+        cached = conditional(request, response, ref_cache.etag(vehicules, live=kms), fmt)
+        if cached:
+            return cached
+    
+    return list_response(fmt, {
+        "items": Rows.from_records(items, columns),
+        "page": page,
+        "per_page": per_page,
+        "total": total,
+        "pages": (total + per_page - 1) // per_page if total > 0 else 0
+    }, response)
 
 @router.get("/{vehicule_id}", response_model=Vehicule)
 async def get_vehicule(
@@ -87,6 +134,7 @@ async def create_vehicule(
             
             result = cur.fetchone()
             conn.commit()
+            ref_cache.VEHICULES.invalidate()
             return {"success": True, "message": "Véhicule créé", "id": result['id']}
         except Exception as e:
             conn.rollback()
@@ -116,6 +164,7 @@ async def update_vehicule(
             raise HTTPException(status_code=404, detail="Véhicule non trouvé")
         
         conn.commit()
+        ref_cache.VEHICULES.invalidate()
         return {"success": True, "message": "Véhicule modifié"}
 
 @router.delete("/{vehicule_id}")
@@ -139,8 +188,47 @@ async def delete_vehicule(
             raise HTTPException(status_code=404, detail="Véhicule non trouvé")
         
         conn.commit()
+        ref_cache.VEHICULES.invalidate()
         return {"success": True, "message": "Véhicule désactivé"}
 
+@router.post("/bulk/deactivate", response_model=dict)
+async def bulk_deactivate_vehicules(
+    bulk: BulkFilter,
+    current_user: dict = Depends(get_current_user)
+):
+    """Deactivate every active vehicle matching the filter (admin only)"""
+    if current_user['role'] != 'ADMIN':
+        raise HTTPException(status_code=403, detail="Accès administrateur requis")
+    
+    where_clauses, params = vehicule_filter(bulk)
+    if not where_clauses:
+        raise HTTPException(status_code=400, detail="Au moins un critère de filtre est requis")
+    where_clauses.append("v.actif = TRUE")
+    where_sql = " AND ".join(where_clauses)
+    
+    with get_db() as conn:
+        cur = get_db_cursor(conn)
+        try:
+            if bulk.dry_run:
+                cur.execute(f"SELECT COUNT(*) AS total FROM vehicule v WHERE {where_sql}", params)
+                count = cur.fetchone()['total']
+                return {"success": True, "dry_run": True, "count": count, "message": f"{count} véhicule(s) concerné(s)"}
+            
+            cur.execute(f"UPDATE vehicule v SET actif = FALSE WHERE {where_sql} RETURNING v.id", params)
+            ids = sorted(row['id'] for row in cur.fetchall())
+            conn.commit()
+            ref_cache.VEHICULES.invalidate()
+            return {
+                "success": True,
+                "dry_run": False,
+                "count": len(ids),
+                "ids": ids,
+                "message": f"{len(ids)} véhicule(s) désactivé(s)"
+            }
+        except Exception as e:
+            conn.rollback()
+            raise HTTPException(status_code=400, detail=str(e))
+
 @router.get("/by-police/{police}", response_model=dict)
 async def get_vehicle_by_police(
     police: str,
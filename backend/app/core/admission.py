@@ -0,0 +1,202 @@
+"""
+Admission control: concurrency budgets per route class, with load shedding.
+
+Every /api request belongs to a class, found from its path:
+
+    pump     searches and bons of the pump terminals, delta sync
+    report   administration, imports, rollover, reconciliation, bulk
+             updates, exports and the full approvisionnement lists
+    stats    dashboard statistics
+    default  everything else
+
+At most ADMISSION_MAX_CONCURRENCY requests run at once in a worker, of
+which ADMISSION_PUMP_RESERVED slots only pump requests may take: reports,
+statistics and the rest share the other slots, reports and statistics
+within their own, smaller budgets. A month-start import or a dashboard
+refreshed by every office cannot take the DB connections the pump needs.
+Report and statistics handlers are plain functions, run in the threadpool,
+so the admitted ones never hold the event loop the pump requests run on.
+
+A request over its budget waits (pump requests are admitted first when a
+slot frees up) until its deadline, then gets a 503 with Retry-After; when
+its class already has ADMISSION_QUEUE_LENGTH requests waiting, it gets the
+503 at once. Budgets are per worker process: multiply by the uvicorn
+workers for the whole server. The live events stream is not counted.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Dict
+from starlette.responses import JSONResponse
+from app.core import metrics
+from app.core.config import settings
+
+PUMP, REPORT, STATS, DEFAULT = "pump", "report", "stats", "default"
+
+# Exact paths and path prefixes of each class, checked in this order
+PUMP_PATHS = {
+    "/api/approvisionnement/search",
+    "/api/approvisionnement/search-mission",
+    "/api/approvisionnement/dotation",
+    "/api/approvisionnement/mission",
+}
+# Exact (method, path) of report routes a prefix would confuse with others
+# (GET /api/dotation/archived is the paged list, default class)
+REPORT_ROUTES = {
+    ("POST", "/api/dotation/archive"),
+}
+PREFIXES = (
+    ("/api/approvisionnement/last-km/", PUMP),
+    ("/api/sync", PUMP),
+    ("/api/stats/", STATS),
+    ("/api/admin/", REPORT),
+    ("/api/dotation/import-excel/", REPORT),
+    ("/api/dotation/rollover/", REPORT),
+    ("/api/dotation/reconcile", REPORT),
+    ("/api/dotation/bulk/", REPORT),
+    ("/api/approvisionnement/export", REPORT),
+    ("/api/approvisionnement/list", REPORT),
+    ("/api/approvisionnement/dotation-list", REPORT),
+    ("/api/approvisionnement/mission-list", REPORT),
+)
+# Long-lived, with their own limits (EVENTS_MAX_SUBSCRIBERS)
+EXEMPT_PREFIXES = ("/api/events/",)
+
+# Seconds a rejected client should wait before retrying
+RETRY_AFTER = {PUMP: 1, DEFAULT: 2, STATS: 5, REPORT: 10}
+
+ADMISSION_WAIT = metrics.Histogram(
+    "dpa_admission_wait_seconds", "Attente des requêtes avant admission",
+    ("class", "outcome")
+)
+
+
+def route_class(method: str, path: str) -> str:
+    if path in PUMP_PATHS:
+        return PUMP
+    if (method, path) in REPORT_ROUTES:
+        return REPORT
+    for prefix, cls in PREFIXES:
+        if path.startswith(prefix):
+            return cls
+    return DEFAULT
+
+
+class Rejected(Exception):
+    """The class is saturated: queue full, or deadline passed while waiting"""
+
+
+class Gate:
+    """Running and waiting requests of one worker (event loop thread only)"""
+    
+    def __init__(self):
+        self.running: Dict[str, int] = {PUMP: 0, REPORT: 0, STATS: 0, DEFAULT: 0}
+        # (class, future) in arrival order
+        self.waiting = deque()
+    
+    def limit(self, cls: str) -> int:
+        if cls == REPORT:
+            return settings.ADMISSION_REPORT_CONCURRENCY
+        if cls == STATS:
+            return settings.ADMISSION_STATS_CONCURRENCY
+        if cls == PUMP:
+            return settings.ADMISSION_MAX_CONCURRENCY
+        return settings.ADMISSION_MAX_CONCURRENCY - settings.ADMISSION_PUMP_RESERVED
+    
+    def admissible(self, cls: str) -> bool:
+        if self.running[cls] >= self.limit(cls):
+            return False
+        total = sum(self.running.values())
+        if total >= settings.ADMISSION_MAX_CONCURRENCY:
+            return False
+        if cls == PUMP:
+            return True
+        # The reserved slots stay free for the pump
+        shared = total - self.running[PUMP]
+        return shared < settings.ADMISSION_MAX_CONCURRENCY - settings.ADMISSION_PUMP_RESERVED
+    
+    def queued(self, cls: str) -> int:
+        return sum(1 for c, _ in self.waiting if c == cls)
+    
+    async def acquire(self, cls: str) -> bool:
+        """Take a slot, waiting if need be; whether the request was queued"""
+        if self.admissible(cls):
+            self.running[cls] += 1
+            return False
+        if self.queued(cls) >= settings.ADMISSION_QUEUE_LENGTH:
+            raise Rejected()
+        
+        future = asyncio.get_running_loop().create_future()
+        entry = (cls, future)
+        self.waiting.append(entry)
+        deadline = settings.ADMISSION_PUMP_QUEUE_SECONDS if cls == PUMP else settings.ADMISSION_QUEUE_SECONDS
+        try:
+            await asyncio.wait_for(asyncio.shield(future), deadline)
+        except asyncio.TimeoutError:
+            # Admitted at the very moment the deadline passed: keep the slot
+            if future.done():
+                return True
+            future.cancel()
+            self.waiting.remove(entry)
+            raise Rejected()
+        except asyncio.CancelledError:
+            # Client gone while waiting
+            if future.done():
+                self.release(cls)
+            else:
+                future.cancel()
+                self.waiting.remove(entry)
+            raise
+        return True
+    
+    def release(self, cls: str):
+        self.running[cls] -= 1
+        self._wake()
+    
+    def _wake(self):
+        """Admit the waiting requests that fit, pump ones first, then in arrival order"""
+        for entry in sorted(self.waiting, key=lambda e: e[0] != PUMP):
+            cls, future = entry
+            if self.admissible(cls):
+                self.waiting.remove(entry)
+                self.running[cls] += 1
+                future.set_result(None)
+
+
+gate = Gate()
+
+
+class AdmissionMiddleware:
+    """ASGI middleware admitting each /api request within its class budget"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or not path.startswith("/api/") or path.startswith(EXEMPT_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+        
+        cls = route_class(scope["method"], path)
+        start = time.perf_counter()
+        try:
+            queued = await gate.acquire(cls)
+        except Rejected:
+            ADMISSION_WAIT.observe(time.perf_counter() - start, cls, "rejected")
+            response = JSONResponse(
+                {"detail": "Serveur surchargé, réessayez dans un instant"},
+                status_code=503,
+                headers={"Retry-After": str(RETRY_AFTER[cls])}
+            )
+            await response(scope, receive, send)
+            return
+        
+        waited = time.perf_counter() - start
+        ADMISSION_WAIT.observe(waited, cls, "admitted")
+        if queued:
+            metrics.record_queue(waited)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release(cls)
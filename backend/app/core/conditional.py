@@ -0,0 +1,51 @@
+"""
+Conditional GET (ETag / If-None-Match).
+
+Endpoints compute their ETag from in-memory versions (ref_cache snapshots,
+table_versions) before any SQL and return early when the client copy is
+still current:
+
+    cached = conditional(request, response, ref_cache.etag(services))
+    if cached:
+        return cached
+"""
+from typing import Optional
+from fastapi import Request, Response
+from app.core.compression import ETAG_SUFFIXES
+
+# Clients revalidate every time; Authorization keeps shared caches out
+CACHE_CONTROL = "private, no-cache"
+
+
+def _opaque(tag: str) -> str:
+    """Entity tag without W/ and without the encoding suffix of compression"""
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    for suffix in ETAG_SUFFIXES:
+        if tag.endswith(suffix + '"'):
+            return tag[:-len(suffix) - 1] + '"'
+    return tag
+
+
+def conditional(request: Request, response: Response, etag: Optional[str], variant: Optional[str] = None) -> Optional[Response]:
+    """Set the ETag of `response`; a 304 response when If-None-Match matches.
+    etag None (version unknown): no ETag, the response is always sent.
+    variant: representation other than the default (list format), part of the tag."""
+    if etag is None:
+        return None
+    if variant:
+        etag = f'{etag[:-1]}.{variant}"'
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return None
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or _opaque(tag) == etag:
+            # The tag the client holds, encoding suffix included
+            held = etag if tag == "*" else tag
+            return Response(status_code=304, headers={"ETag": held, "Cache-Control": CACHE_CONTROL})
+    return None
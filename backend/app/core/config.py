@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List
 
 class Settings(BaseSettings):
     # Database
@@ -10,6 +10,79 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 1440  # 24 hours
     
+    # Passwords: bcrypt cost, and the pool running the checks off the event loop
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_PENDING: int = 32  # logins beyond this get a 503
+    
+    # Dotations: closed rows older than this many months are moved to dotation_archive
+    DOTATION_ARCHIVE_AFTER_MONTHS: int = 12
+    
+    # Metrics: /metrics endpoint, Server-Timing header, per-query timings
+    METRICS_ENABLED: bool = True
+    
+    # Slow queries: statements slower than this are captured with their plan (0 = off)
+    SLOW_QUERY_THRESHOLD_MS: int = 500
+    SLOW_QUERY_BUFFER_SIZE: int = 500
+    SLOW_QUERY_LOG_TABLE: bool = False  # also write them to slow_query_log (migration 004)
+    
+    # Profiler: admins add ?profile=1 or X-Profile: 1 to profile a request
+    PROFILER_ENABLED: bool = True
+    PROFILE_DIR: str = "profiles"
+    PROFILE_STORE_MAX: int = 50
+    PROFILE_INTERVAL_MS: int = 1
+    
+    # In-process caches (users, reference tables) kept fresh by LISTEN/NOTIFY
+    # (migrations 005 and 006); the listener also feeds /api/events/stream
+    CACHE_ENABLED: bool = True
+    
+    # Live events (GET /api/events/stream, migration 009)
+    EVENTS_MAX_SUBSCRIBERS: int = 500  # per worker, more get a 503
+    EVENTS_BUFFER_SIZE: int = 100  # per client, a slower client gets "overflow" and refetches
+    EVENTS_HEARTBEAT_SECONDS: float = 15.0  # keeps proxies from closing idle streams
+    EVENTS_TICKET_SECONDS: int = 60  # lifetime of the stream ticket passed as ?access_token=
+    
+    # Response compression (br when the brotli package is installed, else gzip)
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024  # bytes, smaller responses are sent as is
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4  # 11 is far too slow for dynamic responses
+    
+    # Background jobs (migration 010), run by python -m app.worker
+    JOBS_WORKER_PROCESSES: int = 2
+    JOBS_POLL_SECONDS: float = 5.0  # idle workers wake on NOTIFY, or after this (due retries)
+    JOBS_HEARTBEAT_SECONDS: float = 10.0
+    JOBS_STALE_SECONDS: float = 120.0  # running job without heartbeat: its worker died, requeued
+    JOBS_MAX_ATTEMPTS: int = 3
+    JOBS_RETRY_SECONDS: float = 30.0  # delay before the 2nd attempt, doubled at each retry
+    JOBS_RESULT_DIR: str = "job_results"
+    JOBS_RESULT_TTL_HOURS: int = 24  # finished jobs and their files are deleted after this
+    
+    # Scheduler (migration 011): one uvicorn worker, elected by advisory lock, runs the tasks
+    SCHEDULER_ENABLED: bool = True
+    SCHEDULER_TICK_SECONDS: float = 30.0
+    SCHEDULER_MISFIRE_SECONDS: float = 3600.0  # a slot missed (no leader) is still run within this
+    SCHEDULER_HISTORY_DAYS: int = 90
+    SCHEDULES: Dict[str, str] = {}  # cron spec per task, overriding its default ("" disables it)
+    
+    # Admission control (per worker): requests beyond their class budget wait, then get a 503
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_CONCURRENCY: int = 32  # requests running at once, all classes
+    ADMISSION_PUMP_RESERVED: int = 8  # of those, slots only the pump terminals may use
+    ADMISSION_REPORT_CONCURRENCY: int = 1  # admin, imports, rollover, bulk updates, exports, full lists
+    ADMISSION_STATS_CONCURRENCY: int = 1
+    ADMISSION_QUEUE_SECONDS: float = 10.0  # longest wait for a slot
+    ADMISSION_PUMP_QUEUE_SECONDS: float = 2.0  # pump terminals retry rather than hang
+    ADMISSION_QUEUE_LENGTH: int = 50  # waiting requests per class, more get a 503 at once
+    
+    # Logging: JSON lines (or "text") written by a background thread
+    LOG_LEVEL: str = "INFO"
+    LOG_LEVELS: Dict[str, str] = {}  # per module, e.g. {"app.api.dotation_import": "DEBUG"}
+    LOG_FORMAT: str = "json"
+    LOG_QUEUE_SIZE: int = 10000  # records beyond this are dropped, never waited on
+    LOG_ROW_SAMPLE_FIRST: int = 5  # per-row debug output: first rows of a file...
+    LOG_ROW_SAMPLE_EVERY: int = 100  # ...then one row in this many (0 = every row)
+    
     # CORS
     BACKEND_CORS_ORIGINS: List[str] = [
         "http://localhost:3000",
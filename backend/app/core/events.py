@@ -0,0 +1,127 @@
+"""
+Live events (new bons, quota and closure changes) pushed to SSE clients.
+
+The triggers of migration 009 send one NOTIFY dpa_events per row. The
+listener thread parses each payload and encodes its SSE frame once, then
+hands it to the event loop, which appends it to the buffer of every
+subscriber whose filters match: a notification costs the same whatever the
+number of clients.
+
+Buffers are bounded (EVENTS_BUFFER_SIZE). A client too slow to drain its
+buffer loses it and gets a single "overflow" event instead, as does every
+client after the listener reconnected ("resync"): both mean "refetch".
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import deque
+from typing import Optional
+from app.core import notify
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "dpa_events"
+
+# Events sent to every subscriber whatever its filters
+BROADCAST_TYPES = ("refresh", "resync", "overflow")
+
+_subscribers = set()
+_lock = threading.Lock()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def frame(event: dict) -> bytes:
+    """SSE frame of an event (event name = its type)"""
+    return f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n".encode()
+
+
+class Subscriber:
+    def __init__(self, service_id: Optional[int] = None, direction: Optional[str] = None):
+        self.service_id = service_id
+        self.direction = direction
+        self._frames = deque()
+        self._ready = asyncio.Event()
+    
+    def wants(self, event: dict) -> bool:
+        if event["type"] in BROADCAST_TYPES:
+            return True
+        if self.service_id is not None and event.get("service_id") != self.service_id:
+            return False
+        if self.direction is not None and event.get("direction") != self.direction:
+            return False
+        return True
+    
+    def push(self, event: dict, data: bytes):
+        """Called on the event loop"""
+        if not self.wants(event):
+            return
+        if len(self._frames) >= settings.EVENTS_BUFFER_SIZE:
+            self._frames.clear()
+            data = frame({"type": "overflow"})
+        self._frames.append(data)
+        self._ready.set()
+    
+    async def next(self, timeout: float) -> bytes:
+        """Buffered frames, b"" when nothing came within timeout"""
+        if not self._frames:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return b""
+        data = b"".join(self._frames)
+        self._frames.clear()
+        return data
+
+
+def subscribe(service_id: Optional[int] = None, direction: Optional[str] = None) -> Optional[Subscriber]:
+    """New subscriber, None when EVENTS_MAX_SUBSCRIBERS are already connected.
+    Must be called on the event loop."""
+    global _loop
+    with _lock:
+        if len(_subscribers) >= settings.EVENTS_MAX_SUBSCRIBERS:
+            return None
+        _loop = asyncio.get_running_loop()
+        subscriber = Subscriber(service_id, direction)
+        _subscribers.add(subscriber)
+    return subscriber
+
+
+def unsubscribe(subscriber: Subscriber):
+    with _lock:
+        _subscribers.discard(subscriber)
+
+
+def subscriber_count() -> int:
+    return len(_subscribers)
+
+
+def _fan_out(event: dict, data: bytes):
+    for subscriber in list(_subscribers):
+        subscriber.push(event, data)
+
+
+def publish(payload: Optional[str]):
+    """NOTIFY callback: payload is a JSON event, None (resync) after a reconnection"""
+    if payload is None:
+        event = {"type": "resync"}
+    else:
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning("Événement NOTIFY illisible: %s", payload)
+            return
+    
+    loop = _loop
+    if loop is None or not _subscribers:
+        return
+    try:
+        loop.call_soon_threadsafe(_fan_out, event, frame(event))
+    except RuntimeError:
+        # Loop closed (shutdown)
+        pass
+
+
+notify.subscribe(CHANNEL, publish)
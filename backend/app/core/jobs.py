@@ -0,0 +1,288 @@
+"""
+Background jobs (migration 010).
+
+Long tasks (Excel import, exports, maintenance) run in worker processes
+(python -m app.worker), never in the uvicorn workers: the endpoint queues a
+job, answers 202 with its id, and the client polls GET /api/jobs/{id}.
+
+A task is a function registered under a name. It receives the Job and the
+job's params, reports its progress, writes its file (if any) under
+job.result_path() (one directory per attempt, so a worker whose claim was
+lost only ever deletes its own files) and returns the JSON result:
+
+    @jobs.task("export_approvisionnement")
+    def export(job: jobs.Job, type_filter: str = None):
+        ...
+        job.progress(50, "Écriture du fichier")
+        workbook.save(job.result_path("bons.xlsx"))
+        return {"rows": n}
+    
+    job_id = jobs.submit("export_approvisionnement", {"type_filter": "MISSION"}, current_user)
+
+Workers claim the oldest due job with SELECT ... FOR UPDATE SKIP LOCKED, so
+they share the queue without running a job twice. An exception requeues
+the job after JOBS_RETRY_SECONDS (doubled at each retry) until its
+max_attempts, then marks it failed; the task's transaction is never
+committed, so a retry starts clean. Cancellation is cooperative:
+progress() raises JobCancelled once it was requested. Status writes use the
+worker's own autocommit connection, visible while the task's transaction
+is still open; they carry the attempt number, so a worker whose job was
+requeued as stale cannot overwrite the new attempt.
+
+Finished jobs expire after JOBS_RESULT_TTL_HOURS: purge_expired() deletes
+them with their files.
+"""
+import inspect
+import logging
+import os
+import shutil
+import threading
+from typing import Callable, Dict, Optional
+from psycopg2.extras import Json, RealDictCursor
+from pydantic import TypeAdapter, ValidationError
+from app.core.config import settings
+from app.db.database import get_db, get_db_cursor
+
+logger = logging.getLogger(__name__)
+
+# NOTIFY sent by migration 010 when jobs are queued
+CHANNEL = "dpa_jobs"
+
+FINISHED = ("succeeded", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    """Raised by Job.progress() once the job was cancelled (or taken over)"""
+
+
+class Task:
+    def __init__(self, name: str, fn: Callable, max_attempts: int, maintenance: bool):
+        self.name = name
+        self.fn = fn
+        self.max_attempts = max_attempts
+        self.maintenance = maintenance
+
+
+TASKS: Dict[str, Task] = {}
+
+
+def task(name: str, max_attempts: Optional[int] = None, maintenance: bool = False):
+    """Register fn(job, **params) as the task `name`.
+    maintenance: admins may queue it directly (POST /api/jobs)."""
+    def register(fn):
+        TASKS[name] = Task(name, fn, max_attempts or settings.JOBS_MAX_ATTEMPTS, maintenance)
+        return fn
+    return register
+
+
+def check_params(kind: str, params: dict):
+    """Raise ValueError unless the task `kind` accepts these params (names
+    and annotated types), so a bad request is not retried max_attempts times"""
+    parameters = list(inspect.signature(TASKS[kind].fn).parameters.values())[1:]
+    any_name = any(p.kind == p.VAR_KEYWORD for p in parameters)
+    parameters = [p for p in parameters if p.kind not in (p.VAR_POSITIONAL, p.VAR_KEYWORD)]
+    accepted = {p.name: p for p in parameters}
+    unknown = sorted(set(params) - set(accepted))
+    if unknown and not any_name:
+        raise ValueError(f"Paramètre(s) inconnu(s): {', '.join(unknown)} (possibles: {', '.join(accepted) or 'aucun'})")
+    missing = [p.name for p in parameters if p.default is inspect.Parameter.empty and p.name not in params]
+    if missing:
+        raise ValueError(f"Paramètre(s) manquant(s): {', '.join(missing)}")
+    for name, value in params.items():
+        if name not in accepted:
+            continue
+        annotation = accepted[name].annotation
+        if annotation is inspect.Parameter.empty or (value is None and accepted[name].default is None):
+            continue
+        try:
+            TypeAdapter(annotation).validate_python(value, strict=True)
+        except ValidationError:
+            raise ValueError(f"Paramètre {name}: valeur invalide ({value!r})")
+
+
+def submit(kind: str, params: Optional[dict] = None, user: Optional[dict] = None) -> int:
+    """Queue a job of a registered task; its id"""
+    with get_db() as conn:
+        cur = get_db_cursor(conn)
+        cur.execute("""
+            INSERT INTO job (kind, params, max_attempts, created_by)
+            VALUES (%s, %s, %s, %s)
+            RETURNING id
+        """, (kind, Json(params or {}), TASKS[kind].max_attempts, user['username'] if user else None))
+        job_id = cur.fetchone()['id']
+        conn.commit()
+    logger.info("Tâche en file", extra={"job_id": job_id, "kind": kind})
+    return job_id
+
+
+def job_dir(job_id: int, attempt: Optional[int] = None) -> str:
+    """Files of a job, or of one of its attempts"""
+    directory = os.path.join(settings.JOBS_RESULT_DIR, str(job_id))
+    return os.path.join(directory, str(attempt)) if attempt is not None else directory
+
+
+class Job:
+    """A claimed job, handed to its task"""
+    
+    def __init__(self, conn, row: dict):
+        self._conn = conn
+        self._lock = threading.Lock()
+        self.id = row['id']
+        self.kind = row['kind']
+        self.params = row['params']
+        self.attempt = row['attempts']
+        self.max_attempts = row['max_attempts']
+        self.created_by = row['created_by']
+        self.result_file = None
+    
+    def _write(self, sql: str, params: tuple) -> Optional[tuple]:
+        """UPDATE of this attempt's row (status still running); its RETURNING row"""
+        with self._lock, self._conn.cursor() as cur:
+            cur.execute(sql + " WHERE id = %s AND attempts = %s AND status = 'running' RETURNING cancel_requested",
+                        params + (self.id, self.attempt))
+            return cur.fetchone()
+    
+    def progress(self, percent: float, message: Optional[str] = None):
+        """Report progress (0-100, message optional); raises JobCancelled once
+        a cancel was requested"""
+        row = self._write(
+            "UPDATE job SET progress = %s, message = COALESCE(%s, message), heartbeat_at = now()",
+            (max(0, min(100, int(percent))), message)
+        )
+        if row is None or row[0]:
+            raise JobCancelled()
+    
+    def heartbeat(self):
+        self._write("UPDATE job SET heartbeat_at = now()", ())
+    
+    def result_path(self, filename: str) -> str:
+        """Path of the job's result file, served by GET /api/jobs/{id}/file"""
+        directory = job_dir(self.id, self.attempt)
+        os.makedirs(directory, exist_ok=True)
+        self.result_file = os.path.join(directory, os.path.basename(filename))
+        return self.result_file
+    
+    def finish(self, status: str, result=None, message: Optional[str] = None):
+        self._write("""
+            UPDATE job SET
+                status = %s,
+                progress = CASE WHEN %s = 'succeeded' THEN 100 ELSE progress END,
+                message = COALESCE(%s, message),
+                result = %s,
+                result_file = %s,
+                finished_at = now(),
+                expires_at = now() + make_interval(hours => %s)
+        """, (status, status, message, Json(result) if result is not None else None,
+              self.result_file if status == 'succeeded' else None, settings.JOBS_RESULT_TTL_HOURS))
+    
+    def retry(self, message: str):
+        """Back to the queue after a growing delay"""
+        delay = settings.JOBS_RETRY_SECONDS * 2 ** (self.attempt - 1)
+        self._write(
+            "UPDATE job SET status = 'queued', message = %s, run_after = now() + make_interval(secs => %s)",
+            (message, delay)
+        )
+
+
+def claim(conn, worker: str) -> Optional[Job]:
+    """Oldest due queued job, now running on `worker`; conn: autocommit"""
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("""
+            UPDATE job SET
+                status = 'running',
+                attempts = attempts + 1,
+                worker = %s,
+                started_at = now(),
+                heartbeat_at = now(),
+                progress = 0
+            WHERE id = (
+                SELECT id FROM job
+                WHERE status = 'queued' AND run_after <= now()
+                ORDER BY run_after, id
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, kind, params, attempts, max_attempts, created_by
+        """, (worker,))
+        row = cur.fetchone()
+    return Job(conn, row) if row else None
+
+
+def _heartbeat(job: Job, done: threading.Event):
+    """Keeps the job claimed while a task runs without reporting progress"""
+    while not done.wait(settings.JOBS_HEARTBEAT_SECONDS):
+        try:
+            job.heartbeat()
+        except Exception as e:
+            logger.warning("Heartbeat impossible: %s", e, extra={"job_id": job.id})
+
+
+def run(job: Job):
+    """Run a claimed job to its end (succeeded, failed, cancelled or requeued)"""
+    task = TASKS.get(job.kind)
+    done = threading.Event()
+    beat = threading.Thread(target=_heartbeat, args=(job, done), name=f"job-{job.id}-heartbeat", daemon=True)
+    beat.start()
+    logger.info("Tâche démarrée", extra={"job_id": job.id, "kind": job.kind, "attempt": job.attempt})
+    try:
+        if task is None:
+            job.finish("failed", message=f"Tâche inconnue: {job.kind}")
+            return
+        result = task.fn(job, **job.params)
+    except JobCancelled:
+        logger.info("Tâche annulée", extra={"job_id": job.id, "kind": job.kind})
+        shutil.rmtree(job_dir(job.id, job.attempt), ignore_errors=True)
+        job.result_file = None
+        job.finish("cancelled", message="Annulée")
+    except Exception as e:
+        shutil.rmtree(job_dir(job.id, job.attempt), ignore_errors=True)
+        job.result_file = None
+        if job.attempt < job.max_attempts:
+            logger.warning("Tâche en échec, nouvelle tentative: %s", e, extra={"job_id": job.id, "kind": job.kind, "attempt": job.attempt})
+            job.retry(f"Tentative {job.attempt} en échec: {e}")
+        else:
+            logger.exception("Tâche en échec", extra={"job_id": job.id, "kind": job.kind, "attempt": job.attempt})
+            job.finish("failed", message=str(e))
+    else:
+        logger.info("Tâche terminée", extra={"job_id": job.id, "kind": job.kind})
+        message = result.get("message") if isinstance(result, dict) else None
+        job.finish("succeeded", result=result, message=message or "Terminée")
+    finally:
+        done.set()
+        beat.join()
+
+
+def requeue_stale(conn) -> int:
+    """Running jobs whose heartbeat stopped (worker killed): queued again, or
+    failed after their last attempt"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE job SET
+                status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+                message = 'Worker arrêté pendant l''exécution',
+                run_after = now(),
+                finished_at = CASE WHEN attempts < max_attempts THEN NULL ELSE now() END,
+                expires_at = CASE WHEN attempts < max_attempts THEN NULL
+                                  ELSE now() + make_interval(hours => %s) END
+            WHERE status = 'running'
+              AND heartbeat_at < now() - make_interval(secs => %s)
+            RETURNING id, attempts
+        """, (settings.JOBS_RESULT_TTL_HOURS, settings.JOBS_STALE_SECONDS))
+        stale = cur.fetchall()
+    # Only the stale attempt's files: the next one may already be writing
+    for job_id, attempt in stale:
+        shutil.rmtree(job_dir(job_id, attempt), ignore_errors=True)
+    ids = [job_id for job_id, _ in stale]
+    if ids:
+        logger.warning("Tâches reprises après arrêt d'un worker", extra={"job_ids": ids})
+    return len(ids)
+
+
+def purge_expired(conn) -> int:
+    """Delete the expired jobs and their files"""
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM job WHERE expires_at < now() RETURNING id")
+        ids = [r[0] for r in cur.fetchall()]
+    for job_id in ids:
+        shutil.rmtree(job_dir(job_id), ignore_errors=True)
+    return len(ids)
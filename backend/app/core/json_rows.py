@@ -0,0 +1,155 @@
+"""
+Fast path and encodings of list responses.
+
+A list endpoint returning dicts pays, per row, the RealDictRow, a copy into
+a dict, the response_model validation and jsonable_encoder before the JSON
+encoder even starts. For large lists this Python work is most of the
+response time. Instead:
+
+    fmt = list_format(request)
+    cached = conditional(request, response, etag, fmt)
+    ...
+    cur = get_tuple_cursor(conn)
+    cur.execute(...)                      # aliases = keys of the response
+    return list_response(fmt, {"items": fetch_rows(cur), ...}, response)
+
+fetch_rows() keeps the plain tuples and the column names; list_response()
+encodes straight to bytes in the format the client asked for, with
+?format= or Accept:
+- json (default): array of objects, the shape existing clients read
+- columns (application/vnd.dpa.columns+json):
+  {"columns": ["id", ...], "data": [[1, ...], ...]}
+- msgpack (application/msgpack): the columnar shape in MessagePack
+Only the row sets (Rows) change shape; page, total, etc. stay as they are.
+
+JSON is encoded with orjson (json when it is not installed); msgpack is
+optional too. Values are encoded as the response_model=dict routes did:
+numeric (Decimal) as a string, date/datetime in ISO 8601.
+"""
+import datetime
+import json
+from decimal import Decimal
+from typing import Any, List, Optional, Sequence
+from fastapi import HTTPException, Request, Response
+
+try:
+    import orjson
+except ImportError:  # orjson is optional: stdlib json
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional: not offered
+    msgpack = None
+
+COLUMNS_MEDIA_TYPE = "application/vnd.dpa.columns+json"
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+
+# ?format= -> media type of the response
+FORMATS = {"json": "application/json", "columns": COLUMNS_MEDIA_TYPE, "msgpack": MSGPACK_MEDIA_TYPES[0]}
+
+
+class Rows:
+    """Row set: column names and tuples, turned into objects only for json"""
+    
+    def __init__(self, columns: Sequence[str], data: list):
+        self.columns = list(columns)
+        self.data = data
+    
+    @classmethod
+    def from_records(cls, records: List[dict], columns: Optional[Sequence[str]] = None) -> "Rows":
+        """Row set of dicts sharing the same keys (cached rows), limited to
+        `columns` when given"""
+        if columns is None:
+            columns = list(records[0]) if records else []
+            return cls(columns, [tuple(r.values()) for r in records])
+        return cls(columns, [tuple(r[c] for c in columns) for r in records])
+    
+    def __len__(self):
+        return len(self.data)
+    
+    def records(self) -> List[dict]:
+        return [dict(zip(self.columns, row)) for row in self.data]
+
+
+def fetch_rows(cur) -> Rows:
+    """Remaining rows of a tuple cursor"""
+    return Rows([column.name for column in cur.description], cur.fetchall())
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        # As pydantic: "30.00", not 30.0
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError(f"Type non sérialisable: {type(value).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _shape(content: Any, fmt: Optional[str]) -> Any:
+    """Row sets of `content` (itself or its top-level values) in the layout of fmt"""
+    if isinstance(content, Rows):
+        if fmt is None:
+            return content.records()
+        return {"columns": content.columns, "data": content.data}
+    if isinstance(content, dict):
+        return {key: _shape(value, fmt) for key, value in content.items()}
+    return content
+
+
+def _accepted(accept: str) -> List[str]:
+    """Media types of an Accept header, q=0 ones left out"""
+    accepted = []
+    for item in accept.split(","):
+        media_type, *params = item.split(";")
+        q = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            accepted.append(media_type.strip().lower())
+    return accepted
+
+
+def list_format(request: Request) -> Optional[str]:
+    """Format asked with ?format= or Accept; None for the default (json)"""
+    fmt = request.query_params.get("format")
+    if fmt is not None:
+        if fmt not in FORMATS:
+            raise HTTPException(status_code=400, detail=f"Format inconnu: {fmt} ({', '.join(FORMATS)})")
+        if fmt == "msgpack" and msgpack is None:
+            raise HTTPException(status_code=406, detail="MessagePack indisponible sur ce serveur")
+        return None if fmt == "json" else fmt
+    
+    for media_type in _accepted(request.headers.get("accept", "")):
+        if media_type in MSGPACK_MEDIA_TYPES and msgpack is not None:
+            return "msgpack"
+        if media_type == COLUMNS_MEDIA_TYPE:
+            return "columns"
+    return None
+
+
+def encode(fmt: Optional[str], content: Any) -> bytes:
+    content = _shape(content, fmt)
+    if fmt == "msgpack":
+        return msgpack.packb(content, default=_default, use_bin_type=True)
+    return dumps(content)
+
+
+def list_response(fmt: Optional[str], content: Any, response: Optional[Response] = None) -> Response:
+    """Response encoded in fmt (list_format()), with the headers set on the
+    endpoint's injected `response` (ETag of conditional()), which FastAPI
+    drops when an endpoint returns a Response itself"""
+    headers = dict(response.headers) if response is not None else {}
+    headers["Vary"] = "Accept"
+    return Response(encode(fmt, content), media_type=FORMATS[fmt or "json"], headers=headers)
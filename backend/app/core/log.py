@@ -0,0 +1,200 @@
+"""
+Structured logging.
+
+Loggers of the `app` package write one JSON object per line carrying the
+request id, the user and the route of the current request. Records are only
+enqueued by the calling thread; a QueueListener thread formats and writes
+them, so request handling never waits on stdout. When the queue is full
+records are dropped and counted rather than blocking.
+
+    logger = logging.getLogger(__name__)
+    logger.info("Import terminé", extra={"dotations": 12})
+
+Levels: LOG_LEVEL for the whole package, LOG_LEVELS for single modules
+({"app.api.dotation_import": "DEBUG"}). Per-row debug output goes through a
+RowSampler so large files log only a sample of their rows.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+from app.core.config import settings
+from app.core.metrics import route_path
+
+# Attributes of every LogRecord: anything else came through extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+_CONTEXT_ATTRS = ("request_id", "user", "route")
+
+
+class RequestContext:
+    __slots__ = ("request_id", "user", "scope")
+    
+    def __init__(self, request_id: str, scope):
+        self.request_id = request_id
+        self.user = None
+        self.scope = scope
+
+
+_context: ContextVar[Optional[RequestContext]] = ContextVar("dpa_log_context", default=None)
+
+
+def set_user(username: str):
+    """Called once the JWT is validated"""
+    context = _context.get()
+    if context is not None:
+        context.user = username
+
+
+class ContextFilter(logging.Filter):
+    """Copies the request context onto the record, in the calling thread"""
+    
+    def filter(self, record):
+        context = _context.get()
+        if context is not None:
+            record.request_id = context.request_id
+            record.user = context.user
+            record.route = route_path(context.scope) if "endpoint" in context.scope else context.scope["path"]
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for name in _CONTEXT_ATTRS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        for name, value in record.__dict__.items():
+            if name not in _RECORD_ATTRS and name not in _CONTEXT_ATTRS:
+                entry[name] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        elif record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Readable lines for local development (LOG_FORMAT=text)"""
+    
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+    
+    def format(self, record):
+        line = super().format(record)
+        request_id = getattr(record, "request_id", None)
+        return f"{line} [{request_id}]" if request_id else line
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: a full queue drops the record"""
+    
+    dropped = 0
+    
+    def prepare(self, record):
+        # Resolve the message and traceback now, the listener thread only
+        # formats; extra= attributes are kept for the JSON output
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+    
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+class RowSampler:
+    """Decides which rows of a file get per-row debug output: the first
+    `first` rows, then one every `every` rows (every=0: all rows)"""
+    
+    def __init__(self, logger: logging.Logger, first: int = None, every: int = None):
+        self.enabled = logger.isEnabledFor(logging.DEBUG)
+        self.first = settings.LOG_ROW_SAMPLE_FIRST if first is None else first
+        self.every = settings.LOG_ROW_SAMPLE_EVERY if every is None else every
+        self.count = 0
+    
+    def next(self) -> bool:
+        """True when the next row should be logged"""
+        if not self.enabled:
+            return False
+        self.count += 1
+        if self.count <= self.first or self.every <= 0:
+            return True
+        return (self.count - self.first) % self.every == 0
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging():
+    """Configure the `app` logger tree (idempotent)"""
+    global _listener
+    if _listener is not None:
+        return
+    
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(TextFormatter() if settings.LOG_FORMAT == "text" else JsonFormatter())
+    
+    handler = DroppingQueueHandler(queue.Queue(maxsize=settings.LOG_QUEUE_SIZE))
+    handler.addFilter(ContextFilter())
+    
+    logger = logging.getLogger("app")
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(settings.LOG_LEVEL.upper())
+    for name, level in settings.LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(level.upper())
+    
+    _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+class RequestContextMiddleware:
+    """ASGI middleware giving each request an id (X-Request-ID, reused when
+    the client sends one) for the log records it produces"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        if not request_id:
+            request_id = uuid.uuid4().hex[:16]
+        
+        token = _context.set(RequestContext(request_id, scope))
+        
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            _context.reset(token)
@@ -0,0 +1,256 @@
+"""
+Request timing and Prometheus metrics.
+
+TimingMiddleware measures every request, DB helpers report connection and
+query durations through record_connect()/observe_query(), and the /metrics
+endpoint renders everything in the Prometheus text format. Each request also
+gets a Server-Timing header (app, auth, db-connect, db) readable in the
+browser devtools.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative histogram with a fixed set of label names"""
+    
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...], buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last one is +Inf), sum, count]
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+    
+    def observe(self, value: float, *labels: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+    
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram"
+        ]
+        with self._lock:
+            snapshot = [(labels, list(s[0]), s[1], s[2]) for labels, s in self._series.items()]
+        
+        for labels, counts, total, count in sorted(snapshot):
+            base = ",".join(f'{n}="{escape_label(v)}"' for n, v in zip(self.labelnames, labels))
+            prefix = base + "," if base else ""
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+            suffix = "{" + base + "}" if base else ""
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+def escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REGISTRY: List[Histogram] = []
+
+HTTP_REQUEST = Histogram(
+    "dpa_http_request_duration_seconds", "Durée des requêtes HTTP",
+    ("method", "route", "status")
+)
+DB_QUERY = Histogram(
+    "dpa_db_query_duration_seconds", "Durée des requêtes SQL",
+    ("route", "statement")
+)
+DB_CONNECT = Histogram(
+    "dpa_db_connect_duration_seconds", "Durée d'ouverture des connexions PostgreSQL",
+    ("route",)
+)
+AUTH = Histogram(
+    "dpa_auth_duration_seconds", "Durée de validation du jeton JWT",
+    ("route",)
+)
+
+
+def render_metrics() -> str:
+    lines = []
+    for histogram in REGISTRY:
+        lines.extend(histogram.render())
+    return "\n".join(lines) + "\n"
+
+
+# ============= Per-request timings =============
+class RequestTimings:
+    """Time spent per phase during the current request"""
+    __slots__ = ("scope", "resolve", "_route", "phases")
+    
+    def __init__(self, scope, resolve):
+        self.scope = scope
+        self.resolve = resolve
+        self._route = None
+        # phase -> [duration, count]
+        self.phases: Dict[str, list] = {}
+    
+    @property
+    def route(self) -> str:
+        """Path template, known once the router has matched the request"""
+        if self._route is None:
+            if "endpoint" not in self.scope:
+                return "-"
+            self._route = self.resolve(self.scope)
+        return self._route
+    
+    def add(self, phase: str, duration: float):
+        entry = self.phases.get(phase)
+        if entry is None:
+            self.phases[phase] = [duration, 1]
+        else:
+            entry[0] += duration
+            entry[1] += 1
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("dpa_request_timings", default=None)
+
+
+def current_route() -> str:
+    timings = _current.get()
+    return timings.route if timings is not None else "-"
+
+
+def observe_query(query, duration: float):
+    """Called by the DB cursor after every statement"""
+    if not settings.METRICS_ENABLED:
+        return
+    timings = _current.get()
+    route = "-"
+    if timings is not None:
+        timings.add("db", duration)
+        route = timings.route
+    DB_QUERY.observe(duration, route, statement_type(query))
+
+
+def record_connect(duration: float):
+    """Called by get_db() after opening a connection"""
+    if not settings.METRICS_ENABLED:
+        return
+    timings = _current.get()
+    route = "-"
+    if timings is not None:
+        timings.add("db-connect", duration)
+        route = timings.route
+    DB_CONNECT.observe(duration, route)
+
+
+def record_queue(duration: float):
+    """Called by the admission middleware once the request is admitted"""
+    if not settings.METRICS_ENABLED:
+        return
+    timings = _current.get()
+    if timings is not None:
+        timings.add("queue", duration)
+
+
+@contextmanager
+def timed_auth():
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if settings.METRICS_ENABLED:
+            duration = time.perf_counter() - start
+            timings = _current.get()
+            if timings is not None:
+                timings.add("auth", duration)
+            AUTH.observe(duration, current_route())
+
+
+def statement_type(query) -> str:
+    """SELECT / INSERT / UPDATE / DELETE / WITH ... (low cardinality label)"""
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    elif not isinstance(query, str):
+        # psycopg2.sql.Composed and friends
+        return "OTHER"
+    words = query.lstrip().split(None, 1)
+    if not words:
+        return "OTHER"
+    keyword = words[0].upper()
+    return keyword if keyword in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH") else "OTHER"
+
+
+# ============= Middleware =============
+_routes: Dict[object, str] = {}
+
+
+def route_path(scope) -> str:
+    """Path template of the matched route (bounded label cardinality)"""
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    path = _routes.get(endpoint)
+    if path is None:
+        for route in scope["app"].routes:
+            if getattr(route, "endpoint", None) is endpoint:
+                path = route.path
+                break
+        else:
+            path = "unmatched"
+        _routes[endpoint] = path
+    return path
+
+
+class TimingMiddleware:
+    """ASGI middleware timing each request and adding a Server-Timing header"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        timings = RequestTimings(scope, route_path)
+        token = _current.set(timings)
+        start = time.perf_counter()
+        status = 500
+        
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                header = server_timing(timings, time.perf_counter() - start)
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header.encode("latin-1"))]
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            route = timings.route if "endpoint" in scope else "unmatched"
+            HTTP_REQUEST.observe(time.perf_counter() - start, scope["method"], route, str(status))
+            _current.reset(token)
+
+
+def server_timing(timings: RequestTimings, total: float) -> str:
+    parts = [f"app;dur={total * 1000:.1f}"]
+    for phase, (duration, count) in timings.phases.items():
+        if count > 1:
+            parts.append(f'{phase};dur={duration * 1000:.1f};desc="{count}x"')
+        else:
+            parts.append(f"{phase};dur={duration * 1000:.1f}")
+    return ", ".join(parts)
@@ -0,0 +1,103 @@
+"""
+Postgres LISTEN/NOTIFY listener.
+
+One background thread per process holds a dedicated connection, LISTENs on
+every channel registered with subscribe() and calls the callbacks with the
+notification payload. In-process caches rely on it to stay fresh across
+uvicorn workers: they must only serve from memory while healthy() is true.
+
+Notifications sent while the connection was down are lost, so after every
+(re)connection the callbacks are called with payload None, meaning
+"anything may have changed".
+"""
+import logging
+import select
+import threading
+from typing import Callable, Dict, List, Optional
+import psycopg2
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Wake-up interval of the listener thread (stop requests, dead connections)
+POLL_SECONDS = 5.0
+RETRY_SECONDS = (1, 2, 5, 10, 30)
+
+_callbacks: Dict[str, List[Callable[[Optional[str]], None]]] = {}
+_thread: Optional[threading.Thread] = None
+_stop = threading.Event()
+_connected = threading.Event()
+
+
+def subscribe(channel: str, callback: Callable[[Optional[str]], None]):
+    """Register before start(); channel must be a plain identifier"""
+    _callbacks.setdefault(channel, []).append(callback)
+
+
+def healthy() -> bool:
+    """True while notifications are being received"""
+    return _connected.is_set()
+
+
+def start():
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_run, name="pg-listener", daemon=True)
+    _thread.start()
+    # Serve from the caches as soon as the first connection is up
+    _connected.wait(timeout=5)
+
+
+def stop():
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout=POLL_SECONDS + 1)
+
+
+def _dispatch(channel: str, payload: Optional[str]):
+    for callback in _callbacks.get(channel, []):
+        try:
+            callback(payload)
+        except Exception:
+            logger.exception("Erreur dans le callback NOTIFY", extra={"channel": channel})
+
+
+def _run():
+    attempt = 0
+    while not _stop.is_set():
+        conn = None
+        try:
+            conn = psycopg2.connect(settings.DATABASE_URL)
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                for channel in _callbacks:
+                    cur.execute(f"LISTEN {channel}")
+            
+            # Missed notifications: every subscriber resyncs
+            for channel in _callbacks:
+                _dispatch(channel, None)
+            _connected.set()
+            attempt = 0
+            
+            while not _stop.is_set():
+                if select.select([conn], [], [], POLL_SECONDS) == ([], [], []):
+                    # Idle: make sure the connection is still alive
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT 1")
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    _dispatch(notify.channel, notify.payload)
+        except Exception as e:
+            _connected.clear()
+            delay = RETRY_SECONDS[min(attempt, len(RETRY_SECONDS) - 1)]
+            attempt += 1
+            logger.warning("Connexion LISTEN perdue, nouvelle tentative dans %ss: %s", delay, e)
+            _stop.wait(delay)
+        finally:
+            _connected.clear()
+            if conn is not None:
+                conn.close()
@@ -0,0 +1,302 @@
+"""
+On-demand request profiler.
+
+An admin adds `?profile=1` (or the header `X-Profile: 1`) to any API call:
+the request runs under a sampling profiler and the call tree is returned
+instead of the normal body. `profile=save` keeps the normal response and
+only adds an `X-Profile-Id` header. Every profile is stored as JSON in
+PROFILE_DIR (at most PROFILE_STORE_MAX files) and can be listed, fetched
+in the folded-stack format (flamegraph.pl, speedscope) and compared from
+/api/admin/profiles.
+
+Only the event loop thread is sampled: time spent in sync dependencies run
+in the threadpool shows up as the loop waiting. Requests without the flag
+only pay for a substring test. One request is profiled at a time per
+worker (the samples of two would mix): another flagged request gets a 409.
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+from app.core import user_cache
+from app.core.config import settings
+from app.core.security import decode_access_token
+
+IDLE = "(boucle inactive / autres tâches)"
+
+_ID_RE = re.compile(r"^[0-9]{8}-[0-9]{6}-[0-9a-f]{6}$")
+
+# Held while a request runs under the Sampler
+_busy = threading.Lock()
+
+
+class Sampler(threading.Thread):
+    """Samples the stack of one thread every `interval` seconds"""
+    
+    def __init__(self, thread_id: int, interval: float, root_code):
+        super().__init__(name="request-profiler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.root_code = root_code
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+    
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                # Frames above the profiled request belong to the event loop
+                if code is self.root_code:
+                    break
+                stack.append(f"{code.co_name} ({short_path(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            else:
+                stack = [IDLE]
+            stack.reverse()
+            self.stacks[tuple(stack)] += 1
+    
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def short_path(filename: str) -> str:
+    """app/... for our code, package/... for site-packages, basename otherwise"""
+    filename = filename.replace("\\", "/")
+    for marker in ("/site-packages/", "/backend/"):
+        index = filename.rfind(marker)
+        if index >= 0:
+            return filename[index + len(marker):]
+    return os.path.basename(filename)
+
+
+def build_tree(stacks: Counter, total: int, min_pct: float = 0.5) -> dict:
+    """Call tree {name, total, self, children}; nodes under min_pct are folded"""
+    root = {"name": "request", "total": 0, "self": 0, "children": {}}
+    for stack, count in stacks.items():
+        root["total"] += count
+        node = root
+        for name in stack:
+            child = node["children"].get(name)
+            if child is None:
+                child = node["children"][name] = {"name": name, "total": 0, "self": 0, "children": {}}
+            child["total"] += count
+            node = child
+        node["self"] += count
+    
+    threshold = total * min_pct / 100
+    
+    def finish(node):
+        children = sorted(node["children"].values(), key=lambda c: c["total"], reverse=True)
+        kept = [finish(c) for c in children if c["total"] >= threshold]
+        folded = sum(c["total"] for c in children if c["total"] < threshold)
+        return {
+            "name": node["name"],
+            "total": node["total"],
+            "self": node["self"] + folded,
+            "pct": round(100.0 * node["total"] / total, 1) if total else 0.0,
+            "children": kept
+        }
+    
+    return finish(root)
+
+
+def self_time(stacks: Dict[str, int]) -> Dict[str, int]:
+    """Samples per function at the top of the stack (folded format input)"""
+    result = Counter()
+    for stack, count in stacks.items():
+        result[stack.rsplit(";", 1)[-1]] += count
+    return result
+
+
+# ============= Store =============
+def _path(profile_id: str) -> str:
+    return os.path.join(settings.PROFILE_DIR, f"{profile_id}.json")
+
+
+def save_profile(report: dict):
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    with open(_path(report["id"]), "w", encoding="utf-8") as f:
+        json.dump(report, f)
+    
+    # Keep the newest PROFILE_STORE_MAX profiles (ids sort by date)
+    files = sorted(f for f in os.listdir(settings.PROFILE_DIR) if f.endswith(".json"))
+    for name in files[:-settings.PROFILE_STORE_MAX]:
+        try:
+            os.remove(os.path.join(settings.PROFILE_DIR, name))
+        except OSError:
+            pass
+
+
+def load_profile(profile_id: str) -> Optional[dict]:
+    if not _ID_RE.match(profile_id):
+        return None
+    try:
+        with open(_path(profile_id), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def delete_profile(profile_id: str) -> bool:
+    if not _ID_RE.match(profile_id):
+        return False
+    try:
+        os.remove(_path(profile_id))
+        return True
+    except OSError:
+        return False
+
+
+def list_profiles() -> List[dict]:
+    if not os.path.isdir(settings.PROFILE_DIR):
+        return []
+    summaries = []
+    for name in sorted(os.listdir(settings.PROFILE_DIR), reverse=True):
+        if not name.endswith(".json"):
+            continue
+        report = load_profile(name[:-5])
+        if report is not None:
+            summaries.append({k: report[k] for k in ("id", "created_at", "method", "path", "status", "duration_ms", "samples")})
+    return summaries
+
+
+def compare_profiles(a: dict, b: dict, limit: int = 30) -> List[dict]:
+    """Share of samples per function in a and b, biggest changes first"""
+    self_a = self_time(a["folded"])
+    self_b = self_time(b["folded"])
+    total_a = sum(self_a.values()) or 1
+    total_b = sum(self_b.values()) or 1
+    rows = []
+    for name in set(self_a) | set(self_b):
+        pct_a = 100.0 * self_a.get(name, 0) / total_a
+        pct_b = 100.0 * self_b.get(name, 0) / total_b
+        rows.append({
+            "function": name,
+            "a_pct": round(pct_a, 1),
+            "b_pct": round(pct_b, 1),
+            "delta_pct": round(pct_b - pct_a, 1)
+        })
+    rows.sort(key=lambda r: abs(r["delta_pct"]), reverse=True)
+    return rows[:limit]
+
+
+# ============= Middleware =============
+def profile_mode(scope) -> Optional[str]:
+    """'report' / 'save' when profiling was requested, else None"""
+    query = scope.get("query_string", b"")
+    value = None
+    if b"profile=" in query:
+        for part in query.split(b"&"):
+            if part.startswith(b"profile="):
+                value = part[8:]
+    else:
+        for name, header_value in scope["headers"]:
+            if name == b"x-profile":
+                value = header_value
+    if value is None or value in (b"", b"0", b"false"):
+        return None
+    return "save" if value == b"save" else "report"
+
+
+def is_admin(scope) -> bool:
+    """Same checks as get_current_user(): the current status and role of the
+    user (user_cache, may query the database), not the ones in the token"""
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer":
+                return False
+            payload = decode_access_token(token)
+            # Stream tickets carry a scope and open nothing else
+            if payload is None or payload.get("scope") is not None or payload.get("sub") is None:
+                return False
+            user = user_cache.get_user(payload["sub"])
+            return user is not None and user['statut'] == 'ACTIF' and user['role'] == 'ADMIN'
+    return False
+
+
+class ProfilerMiddleware:
+    """ASGI middleware running flagged admin requests under the Sampler"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        mode = profile_mode(scope)
+        if mode is None or not await run_in_threadpool(is_admin, scope):
+            await self.app(scope, receive, send)
+            return
+        
+        if not _busy.acquire(blocking=False):
+            response = JSONResponse({"detail": "Un profilage est déjà en cours, réessayez"}, status_code=409)
+            await response(scope, receive, send)
+            return
+        try:
+            await self._profile(scope, receive, send, mode)
+        finally:
+            _busy.release()
+    
+    async def _profile(self, scope, receive, send, mode: str):
+        profile_id = f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}"
+        response = {"status": None}
+        
+        async def send_profiled(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                if mode == "save":
+                    message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            if mode == "save":
+                await send(message)
+        
+        sampler = Sampler(threading.get_ident(), settings.PROFILE_INTERVAL_MS / 1000, ProfilerMiddleware._profile.__code__)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            sampler.stop()
+            duration = time.perf_counter() - start
+        
+        samples = sum(sampler.stacks.values())
+        report = {
+            "id": profile_id,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "method": scope["method"],
+            "path": scope["path"],
+            "query": scope.get("query_string", b"").decode("latin-1"),
+            "status": response["status"],
+            "duration_ms": round(duration * 1000, 1),
+            "interval_ms": settings.PROFILE_INTERVAL_MS,
+            "samples": samples,
+            "tree": build_tree(sampler.stacks, samples),
+            "folded": {";".join(stack): count for stack, count in sampler.stacks.items()}
+        }
+        save_profile(report)
+        
+        if mode == "report":
+            body = json.dumps(report).encode("utf-8")
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"x-profile-id", profile_id.encode())
+                ]
+            })
+            await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,132 @@
+"""
+In-process cache of the reference tables (service, vehicule, benificiaire).
+
+The tables are loaded on startup and kept as immutable snapshots. Triggers
+of migration 006 send NOTIFY dpa_ref with the table name on every write, in
+any process; the snapshot is then marked stale and reloaded by the next read.
+While the listener is disconnected every read reloads its table, so a write
+is never missed.
+
+Each snapshot has a version, a digest of its rows: identical in every worker
+holding the same data, it can be used as an ETag.
+
+vehicule.km is left out: every bon updates it (migration 014 notifies only
+writes of the cached columns). With CACHE_ENABLED off nothing is listened
+to: the endpoints check enabled() and query the database instead, as they
+do while the listener is disconnected.
+
+Snapshot rows are shared between requests and must not be modified.
+"""
+import hashlib
+import re
+import threading
+from typing import Dict, List, Optional
+from app.core import notify
+from app.core.config import settings
+from app.db.database import get_db, get_db_cursor
+
+CHANNEL = "dpa_ref"
+
+
+class Snapshot:
+    __slots__ = ("rows", "by_id", "version")
+    
+    def __init__(self, rows: List[dict]):
+        self.rows = rows
+        self.by_id = {row['id']: row for row in rows}
+        self.version = hashlib.blake2b(repr(rows).encode(), digest_size=8).hexdigest()
+
+
+class Table:
+    def __init__(self, name: str, query: str):
+        self.name = name
+        self.query = query
+        self._snapshot: Optional[Snapshot] = None
+        self._stale = True
+        self._loads = 0
+        self._lock = threading.Lock()
+    
+    def invalidate(self):
+        self._stale = True
+    
+    def _fresh(self) -> bool:
+        return self._snapshot is not None and not self._stale and notify.healthy()
+    
+    def snapshot(self) -> Snapshot:
+        if self._fresh():
+            return self._snapshot
+        
+        loads = self._loads
+        with self._lock:
+            # Loaded by another request while this one was waiting
+            if self._fresh() or (self._loads != loads and self._snapshot is not None):
+                return self._snapshot
+            # Cleared first: a NOTIFY received during the load marks it stale again
+            self._stale = False
+            with get_db() as conn:
+                cur = get_db_cursor(conn)
+                cur.execute(self.query)
+                rows = [dict(r) for r in cur.fetchall()]
+            self._snapshot = Snapshot(rows)
+            self._loads += 1
+            return self._snapshot
+
+
+SERVICES = Table("service", "SELECT * FROM service ORDER BY direction, nom")
+VEHICULES = Table("vehicule", "SELECT id, police, ncivil, marque, carburant, actif, created_at FROM vehicule ORDER BY police")
+BENIFICIAIRES = Table("benificiaire", "SELECT * FROM benificiaire ORDER BY nom, id")
+
+TABLES: Dict[str, Table] = {t.name: t for t in (SERVICES, VEHICULES, BENIFICIAIRES)}
+
+
+def enabled() -> bool:
+    """Whether endpoints read the snapshots; otherwise every snapshot() would
+    reload its whole table, and the targeted queries are cheaper"""
+    return settings.CACHE_ENABLED and notify.healthy()
+
+
+def load():
+    """Startup: load every table"""
+    for table in TABLES.values():
+        table.snapshot()
+
+
+def invalidate(payload: Optional[str]):
+    """NOTIFY callback: payload is a table name, '*' or None (resync) for all"""
+    table = TABLES.get(payload) if payload else None
+    if table is not None:
+        table.invalidate()
+    else:
+        for table in TABLES.values():
+            table.invalidate()
+
+
+def etag(*snapshots: Snapshot, live=None) -> str:
+    """ETag of a response computed from these snapshots, and from the values
+    read outside of them (live, e.g. the km of a page) if any"""
+    versions = [s.version for s in snapshots]
+    if live is not None:
+        versions.append(hashlib.blake2b(repr(live).encode(), digest_size=8).hexdigest())
+    return '"' + "-".join(versions) + '"'
+
+def ilike(search: str):
+    """Matcher equivalent to `column ILIKE '%search%'` (None never matches)"""
+    pattern = []
+    escaped = False
+    for char in search:
+        if escaped:
+            pattern.append(re.escape(char))
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == "%":
+            pattern.append(".*")
+        elif char == "_":
+            pattern.append(".")
+        else:
+            pattern.append(re.escape(char))
+    regex = re.compile("".join(pattern), re.IGNORECASE | re.DOTALL)
+    return lambda value: value is not None and regex.search(value) is not None
+
+
+notify.subscribe(CHANNEL, invalidate)
@@ -0,0 +1,307 @@
+"""
+In-process scheduler of the maintenance tasks (migration 011).
+
+Tasks are plain functions registered with a cron spec (minute hour
+day-of-month month day-of-week, local time; *, lists, ranges and steps):
+
+    @scheduler.scheduled("reconcile_dotations", "30 2 * * *")
+    def nightly_reconciliation():
+        ...
+        return {"mismatches": 3}
+
+Every uvicorn worker runs a scheduler thread. Each tick, a thread that is
+not the leader tries pg_try_advisory_lock() on its own connection; the one
+that gets it leads until its connection closes (process stopped, network
+lost), then another takes over at its next tick. Only the leader runs the
+due tasks, one at a time, in its thread.
+
+A run is claimed by inserting its (task, slot) row in scheduler_run, so a
+slot never runs twice, even across a change of leader. A slot missed while
+there was no leader is still run within SCHEDULER_MISFIRE_SECONDS; older
+ones are skipped. settings.SCHEDULES overrides the specs ("" disables).
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional
+import psycopg2
+from psycopg2.extras import Json, RealDictCursor
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = "dpa_scheduler"
+RETRY_SECONDS = (1, 2, 5, 10, 30)
+
+# Field ranges of a cron spec; day-of-week 0 (or 7) is Sunday
+_FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 7))
+# Farthest day searched for a slot (Feb 29 on a given weekday)
+_MAX_DAYS = 366 * 28
+
+
+class Cron:
+    """Parsed 5-field cron spec"""
+    
+    def __init__(self, spec: str):
+        parts = spec.split()
+        if len(parts) != 5:
+            raise ValueError(f"Expression cron invalide (5 champs attendus): {spec!r}")
+        self.spec = spec
+        values = [self._field(part, low, high) for part, (_, low, high) in zip(parts, _FIELDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = values
+        self.weekdays = {d % 7 for d in weekdays}
+        # Vixie cron: with both restricted, a day matches either of them
+        self.any_day = parts[2] == "*"
+        self.any_weekday = parts[4] == "*"
+    
+    @staticmethod
+    def _field(part: str, low: int, high: int) -> List[int]:
+        values = set()
+        for item in part.split(","):
+            expr, _, step = item.partition("/")
+            if expr == "*":
+                start, end = low, high
+            elif "-" in expr:
+                start, end = (int(v) for v in expr.split("-", 1))
+            else:
+                start = end = int(expr)
+                if step:
+                    end = high
+            if start < low or end > high or start > end:
+                raise ValueError(f"Valeur hors limites ({low}-{high}): {item!r}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return sorted(values)
+    
+    def _day_matches(self, day: date) -> bool:
+        if day.month not in self.months:
+            return False
+        in_days = day.day in self.days
+        in_weekdays = day.isoweekday() % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return in_days and in_weekdays
+        return in_days or in_weekdays
+    
+    def previous(self, moment: datetime) -> Optional[datetime]:
+        """Latest slot at or before `moment`"""
+        moment = moment.replace(second=0, microsecond=0)
+        day = moment.date()
+        for _ in range(_MAX_DAYS):
+            if self._day_matches(day):
+                for hour in reversed(self.hours):
+                    for minute in reversed(self.minutes):
+                        slot = datetime(day.year, day.month, day.day, hour, minute)
+                        if slot <= moment:
+                            return slot
+            day -= timedelta(days=1)
+        return None
+    
+    def next(self, moment: datetime) -> Optional[datetime]:
+        """First slot after `moment`"""
+        day = moment.date()
+        for _ in range(_MAX_DAYS):
+            if self._day_matches(day):
+                for hour in self.hours:
+                    for minute in self.minutes:
+                        slot = datetime(day.year, day.month, day.day, hour, minute)
+                        if slot > moment:
+                            return slot
+            day += timedelta(days=1)
+        return None
+
+
+class Schedule:
+    def __init__(self, name: str, default_spec: str, fn: Callable):
+        self.name = name
+        self.default_spec = default_spec
+        self.fn = fn
+    
+    @property
+    def cron(self) -> Optional[Cron]:
+        """None when disabled in settings.SCHEDULES"""
+        spec = settings.SCHEDULES.get(self.name, self.default_spec)
+        return Cron(spec) if spec else None
+
+
+SCHEDULES: Dict[str, Schedule] = {}
+
+_thread: Optional[threading.Thread] = None
+_stop = threading.Event()
+_leader = threading.Event()
+
+
+def scheduled(name: str, spec: str):
+    """Register fn() as the task `name`, run at the slots of `spec`"""
+    Cron(spec)
+    
+    def register(fn):
+        SCHEDULES[name] = Schedule(name, spec, fn)
+        return fn
+    return register
+
+
+def is_leader() -> bool:
+    return _leader.is_set()
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def start():
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_run, name="scheduler", daemon=True)
+    _thread.start()
+
+
+def stop():
+    _stop.set()
+    if _thread is not None:
+        # A running task is not interrupted: the daemon thread ends with the process
+        _thread.join(timeout=5)
+
+
+def _due(conn, now: datetime) -> List[tuple]:
+    """(schedule, slot) of the latest slot of every task not run yet"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT task, MAX(scheduled_for) FROM scheduler_run GROUP BY task")
+        last = dict(cur.fetchall())
+    
+    due = []
+    for schedule in SCHEDULES.values():
+        cron = schedule.cron
+        slot = cron.previous(now) if cron else None
+        if slot is None or (last.get(schedule.name) and slot <= last[schedule.name]):
+            continue
+        if (now - slot).total_seconds() > settings.SCHEDULER_MISFIRE_SECONDS:
+            continue
+        due.append((schedule, slot))
+    return due
+
+
+def run_task(conn, schedule: Schedule, slot: datetime) -> Optional[str]:
+    """Claim and run one slot of a task; its final status, None if already claimed"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO scheduler_run (task, scheduled_for, worker)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (task, scheduled_for) DO NOTHING
+            RETURNING id
+        """, (schedule.name, slot, worker_name()))
+        claimed = cur.fetchone()
+    if claimed is None:
+        return None
+    
+    logger.info("Tâche planifiée démarrée", extra={"task": schedule.name, "slot": slot.isoformat()})
+    started = time.perf_counter()
+    outcome, result, error = "succeeded", None, None
+    try:
+        result = schedule.fn()
+    except Exception as e:
+        outcome, error = "failed", str(e)
+        logger.exception("Tâche planifiée en échec", extra={"task": schedule.name, "slot": slot.isoformat()})
+    duration_ms = int((time.perf_counter() - started) * 1000)
+    
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE scheduler_run SET
+                status = %s,
+                finished_at = now(),
+                duration_ms = %s,
+                result = %s,
+                error = %s
+            WHERE id = %s
+        """, (outcome, duration_ms, Json(result) if result is not None else None, error, claimed[0]))
+        cur.execute(
+            "DELETE FROM scheduler_run WHERE started_at < now() - make_interval(days => %s)",
+            (settings.SCHEDULER_HISTORY_DAYS,)
+        )
+    if outcome == "succeeded":
+        logger.info("Tâche planifiée terminée", extra={"task": schedule.name, "duration_ms": duration_ms})
+    return outcome
+
+
+def _run():
+    attempt = 0
+    while not _stop.is_set():
+        conn = None
+        try:
+            conn = psycopg2.connect(settings.DATABASE_URL, application_name=f"dpa-scheduler {worker_name()}")
+            conn.autocommit = True
+            attempt = 0
+            
+            while not _stop.is_set():
+                if not _leader.is_set():
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (LOCK_KEY,))
+                        if cur.fetchone()[0]:
+                            _leader.set()
+                            logger.info("Planificateur élu", extra={"worker": worker_name()})
+                
+                if _leader.is_set():
+                    for schedule, slot in _due(conn, datetime.now()):
+                        if _stop.is_set():
+                            break
+                        run_task(conn, schedule, slot)
+                else:
+                    # Keep the connection checked while waiting for the lock
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT 1")
+                _stop.wait(settings.SCHEDULER_TICK_SECONDS)
+        except Exception as e:
+            delay = RETRY_SECONDS[min(attempt, len(RETRY_SECONDS) - 1)]
+            attempt += 1
+            logger.warning("Connexion du planificateur perdue, nouvelle tentative dans %ss: %s", delay, e)
+            _stop.wait(delay)
+        finally:
+            # Closing the connection releases the lock: another worker takes over
+            _leader.clear()
+            if conn is not None:
+                conn.close()
+
+
+def status(conn) -> dict:
+    """Leader and tasks (spec, next slot, last run) for the admin endpoint"""
+    cur = conn.cursor(cursor_factory=RealDictCursor)
+    cur.execute("""
+        SELECT a.application_name, a.client_addr, a.backend_start
+        FROM pg_locks l
+        JOIN pg_stat_activity a ON a.pid = l.pid
+        WHERE l.locktype = 'advisory' AND l.granted
+          AND l.objsubid = 1
+          AND l.classid = ((hashtext(%s)::bigint >> 32) & 4294967295)::oid
+          AND l.objid = (hashtext(%s)::bigint & 4294967295)::oid
+    """, (LOCK_KEY, LOCK_KEY))
+    holder = cur.fetchone()
+    
+    cur.execute("""
+        SELECT DISTINCT ON (task)
+            task, scheduled_for, status, worker, started_at, finished_at, duration_ms, error
+        FROM scheduler_run
+        ORDER BY task, scheduled_for DESC
+    """)
+    last = {r['task']: dict(r) for r in cur.fetchall()}
+    
+    now = datetime.now()
+    tasks = []
+    for schedule in SCHEDULES.values():
+        cron = schedule.cron
+        tasks.append({
+            "task": schedule.name,
+            "spec": cron.spec if cron else None,
+            "enabled": cron is not None,
+            "next_run": cron.next(now) if cron else None,
+            "last_run": last.get(schedule.name)
+        })
+    return {
+        "enabled": settings.SCHEDULER_ENABLED,
+        "leader": holder["application_name"].removeprefix("dpa-scheduler ") if holder else None,
+        "this_worker": worker_name(),
+        "is_leader": is_leader(),
+        "tasks": tasks
+    }
@@ -1,10 +1,20 @@
+import asyncio
+import hmac
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from app.core.config import settings
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
+
+# bcrypt variants accepted in users.password ($2y$ comes from the PHP version)
+BCRYPT_PREFIXES = ("$2a$", "$2b$", "$2y$")
+
+# bcrypt releases the GIL: checks run in parallel here, off the event loop
+_hash_pool = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_hash_pending = 0
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create JWT access token"""
@@ -32,4 +42,42 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
 def get_password_hash(password: str) -> str:
     """Hash a password"""
-    return pwd_context.hash(password)
\ No newline at end of file
+    return pwd_context.hash(password)
+
+def check_password(plain_password: str, stored: Optional[str]) -> Tuple[bool, Optional[str]]:
+    """Verify a password against users.password (bcrypt hash, or plain text
+    from the v3.0 database). Returns (ok, new_hash): new_hash is set when the
+    stored value must be replaced (plain text, $2a$/$2y$ or outdated cost).
+    CPU-bound: call check_password_off_loop() from request handlers."""
+    if stored is None:
+        # Unknown user: same cost as a real check
+        pwd_context.dummy_verify()
+        return False, None
+    
+    if not stored.startswith(BCRYPT_PREFIXES):
+        ok = hmac.compare_digest(plain_password.encode("utf-8"), stored.encode("utf-8"))
+        return ok, get_password_hash(plain_password) if ok else None
+    
+    try:
+        ok = pwd_context.verify(plain_password, stored)
+    except ValueError:
+        return False, None
+    if ok and (not stored.startswith("$2b$") or pwd_context.needs_update(stored)):
+        return True, get_password_hash(plain_password)
+    return ok, None
+
+class PasswordCheckBusy(Exception):
+    """More than PASSWORD_HASH_MAX_PENDING checks are already waiting"""
+
+async def check_password_off_loop(plain_password: str, stored: Optional[str]) -> Tuple[bool, Optional[str]]:
+    """check_password() in the password-hash pool, so a login never stalls
+    the event loop; raises PasswordCheckBusy instead of queueing without bound"""
+    global _hash_pending
+    if _hash_pending >= settings.PASSWORD_HASH_MAX_PENDING:
+        raise PasswordCheckBusy()
+    _hash_pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_hash_pool, check_password, plain_password, stored)
+    finally:
+        _hash_pending -= 1
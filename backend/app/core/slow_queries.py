@@ -0,0 +1,215 @@
+"""
+Slow-query capture.
+
+The timed cursors hand every statement slower than SLOW_QUERY_THRESHOLD_MS to
+capture(): the parameterized SQL, the shape of its parameters, the route and
+an EXPLAIN (FORMAT JSON) plan are kept in a bounded in-memory ring buffer
+and, with SLOW_QUERY_LOG_TABLE, written to slow_query_log by a background
+thread. /api/admin/slow-queries groups them by statement fingerprint.
+"""
+import hashlib
+import json
+import logging
+import queue
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+import psycopg2
+from psycopg2 import extensions
+from app.core.config import settings
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+# A fingerprint is explained again at most this often
+EXPLAIN_INTERVAL_SECONDS = 300
+
+_buffer = deque(maxlen=settings.SLOW_QUERY_BUFFER_SIZE)
+_buffer_lock = threading.Lock()
+# fingerprint -> (explained_at, plan)
+_plans = {}
+
+_PARAM_RE = re.compile(r"%\(\w+\)s|%s")
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+def normalize(query: str) -> str:
+    """SQL text with parameters and literals replaced by ?"""
+    text = _PARAM_RE.sub("?", query)
+    text = _STRING_RE.sub("?", text)
+    text = _NUMBER_RE.sub("?", text)
+    text = _IN_LIST_RE.sub("(?)", text)
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+def fingerprint(normalized: str) -> str:
+    return hashlib.md5(normalized.lower().encode("utf-8")).hexdigest()[:16]
+
+
+def bind_shape(value):
+    """Type of a bind parameter - values themselves are never stored"""
+    if isinstance(value, (list, tuple)):
+        types = sorted({type(v).__name__ for v in value})
+        return f"{'|'.join(types) or 'empty'}[{len(value)}]"
+    return type(value).__name__
+
+
+def bind_shapes(vars):
+    if vars is None:
+        return None
+    if isinstance(vars, dict):
+        return {k: bind_shape(v) for k, v in vars.items()}
+    return [bind_shape(v) for v in vars]
+
+
+def explain(cursor, query: str, vars):
+    """EXPLAIN on a separate cursor of the same connection, inside a savepoint
+    so a failing EXPLAIN never aborts the caller's transaction"""
+    conn = cursor.connection
+    in_transaction = conn.get_transaction_status() == extensions.TRANSACTION_STATUS_INTRANS
+    explain_cur = conn.cursor()
+    try:
+        if in_transaction:
+            explain_cur.execute("SAVEPOINT slow_query_explain")
+        try:
+            explain_cur.execute("EXPLAIN (FORMAT JSON) " + query, vars)
+            plan = explain_cur.fetchone()[0]
+        except psycopg2.Error as e:
+            plan = {"error": str(e).strip()}
+            if in_transaction:
+                explain_cur.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+        if in_transaction:
+            explain_cur.execute("RELEASE SAVEPOINT slow_query_explain")
+        return plan
+    finally:
+        explain_cur.close()
+
+
+def capture(cursor, query, vars, duration: float, many: bool = False):
+    """Record a statement that exceeded the threshold (many: executemany, vars
+    is then the first parameter set and no plan is taken)"""
+    if not isinstance(query, str):
+        query = query.as_string(cursor.connection) if hasattr(query, "as_string") else query.decode("utf-8", "replace")
+    
+    normalized = normalize(query)
+    key = fingerprint(normalized)
+    
+    plan = None
+    if metrics.statement_type(query) in EXPLAINABLE and not many:
+        cached = _plans.get(key)
+        if cached is not None and time.monotonic() - cached[0] < EXPLAIN_INTERVAL_SECONDS:
+            plan = cached[1]
+        else:
+            plan = explain(cursor, query, vars)
+            _plans[key] = (time.monotonic(), plan)
+    
+    entry = {
+        "captured_at": datetime.now().isoformat(timespec="seconds"),
+        "fingerprint": key,
+        "route": metrics.current_route(),
+        "duration_ms": round(duration * 1000, 1),
+        "query": normalized,
+        "bind_shapes": bind_shapes(vars),
+        "plan": plan
+    }
+    
+    with _buffer_lock:
+        _buffer.append(entry)
+    
+    if settings.SLOW_QUERY_LOG_TABLE:
+        _enqueue(entry)
+
+
+def entries():
+    with _buffer_lock:
+        return list(_buffer)
+
+
+def clear():
+    with _buffer_lock:
+        _buffer.clear()
+    _plans.clear()
+
+
+def worst_offenders(limit: int = 20):
+    """Buffered entries grouped by fingerprint, highest total time first"""
+    groups = {}
+    for e in entries():
+        g = groups.get(e["fingerprint"])
+        if g is None:
+            g = groups[e["fingerprint"]] = {
+                "fingerprint": e["fingerprint"],
+                "query": e["query"],
+                "count": 0,
+                "total_ms": 0.0,
+                "max_ms": 0.0,
+                "routes": set(),
+                "last_seen": None,
+                "bind_shapes": None,
+                "plan": None
+            }
+        g["count"] += 1
+        g["total_ms"] += e["duration_ms"]
+        g["routes"].add(e["route"])
+        g["last_seen"] = e["captured_at"]
+        if e["duration_ms"] >= g["max_ms"]:
+            g["max_ms"] = e["duration_ms"]
+            g["bind_shapes"] = e["bind_shapes"]
+            g["plan"] = e["plan"]
+    
+    result = sorted(groups.values(), key=lambda g: g["total_ms"], reverse=True)[:limit]
+    for g in result:
+        g["total_ms"] = round(g["total_ms"], 1)
+        g["mean_ms"] = round(g["total_ms"] / g["count"], 1)
+        g["routes"] = sorted(g["routes"])
+    return result
+
+
+# ============= slow_query_log writer =============
+_queue = queue.Queue(maxsize=1000)
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _enqueue(entry):
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_write_loop, name="slow-query-log", daemon=True)
+                _writer.start()
+    try:
+        _queue.put_nowait(entry)
+    except queue.Full:
+        pass  # The ring buffer still has it
+
+
+def _write_loop():
+    conn = None
+    while True:
+        entry = _queue.get()
+        try:
+            if conn is None or conn.closed:
+                conn = psycopg2.connect(settings.DATABASE_URL)
+                conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO slow_query_log
+                        (captured_at, fingerprint, route, duration_ms, query, bind_shapes, plan)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """, (
+                    entry["captured_at"], entry["fingerprint"], entry["route"], entry["duration_ms"],
+                    entry["query"], json.dumps(entry["bind_shapes"]), json.dumps(entry["plan"])
+                ))
+        except Exception as e:
+            logger.warning("Écriture slow_query_log impossible: %s", e)
+            if conn is not None:
+                conn.close()
+            conn = None
@@ -0,0 +1,161 @@
+"""
+Versions of the bon tables, for ETags of responses that are not cached.
+
+Every NOTIFY dpa_tables (migrations 007, 018) carries the table name and the
+next value of its sequence ("approvisionnement:1234"). Notifications arrive
+in commit order, so every worker holds the value of the last committed
+change: the same ETag for the same data, across workers and restarts.
+
+After a (re)connection the current values are read from the sequences, once
+the transactions that had already taken a value are finished (at most
+SYNC_SECONDS, then in the background; a table still unknown after
+LATE_SECONDS gets its version from its next change). There is no version
+while the listener is disconnected.
+
+The reference tables (service, vehicule, benificiaire) have the digests of
+their ref_cache snapshots.
+"""
+import logging
+import threading
+import time
+from typing import Dict, Optional
+from app.core import notify
+from app.db.database import get_db, get_tuple_cursor
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "dpa_tables"
+TABLES = ("approvisionnement", "dotation", "dotation_archive")
+
+# Wait for the transactions in progress after a (re)connection, before the
+# listener is healthy, then in the background
+SYNC_SECONDS = 2.0
+LATE_SECONDS = 600.0
+
+# Transactions in progress (each holds the lock of its own id), as text
+XACTS_QUERY = """
+    SELECT array_agg(transactionid)::text FROM pg_locks
+    WHERE locktype = 'transactionid' AND mode = 'ExclusiveLock'
+"""
+
+# table -> value of its last committed change, None while unknown
+_versions: Dict[str, Optional[int]] = {table: None for table in TABLES}
+# table -> value a write of this process will notify on commit
+_pending: Dict[str, Optional[int]] = {table: None for table in TABLES}
+_lock = threading.Lock()
+# Bumped by every resync(): values read by an older one are not applied
+_generation = 0
+
+
+def version(*tables: str) -> Optional[str]:
+    """Version of the given tables, None when changes may be missed"""
+    if not notify.healthy():
+        return None
+    with _lock:
+        values = [_versions[t] for t in tables]
+        if None in values or any(_pending[t] is not None for t in tables):
+            return None
+    return ".".join(str(v) for v in values)
+
+
+def etag(*tables: str) -> Optional[str]:
+    """ETag of a response computed from these tables, None when unknown.
+    Take it before querying: the rows are then at least as recent."""
+    current = version(*tables)
+    return f'"{current}"' if current else None
+
+
+def expect(cur, table: str):
+    """Before the commit of a write of `table`: no version in this process
+    until its notification has arrived (the next /list must not be a 304)"""
+    cur.execute("SELECT currval(%s::regclass) AS value", (f"{table}_change_seq",))
+    value = cur.fetchone()['value']
+    with _lock:
+        _pending[table] = value
+
+
+def changed(payload: Optional[str]):
+    """NOTIFY callback: payload is 'table:value', or None (resync) for all"""
+    if payload is None:
+        resync()
+        return
+    table, _, value = payload.partition(":")
+    if table not in _versions or not value.isdigit():
+        return
+    value = int(value)
+    with _lock:
+        _versions[table] = value
+        # A later value also ends the wait: a write rolled back never notifies
+        if _pending[table] is not None and value >= _pending[table]:
+            _pending[table] = None
+
+
+def resync():
+    """Current values of the sequences, once no transaction in progress can
+    still notify a value taken before they were read"""
+    global _generation
+    with _lock:
+        _generation += 1
+        generation = _generation
+        for table in TABLES:
+            _versions[table] = None
+            _pending[table] = None
+    
+    with get_db() as conn:
+        cur = get_tuple_cursor(conn)
+        cur.execute(" UNION ALL ".join(
+            f"SELECT '{table}', CASE WHEN is_called THEN last_value ELSE 0 END FROM {table}_change_seq"
+            for table in TABLES
+        ))
+        rows = cur.fetchall()
+        conn.commit()
+        # Read after the sequences: a transaction holding a value already
+        # taken has not committed yet, or its notification was received
+        cur.execute(XACTS_QUERY)
+        running = cur.fetchone()[0]
+        conn.commit()
+    
+    # The listener is not healthy before this returns: wait a little here,
+    # then in the background
+    if _settled(running, SYNC_SECONDS, 0.05):
+        _apply(generation, rows)
+    else:
+        threading.Thread(
+            target=_late, args=(generation, rows, running), name="table-versions", daemon=True
+        ).start()
+
+
+def _late(generation: int, rows, running: str):
+    """End of resync() in the background, past SYNC_SECONDS"""
+    if _settled(running, LATE_SECONDS, 1.0):
+        _apply(generation, rows)
+    else:
+        logger.info("Versions des tables inconnues jusqu'à leur prochaine modification")
+
+
+def _settled(running: Optional[str], seconds: float, interval: float) -> bool:
+    """Whether these transactions (XACTS_QUERY) ended within `seconds`"""
+    deadline = time.monotonic() + seconds
+    with get_db() as conn:
+        conn.autocommit = True
+        cur = get_tuple_cursor(conn)
+        while running:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(interval)
+            cur.execute(XACTS_QUERY + " AND transactionid = ANY(%s::xid[])", (running,))
+            running = cur.fetchone()[0]
+    return True
+
+
+def _apply(generation: int, rows):
+    """Values read by resync(), for the tables no notification has set since"""
+    with _lock:
+        if generation != _generation:
+            return
+        for table, value in rows:
+            if _versions[table] is None:
+                _versions[table] = value
+
+
+notify.subscribe(CHANNEL, changed)
@@ -0,0 +1,62 @@
+"""
+In-process cache of users (id, role, statut) for token authentication.
+
+get_current_user() checks every request against the current status and role
+of the user instead of trusting the JWT for its whole lifetime. Entries are
+dropped on NOTIFY dpa_users (migration 005), sent by any process changing
+the users table; while the listener is down every call goes to the database.
+"""
+import threading
+from typing import Optional
+from app.core import notify
+from app.db.database import get_db, get_db_cursor
+
+CHANNEL = "dpa_users"
+
+# username -> user row, or None for an unknown username
+_users = {}
+_lock = threading.Lock()
+# Bumped on every invalidation: a row read before it is not cached
+_generation = 0
+
+
+def _load(username: str) -> Optional[dict]:
+    with get_db() as conn:
+        cur = get_db_cursor(conn)
+        cur.execute(
+            "SELECT id_user, username, role, statut FROM users WHERE username = %s",
+            (username,)
+        )
+        row = cur.fetchone()
+    return dict(row) if row else None
+
+
+def get_user(username: str) -> Optional[dict]:
+    """users row (id_user, username, role, statut) or None"""
+    if notify.healthy():
+        try:
+            return _users[username]
+        except KeyError:
+            pass
+    
+    generation = _generation
+    user = _load(username)
+    if notify.healthy():
+        with _lock:
+            if generation == _generation:
+                _users[username] = user
+    return user
+
+
+def invalidate(payload: Optional[str]):
+    """NOTIFY callback: payload is a username, '*' or None (resync) for all"""
+    global _generation
+    with _lock:
+        _generation += 1
+        if payload and payload != "*":
+            _users.pop(payload, None)
+        else:
+            _users.clear()
+
+
+notify.subscribe(CHANNEL, invalidate)
@@ -1,12 +1,48 @@
+import time
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from contextlib import contextmanager
 from app.core.config import settings
+from app.core import metrics, slow_queries
+
+class TimedCursorMixin:
+    """Times each statement (metrics and slow-query capture)"""
+    
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            result = super().execute(query, vars)
+        finally:
+            duration = time.perf_counter() - start
+            metrics.observe_query(query, duration)
+        if settings.SLOW_QUERY_THRESHOLD_MS and duration * 1000 >= settings.SLOW_QUERY_THRESHOLD_MS:
+            slow_queries.capture(self, query, vars, duration)
+        return result
+    
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+        start = time.perf_counter()
+        try:
+            result = super().executemany(query, vars_list)
+        finally:
+            duration = time.perf_counter() - start
+            metrics.observe_query(query, duration)
+        if settings.SLOW_QUERY_THRESHOLD_MS and duration * 1000 >= settings.SLOW_QUERY_THRESHOLD_MS:
+            slow_queries.capture(self, query, vars_list[0] if vars_list else None, duration, many=True)
+        return result
+
+class TimedCursor(TimedCursorMixin, RealDictCursor):
+    """RealDictCursor timing each statement"""
+
+class TimedTupleCursor(TimedCursorMixin, psycopg2.extensions.cursor):
+    """Plain (tuple rows) cursor timing each statement, for app.core.json_rows"""
 
 @contextmanager
 def get_db():
     """Get database connection with context manager"""
+    start = time.perf_counter()
     conn = psycopg2.connect(settings.DATABASE_URL)
+    metrics.record_connect(time.perf_counter() - start)
     try:
         yield conn
     finally:
@@ -14,4 +50,8 @@ def get_db():
 
 def get_db_cursor(conn):
     """Get database cursor with RealDictCursor"""
-    return conn.cursor(cursor_factory=RealDictCursor)
\ No newline at end of file
+    return conn.cursor(cursor_factory=TimedCursor)
+
+def get_tuple_cursor(conn):
+    """Get database cursor returning tuples (large lists, see app.core.json_rows)"""
+    return conn.cursor(cursor_factory=TimedTupleCursor)
\ No newline at end of file
@@ -1,7 +1,16 @@
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
-from app.api import auth, approvisionnement, dotation, stats, vehicules, services, benificiaires, dotation_import
+from app.core import notify, ref_cache, scheduler
+from app.core.admission import AdmissionMiddleware
+from app.core.compression import CompressionMiddleware
+from app.core.log import RequestContextMiddleware, setup_logging
+from app.core.metrics import TimingMiddleware, render_metrics
+from app.core.profiler import ProfilerMiddleware
+from app.api import auth, approvisionnement, dotation, stats, vehicules, services, benificiaires, dotation_import, dotation_rollover, dotation_reconciliation, admin, admin_db, admin_scheduler, sync, events, jobs
+
+setup_logging()
 
 app = FastAPI(
     title=settings.APP_NAME,
@@ -9,6 +18,15 @@ app = FastAPI(
     description="API pour la gestion du parc automobile - Version 3.0 avec support DOTATION et MISSION"
 )
 
+# Profiler (?profile=1 for admins) - inside CORS so reports keep CORS headers
+if settings.PROFILER_ENABLED:
+    app.add_middleware(ProfilerMiddleware)
+
+# Concurrency budgets per route class (pump, report, stats) - inside CORS so
+# the 503s it sends keep CORS headers, inside timing so queueing is measured
+if settings.ADMISSION_ENABLED:
+    app.add_middleware(AdmissionMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -18,15 +36,55 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip/brotli - inside the timing middleware so compression time is measured
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
+# Request timing (Server-Timing header + /metrics)
+if settings.METRICS_ENABLED:
+    app.add_middleware(TimingMiddleware)
+
+# Request id (X-Request-ID) carried by every log record - outermost
+app.add_middleware(RequestContextMiddleware)
+
 # Include routers
 app.include_router(auth.router, prefix="/api")
 app.include_router(approvisionnement.router, prefix="/api")
 app.include_router(dotation.router, prefix="/api")
 app.include_router(dotation_import.router, prefix="/api")  # Excel import
+app.include_router(dotation_rollover.router, prefix="/api")  # Monthly rollover
+app.include_router(dotation_reconciliation.router, prefix="/api")  # Consumption reconciliation
 app.include_router(stats.router, prefix="/api")
 app.include_router(vehicules.router, prefix="/api")
 app.include_router(services.router, prefix="/api")
 app.include_router(benificiaires.router, prefix="/api")
+app.include_router(sync.router, prefix="/api")  # Delta sync (pump terminals, SPA)
+app.include_router(events.router, prefix="/api")  # Live events (SSE)
+app.include_router(jobs.router, prefix="/api")  # Background jobs (python -m app.worker)
+app.include_router(admin.router, prefix="/api")  # Diagnostics (slow queries)
+app.include_router(admin_db.router, prefix="/api")  # Database health
+app.include_router(admin_scheduler.router, prefix="/api")  # Scheduled tasks
+
+@app.on_event("startup")
+def start_cache_listener():
+    """LISTEN/NOTIFY thread keeping the in-process caches fresh"""
+    if settings.CACHE_ENABLED:
+        notify.start()
+        ref_cache.load()
+
+@app.on_event("shutdown")
+def stop_cache_listener():
+    notify.stop()
+
+@app.on_event("startup")
+def start_scheduler():
+    """Scheduled maintenance; one worker of all, elected by advisory lock, runs it"""
+    if settings.SCHEDULER_ENABLED:
+        scheduler.start()
+
+@app.on_event("shutdown")
+def stop_scheduler():
+    scheduler.stop()
 
 @app.get("/")
 async def root():
@@ -45,6 +103,13 @@ async def health():
     """Health check endpoint"""
     return {"status": "healthy", "version": settings.VERSION}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics"""
+    if not settings.METRICS_ENABLED:
+        return PlainTextResponse("", status_code=404)
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/api/info")
 async def api_info():
     """API information"""
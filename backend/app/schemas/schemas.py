@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 from pydantic import BaseModel, Field, field_validator
 
@@ -79,6 +79,12 @@ class Dotation(DotationBase):
     cloture: bool
     created_at: datetime
 
+class DotationRollover(BaseModel):
+    """Copy last month's dotations to a new month"""
+    mois: int = Field(ge=1, le=12)
+    annee: int = Field(ge=2020)
+    quotas: Dict[int, int] = {}   # service_id -> new qte, optional overrides
+
 class DotationDetail(BaseModel):
     id: int
     vehicule_id: int
@@ -187,6 +193,28 @@ class ApprovisionnementDetail(BaseModel):
     class Config:
         from_attributes = True
 
+# ============= Bulk Schemas =============
+class BulkFilter(BaseModel):
+    """Rows targeted by a bulk operation - at least one criterion is required"""
+    ids: Optional[List[int]] = None
+    service_id: Optional[int] = None
+    direction: Optional[str] = None
+    mois: Optional[int] = Field(None, ge=1, le=12)
+    annee: Optional[int] = Field(None, ge=2020)
+    carburant: Optional[str] = None
+    dry_run: bool = False   # only count the matching rows
+
+class DotationBulkQuota(BulkFilter):
+    """Set (qte) or raise/lower (increment) the quota of matching open dotations"""
+    qte: Optional[int] = Field(None, gt=0)
+    increment: Optional[int] = None
+
+# ============= Job Schemas =============
+class JobSubmit(BaseModel):
+    """Maintenance task queued by an admin (POST /api/jobs)"""
+    kind: str
+    params: Dict = {}
+
 # ============= Statistics Schemas =============
 class DashboardStats(BaseModel):
     total_vehicules: int
@@ -0,0 +1,71 @@
+"""WHERE clauses for bulk admin operations (see schemas.BulkFilter)"""
+from typing import List, Tuple
+from app.schemas.schemas import BulkFilter
+
+
+def dotation_filter(f: BulkFilter) -> Tuple[List[str], list]:
+    """Conditions on `dotation d` matching the filter"""
+    clauses = []
+    params = []
+    
+    if f.ids:
+        clauses.append("d.id = ANY(%s)")
+        params.append(f.ids)
+    
+    if f.mois:
+        clauses.append("d.mois = %s")
+        params.append(f.mois)
+    
+    if f.annee:
+        clauses.append("d.annee = %s")
+        params.append(f.annee)
+    
+    if f.service_id:
+        clauses.append("d.benificiaire_id IN (SELECT b.id FROM benificiaire b WHERE b.service_id = %s)")
+        params.append(f.service_id)
+    
+    if f.direction:
+        clauses.append("""d.benificiaire_id IN (
+            SELECT b.id FROM benificiaire b
+            JOIN service s ON s.id = b.service_id
+            WHERE s.direction = %s
+        )""")
+        params.append(f.direction)
+    
+    if f.carburant:
+        clauses.append("d.vehicule_id IN (SELECT v.id FROM vehicule v WHERE v.carburant = %s)")
+        params.append(f.carburant)
+    
+    return clauses, params
+
+
+def vehicule_filter(f: BulkFilter) -> Tuple[List[str], list]:
+    """Conditions on `vehicule v` matching the filter
+
+    service, direction and mois/annee go through the vehicle's dotations:
+    the dotation of that month if given, the open one otherwise.
+    """
+    clauses = []
+    params = []
+    
+    if f.ids:
+        clauses.append("v.id = ANY(%s)")
+        params.append(f.ids)
+    
+    if f.carburant:
+        clauses.append("v.carburant = %s")
+        params.append(f.carburant)
+    
+    if f.service_id or f.direction or f.mois or f.annee:
+        dotation_clauses, dotation_params = dotation_filter(
+            BulkFilter(service_id=f.service_id, direction=f.direction, mois=f.mois, annee=f.annee)
+        )
+        if not (f.mois or f.annee):
+            dotation_clauses.append("d.cloture = FALSE")
+        clauses.append(
+            "EXISTS (SELECT 1 FROM dotation d WHERE d.vehicule_id = v.id AND "
+            + " AND ".join(dotation_clauses) + ")"
+        )
+        params.extend(dotation_params)
+    
+    return clauses, params
@@ -0,0 +1,65 @@
+"""Sparse fieldsets (?fields=id,police,...) of list endpoints"""
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from fastapi import HTTPException
+
+# Table aliases an SQL expression reads ("v.police" -> v)
+_ALIAS = re.compile(r"\b([a-z])\.")
+
+
+def aliases(*expressions: str) -> Set[str]:
+    """Table aliases read by SQL expressions or conditions"""
+    found = set()
+    for expression in expressions:
+        found.update(_ALIAS.findall(expression))
+    return found
+
+
+def requested_fields(fields: Optional[str], allowed: Sequence[str]) -> List[str]:
+    """Fields of ?fields= in the requested order, all of `allowed` without it"""
+    names = list(dict.fromkeys(f.strip() for f in (fields or "").split(",") if f.strip()))
+    if not names:
+        return list(allowed)
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Champ(s) inconnu(s): {', '.join(unknown)} (champs possibles: {', '.join(allowed)})"
+        )
+    return names
+
+
+class Projection:
+    """SELECT list and joins of a list query, limited to the requested fields
+    
+    fields: response key -> SQL expression on the base table or the aliases
+    of `joins`; joins: alias -> (JOIN clause, alias it joins on), each after
+    the one it needs. A join must not change the rows (LEFT JOIN on a key,
+    JOIN on a NOT NULL foreign key): dropping it only drops columns.
+    """
+    
+    def __init__(self, fields: Dict[str, str], joins: Dict[str, Tuple[str, Optional[str]]]):
+        self.fields = fields
+        self.joins = joins
+    
+    def joins_for(self, needed: Iterable[str]) -> str:
+        """Joins of the aliases in `needed` and of the ones they join on"""
+        needed = set(needed)
+        for alias in reversed(list(self.joins)):
+            if alias in needed and self.joins[alias][1]:
+                needed.add(self.joins[alias][1])
+        return "\n".join(clause for alias, (clause, _) in self.joins.items() if alias in needed)
+    
+    def build(self, fields: Optional[str], needed: Iterable[str] = ()) -> Tuple[str, str]:
+        """(select list, joins) for ?fields=; needed: aliases WHERE / ORDER BY read"""
+        names = requested_fields(fields, list(self.fields))
+        
+        select = []
+        for name in names:
+            expression = self.fields[name]
+            if expression.split(".")[-1] == name:
+                select.append(expression)
+            else:
+                select.append(f"{expression} AS {name}" if name.islower() else f'{expression} AS "{name}"')
+        joins = self.joins_for(aliases(*(self.fields[name] for name in names)) | set(needed))
+        return ",\n".join(select), joins
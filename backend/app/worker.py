@@ -0,0 +1,129 @@
+"""
+Job worker (app.core.jobs): runs the queued background jobs.
+
+    python -m app.worker [--processes N]
+
+Starts JOBS_WORKER_PROCESSES processes (one job at a time each). An idle
+process waits for the NOTIFY of migration 010, or JOBS_POLL_SECONDS at most
+(retries that became due, missed notifications). Every process also
+requeues the jobs of dead workers and purges the expired ones about once a
+minute. SIGTERM / SIGINT: running jobs are finished, then the processes stop.
+"""
+import argparse
+import importlib
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+import psycopg2
+from app.core import jobs, notify
+from app.core.config import settings
+from app.core.log import setup_logging
+
+logger = logging.getLogger("app.worker")
+
+# Modules registering tasks (@jobs.task)
+TASK_MODULES = (
+    "app.api.approvisionnement",
+    "app.api.dotation",
+    "app.api.dotation_import",
+    "app.api.dotation_reconciliation",
+    "app.api.sync",
+)
+
+# Stale jobs requeue and expired jobs purge
+HOUSEKEEPING_SECONDS = 60.0
+RETRY_SECONDS = (1, 2, 5, 10, 30)
+
+
+def load_tasks():
+    for module in TASK_MODULES:
+        importlib.import_module(module)
+
+
+def work(stop: threading.Event):
+    """Claim and run jobs until `stop` is set"""
+    name = f"{socket.gethostname()}:{os.getpid()}"
+    wake = threading.Event()
+    notify.subscribe(jobs.CHANNEL, lambda payload: wake.set())
+    notify.start()
+    
+    attempt = 0
+    housekeeping = 0.0
+    while not stop.is_set():
+        conn = None
+        try:
+            conn = psycopg2.connect(settings.DATABASE_URL)
+            conn.autocommit = True
+            attempt = 0
+            logger.info("Worker prêt", extra={"worker": name})
+            while not stop.is_set():
+                if time.monotonic() - housekeeping >= HOUSEKEEPING_SECONDS:
+                    jobs.requeue_stale(conn)
+                    jobs.purge_expired(conn)
+                    housekeeping = time.monotonic()
+                
+                wake.clear()
+                job = jobs.claim(conn, name)
+                if job is None:
+                    wake.wait(settings.JOBS_POLL_SECONDS)
+                    continue
+                jobs.run(job)
+        except psycopg2.Error as e:
+            delay = RETRY_SECONDS[min(attempt, len(RETRY_SECONDS) - 1)]
+            attempt += 1
+            logger.warning("Connexion perdue, nouvelle tentative dans %ss: %s", delay, e, extra={"worker": name})
+            stop.wait(delay)
+        finally:
+            if conn is not None:
+                conn.close()
+    notify.stop()
+    logger.info("Worker arrêté", extra={"worker": name})
+
+
+def process_main():
+    """Entry point of a worker process"""
+    setup_logging()
+    load_tasks()
+    stop = threading.Event()
+    
+    def request_stop(signum, frame):
+        stop.set()
+    
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    work(stop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exécute les tâches en arrière-plan (imports, exports, maintenance)")
+    parser.add_argument("--processes", type=int, default=settings.JOBS_WORKER_PROCESSES)
+    args = parser.parse_args()
+    
+    if args.processes <= 1:
+        process_main()
+        return
+    
+    # spawn: fresh interpreters (no inherited connections or threads), whose
+    # atexit handlers run and flush the log queue
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=process_main, name=f"worker-{i}") for i in range(args.processes)]
+    for process in processes:
+        process.start()
+    
+    def forward(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+    
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
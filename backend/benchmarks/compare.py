@@ -0,0 +1,103 @@
+"""
+Compare two benchmarks.run reports.
+
+    python -m benchmarks.compare before.json after.json --threshold 10
+
+Prints throughput, p50/p95/p99 and bytes received per request, per workload
+and operation, with the relative change, and exits with status 1 when a p95 got worse by more than
+--threshold percent (or throughput dropped by as much), or when a pump
+operation of the after report (search, insert, alone or beside another
+workload as in pump+reports) has a p99 over --pump-p99-budget ms.
+"""
+import argparse
+import json
+import sys
+
+# Latency the pump terminals must keep whatever the back office runs
+# (admission control budgets are sized for it, see README)
+PUMP_P99_BUDGET_MS = 1000
+
+
+def change(old: float, new: float) -> float:
+    return 100.0 * (new - old) / old if old else 0.0
+
+
+def compare(before: dict, after: dict, threshold: float):
+    rows = []
+    regressions = []
+    for name, new in after["workloads"].items():
+        old = before["workloads"].get(name)
+        if old is None:
+            continue
+        entries = [(name, old, new)] + [
+            (f"{name}/{operation}", old["operations"][operation], stats)
+            for operation, stats in new["operations"].items()
+            if operation in old["operations"]
+        ]
+        for label, o, n in entries:
+            row = {"name": label, "throughput_rps": (o["throughput_rps"], n["throughput_rps"])}
+            for key in ("p50", "p95", "p99"):
+                row[key] = (o["latency_ms"][key], n["latency_ms"][key])
+            # Reports written before bytes were recorded have none
+            row["bytes"] = (o.get("bytes", {}).get("wire_per_request", 0), n.get("bytes", {}).get("wire_per_request", 0))
+            rows.append(row)
+            if change(*row["p95"]) > threshold or -change(*row["throughput_rps"]) > threshold:
+                regressions.append(label)
+    return rows, regressions
+
+
+def over_budget(after: dict, budget_ms: float) -> list:
+    """Pump operations of the report whose p99 is over the budget"""
+    over = []
+    for name, workload in after["workloads"].items():
+        if "pump" not in name.split("+"):
+            continue
+        grouped = "+" in name
+        for operation, stats in workload["operations"].items():
+            if grouped and not operation.startswith("pump/"):
+                continue
+            if stats["latency_ms"]["p99"] > budget_ms:
+                over.append(f"{name}/{operation} ({stats['latency_ms']['p99']} ms)")
+    return over
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare deux rapports de benchmarks")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10, help="Régression tolérée en %% (p95 et débit)")
+    parser.add_argument(
+        "--pump-p99-budget", type=float, default=PUMP_P99_BUDGET_MS,
+        help="p99 maximal des opérations de la pompe, en ms"
+    )
+    args = parser.parse_args()
+    
+    with open(args.before, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(args.after, encoding="utf-8") as f:
+        after = json.load(f)
+    
+    print(f"avant: {(before['git']['commit'] or '?')[:10]}  après: {(after['git']['commit'] or '?')[:10]}")
+    if before.get("dataset") != after.get("dataset"):
+        print("attention: jeux de données différents")
+    
+    rows, regressions = compare(before, after, args.threshold)
+    print(f"{'':40} {'req/s':>18} {'p50 ms':>20} {'p95 ms':>20} {'p99 ms':>20} {'octets/req':>20}")
+    for row in rows:
+        cells = [
+            f"{new:>9} {change(old, new):+7.1f}%"
+            for old, new in (row["throughput_rps"], row["p50"], row["p95"], row["p99"], row["bytes"])
+        ]
+        print(f"{row['name']:40} {cells[0]:>18} {cells[1]:>20} {cells[2]:>20} {cells[3]:>20} {cells[4]:>20}")
+    
+    over = over_budget(after, args.pump_p99_budget)
+    if regressions:
+        print(f"\nRégressions (> {args.threshold}%): {', '.join(regressions)}")
+    if over:
+        print(f"\nPompe hors budget (p99 > {args.pump_p99_budget:g} ms): {', '.join(over)}")
+    if regressions or over:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
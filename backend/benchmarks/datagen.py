@@ -0,0 +1,258 @@
+"""
+Synthetic fleet data generator.
+
+Fills an existing schema (newv.sql + migrations) with a realistic fleet:
+the services/directions of the seed, one beneficiary per vehicle, monthly
+dotations over several years and DOTATION bons with increasing km, plus
+MISSION bons for external vehicles. Rows are computed in Python and loaded
+with COPY while user triggers are disabled, the derived columns the
+triggers would maintain (qte_consomme, cloture, numordre, n_order, km,
+numero_bon) being computed here, so millions of rows load in seconds.
+
+    python -m benchmarks.datagen --dsn postgresql://postgres@localhost/dpa_bench \\
+        --vehicles 2000 --years 3 --bons-per-month 4 --missions 20000
+
+Fleet tables (FLEET_TABLES) are truncated first. Never point it at
+production.
+"""
+import argparse
+import io
+import random
+import time
+from datetime import date, datetime, timedelta
+import psycopg2
+
+# Seed services (newv.sql)
+SERVICES = [
+    ('CABINET', 'CABINET'), ('PCD', 'CABINET'), ('ISS', 'CABINET'), ('PAD', 'CABINET'),
+    ('ROYAL', 'CABINET'), ('TGR', 'CABINET'), ('REVUE POLICE', 'CABINET'), ('DRH', 'DRH'),
+    ('DRG', 'DRG'), ('DPJ', 'DPJ'), ('DPC', 'DPJ'), ('DSIC', 'DSIC'), ('IG', 'IG'),
+    ('DSP', 'DSP'), ('GMS99', 'DSP'), ('DEB', 'DEB'), ('DGP', 'DEB'), ('DPA', 'DEB'),
+    ('DM', 'DEB'), ('DF', 'DEB'), ('SAA', 'DEB'), ('SG', 'DEB'), ('DPA/FC', 'DEB'),
+    ('DM/MAG', 'DEB'), ('DM/SAMS', 'DEB'), ('FMSN', 'FMSN'), ('PP LAAYOUNE', 'PP'),
+]
+
+# Brand mix of the seed fleet
+MARQUES = [
+    ('DACIA LOGAN', 50), ('SKODA SUPERB', 10), ('RYMCO', 7), ('TOYOTA COROLLA HYBRID', 6),
+    ('HYUNDAI ACCENT', 5), ('SKODA OCTAVIA', 3), ('CADDY', 2), ('FIAT TIPO', 2),
+    ('PEUGEOT 301', 3), ('RENAULT KANGOO', 3),
+]
+
+FONCTIONS = [
+    'CHEF DE SERVICE', 'CHEF DE DIVISION', 'CHEF DE SECTION', 'CHEF DE BUREAU',
+    'SECRETARIAT', 'DISPOSITION', 'CHARGE DE MISSION',
+]
+
+QUOTAS = [100, 150, 200, 250, 300, 400]
+
+DESTINATIONS = ['RABAT', 'CASABLANCA', 'FES', 'MARRAKECH', 'TANGER', 'AGADIR', 'OUJDA', 'LAAYOUNE', 'MEKNES', 'KENITRA']
+
+# Username and password of the benchmarks' login workload
+BENCH_USER = 'bench'
+
+FLEET_TABLES = [
+    'approvisionnement', 'dotation', 'dotation_archive', 'dotation_archive_numordre',
+    'dotation_reconciliation_queue', 'benificiaire', 'vehicule', 'service',
+]
+
+
+class CopyBuffer:
+    """Tab-separated rows for COPY FROM STDIN"""
+    
+    def __init__(self):
+        self.buffer = io.StringIO()
+        self.count = 0
+    
+    def add(self, *values):
+        self.buffer.write("\t".join(r"\N" if v is None else str(v) for v in values))
+        self.buffer.write("\n")
+        self.count += 1
+    
+    def copy(self, cur, table: str, columns: str):
+        self.buffer.seek(0)
+        cur.copy_expert(f"COPY {table} ({columns}) FROM STDIN", self.buffer)
+
+
+def month_range(years: int, today: date):
+    """(annee, mois) for the last `years` years, current month included"""
+    months = []
+    annee, mois = today.year, today.month
+    for _ in range(years * 12):
+        months.append((annee, mois))
+        mois -= 1
+        if mois == 0:
+            annee, mois = annee - 1, 12
+    months.reverse()
+    return [m for m in months if m[0] >= 2020]
+
+
+def generate(args) -> dict:
+    rng = random.Random(args.seed)
+    today = date.today()
+    months = month_range(args.years, today)
+    
+    services = CopyBuffer()
+    benificiaires = CopyBuffer()
+    vehicules = CopyBuffer()
+    dotations = CopyBuffer()
+    bons = CopyBuffer()
+    
+    # Services: the seed list, repeated with a suffix at larger scales
+    service_rows = []
+    copies = max(1, args.vehicles // 2000)
+    for i in range(copies):
+        for nom, direction in SERVICES:
+            service_rows.append((len(service_rows) + 1, nom if i == 0 else f"{nom} {i + 1}", direction))
+    for row in service_rows:
+        services.add(*row)
+    
+    marques = [m for m, _ in MARQUES]
+    poids = [w for _, w in MARQUES]
+    n_order = {}
+    # numordre is only unique per direction and numero_bon is built from it:
+    # separate ranges per direction keep the bons created during the
+    # benchmarks (numordre = max of the direction + 1) from colliding
+    directions = sorted({d for _, d in SERVICES})
+    numordre = {d: i * 1000000 for i, d in enumerate(directions)}
+    vehicle_km = {}
+    
+    dotation_id = 0
+    bon_id = 0
+    for v in range(1, args.vehicles + 1):
+        service_id, _, direction = service_rows[rng.randrange(len(service_rows))]
+        n_order[direction] = n_order.get(direction, 0) + 1
+        benificiaires.add(v, f"M{v:06d}", f"BENEFICIAIRE {v:06d}", rng.choice(FONCTIONS), service_id, n_order[direction])
+        
+        km = rng.randint(5000, 150000)
+        quota = rng.choice(QUOTAS)
+        for index, (annee, mois) in enumerate(months):
+            dotation_id += 1
+            is_current = index == len(months) - 1
+            numordre[direction] += 1
+            
+            # Bons spread over the month, the current one only up to today
+            days = (today.day if is_current else 28)
+            n_bons = rng.randint(max(0, args.bons_per_month - 2), args.bons_per_month + 2)
+            if is_current:
+                n_bons = n_bons * today.day // 30
+            jours = sorted(rng.randint(1, days) for _ in range(n_bons))
+            
+            consomme = 0.0
+            for seq, jour in enumerate(jours, start=1):
+                qte = round(rng.uniform(15, 60), 2)
+                if consomme + qte > quota:
+                    break
+                consomme += qte
+                km_precedent = km
+                km += rng.randint(150, 700)
+                bon_id += 1
+                moment = datetime(annee, mois, jour, rng.randint(7, 19), rng.randint(0, 59))
+                bons.add(
+                    bon_id, 'DOTATION', moment, f"{qte:.2f}", km_precedent, km, 'f',
+                    dotation_id, None, None, None, None, None, None, None,
+                    f"{numordre[direction]}/{seq}"
+                )
+            
+            cloture = not is_current
+            dotations.add(
+                dotation_id, v, v, mois, annee, quota, f"{consomme:.2f}",
+                't' if cloture else 'f', datetime(annee, mois, 1), numordre[direction]
+            )
+        
+        vehicle_km[v] = km
+        carburant = 'gasoil' if rng.random() < 0.45 else 'essence'
+        vehicules.add(v, f"{200000 + v}", f"{10000 + v}-T-{rng.randint(1, 99)}",
+                      rng.choices(marques, poids)[0], carburant, km, 't')
+    
+    # Missions with external vehicles (not in vehicule, so no km interplay)
+    start = datetime.combine(today, datetime.min.time()) - timedelta(days=365 * args.years)
+    mission_km = {}
+    for m in range(1, args.missions + 1):
+        police = f"MIS-{rng.randint(1, max(1, args.missions // 20)):05d}"
+        km_precedent = mission_km.get(police, rng.randint(10000, 90000))
+        km = km_precedent + rng.randint(100, 900)
+        mission_km[police] = km
+        bon_id += 1
+        moment = start + timedelta(minutes=m * (525600 * args.years // max(1, args.missions)))
+        nom, _ = SERVICES[rng.randrange(len(SERVICES))]
+        bons.add(
+            bon_id, 'MISSION', moment, f"{rng.uniform(20, 80):.2f}", km_precedent, km, 'f',
+            None, None, None, f"C{rng.randint(1, 5000):05d}", nom, rng.choice(DESTINATIONS),
+            f"OM-{m:07d}", police, f"MISSION-{m}"
+        )
+    
+    return {
+        'services': services,
+        'benificiaires': benificiaires,
+        'vehicules': vehicules,
+        'dotations': dotations,
+        'bons': bons
+    }
+
+
+def load(conn, data: dict):
+    cur = conn.cursor()
+    cur.execute(f"TRUNCATE {', '.join(FLEET_TABLES)} RESTART IDENTITY CASCADE")
+    for table in ('benificiaire', 'dotation', 'approvisionnement'):
+        cur.execute(f"ALTER TABLE {table} DISABLE TRIGGER USER")
+    try:
+        data['services'].copy(cur, 'service', 'id, nom, direction')
+        data['benificiaires'].copy(cur, 'benificiaire', 'id, matricule, nom, fonction, service_id, n_order')
+        data['vehicules'].copy(cur, 'vehicule', 'id, police, ncivil, marque, carburant, km, actif')
+        data['dotations'].copy(cur, 'dotation', 'id, vehicule_id, benificiaire_id, mois, annee, qte, qte_consomme, cloture, created_at, numordre')
+        data['bons'].copy(
+            cur, 'approvisionnement',
+            'id, type_approvi, date, qte, km_precedent, km, anomalie, dotation_id, vhc_provisoire, km_provisoire, '
+            'matricule_conducteur, service_affecte, destination, ordre_mission, police_vehicule, numero_bon'
+        )
+    finally:
+        for table in ('benificiaire', 'dotation', 'approvisionnement'):
+            cur.execute(f"ALTER TABLE {table} ENABLE TRIGGER USER")
+    
+    for table in ('service', 'benificiaire', 'vehicule', 'dotation', 'approvisionnement'):
+        cur.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 1)) FROM {table}")
+    
+    # Login workload user, in plain text like the v3.0 seed: the first login
+    # migrates it to bcrypt
+    cur.execute("""
+        INSERT INTO users (username, password, role) VALUES (%s, %s, 'ADMIN')
+        ON CONFLICT (username) DO UPDATE SET password = EXCLUDED.password, statut = 'ACTIF'
+    """, (BENCH_USER, BENCH_USER))
+    
+    conn.commit()
+    
+    conn.autocommit = True
+    cur.execute("VACUUM ANALYZE")
+    conn.autocommit = False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Génère un parc synthétique pour les benchmarks")
+    parser.add_argument("--dsn", required=True, help="Base cible (schéma newv.sql + migrations)")
+    parser.add_argument("--vehicles", type=int, default=2000)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--bons-per-month", type=int, default=4)
+    parser.add_argument("--missions", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    
+    started = time.perf_counter()
+    data = generate(args)
+    generated = time.perf_counter()
+    
+    conn = psycopg2.connect(args.dsn)
+    try:
+        load(conn, data)
+    finally:
+        conn.close()
+    
+    print(
+        f"{data['vehicules'].count} véhicules, {data['dotations'].count} dotations, "
+        f"{data['bons'].count} bons - génération {generated - started:.1f}s, "
+        f"chargement {time.perf_counter() - generated:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,472 @@
+"""
+Query-plan regression suite.
+
+Replays SCENARIO in-process against a database filled by benchmarks.datagen
+(default scale and seed). Every statement the routers execute through
+get_db_cursor() is recorded per route and explained (EXPLAIN, FORMAT JSON)
+on the request's own connection just before it runs. The plans are checked
+against the baselines checked in under plan_baselines/, one JSON file per
+route:
+
+- no Seq Scan on a large table (>= --large-rows estimated rows) unless
+  listed in the statement's allow_seq_scan
+- estimated total cost at most max_cost (or COST_FLOOR)
+- every index of the baseline's indexes still used
+- no statement missing from the baseline (a new or edited query)
+
+    python -m benchmarks.plans --dsn postgresql://postgres@localhost/dpa_bench
+    python -m benchmarks.plans --dsn ... --update    # rewrite the baselines
+
+--update records the current plans: review the baseline diff like code.
+It never allows a seq scan: add the table to allow_seq_scan by hand (or
+add an index) when the check reports one. max_cost and indexes can be
+edited by hand too; --update keeps an edited max_cost when the plan is
+still within it, and always keeps allow_seq_scan.
+
+The scenario writes (it creates then deletes its own vehicle, beneficiary,
+dotation and bons): never point it at production.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+from benchmarks.datagen import BENCH_USER
+from benchmarks.workloads import ImportWorkload
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "plan_baselines")
+
+# max_cost written by --update, relative to the current estimate
+COST_TOLERANCE = 2.0
+# Estimates under this read a few pages of a small table (reconciliation
+# queue, run history): their changes are noise, not a regression
+COST_FLOOR = 50.0
+
+# Routes deliberately left out of SCENARIO
+IGNORED = {
+    "POST /api/auth/token": "même requête que /auth/login",
+    "POST /api/dotation/archive": "déplace toutes les dotations clôturées",
+    "POST /api/dotation/rollover/execute": "crée un mois complet de dotations",
+    "POST /api/dotation/import-excel/execute": "crée un mois complet de dotations",
+    "POST /api/dotation/bulk/close": "mêmes requêtes que bulk/quota",
+    "POST /api/services": "table de référence (quelques lignes)",
+    "POST /api/approvisionnement/mission": "erreur 500 avant toute requête (service_externe / ville_origine absents du schéma)",
+    "GET /api/admin/slow-queries": "catalogue / diagnostic",
+    "DELETE /api/admin/slow-queries": "pas de SQL",
+    "GET /api/admin/profiles": "pas de SQL",
+    "GET /api/admin/profiles/compare": "pas de SQL",
+    "GET /api/admin/profiles/{profile_id}": "pas de SQL",
+    "DELETE /api/admin/profiles/{profile_id}": "pas de SQL",
+    "GET /api/admin/db/": "catalogue / diagnostic",
+    "GET /api/admin/db/statements": "catalogue / diagnostic",
+    "GET /api/admin/db/indexes": "catalogue / diagnostic",
+    "GET /api/admin/db/bloat": "catalogue / diagnostic",
+    "GET /api/admin/db/cache": "catalogue / diagnostic",
+    "GET /api/admin/db/triggers": "catalogue / diagnostic",
+    "GET /api/admin/scheduler": "catalogue / diagnostic",
+    "GET /api/admin/scheduler/runs": "table scheduler_run (purgée après SCHEDULER_HISTORY_DAYS)",
+    "GET /api/info": "pas de SQL",
+    "GET /api/events/stream": "flux SSE, pas de SQL (NOTIFY)",
+    "POST /api/events/ticket": "jeton signé, pas de SQL (user_cache)",
+    "POST /api/approvisionnement/export": "INSERT dans job, l'export tourne dans le worker",
+    "GET /api/jobs": "table job (quelques lignes, purgée après JOBS_RESULT_TTL_HOURS)",
+    "POST /api/jobs": "INSERT dans job",
+    "GET /api/jobs/{job_id}": "clé primaire de job",
+    "POST /api/jobs/{job_id}/cancel": "clé primaire de job",
+    "GET /api/jobs/{job_id}/file": "clé primaire de job",
+}
+
+
+class Step:
+    """One API call of the scenario. path is the route's own template; its
+    placeholders and those of body and params come from the context, renamed
+    by `use` (placeholder -> context key). upload names the context key of an
+    Excel file to post, save maps context keys to fields of the response."""
+    
+    def __init__(self, method: str, path: str, body=None, params=None, use=None, upload=None, save=None, expect=(200,)):
+        self.method = method
+        self.path = path
+        self.body = body
+        self.params = params
+        self.use = use or {}
+        self.upload = upload
+        self.save = save
+        self.expect = expect
+    
+    @property
+    def route(self) -> str:
+        return f"{self.method} {self.path}"
+
+
+PLAN_POLICE = "PLAN-0001"
+PLAN_BENIFICIAIRE = "PLAN CHECK"
+
+XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+SCENARIO = [
+    # Reads
+    Step("POST", "/api/auth/login", body={"username": "plan-check", "password": "x"}, expect=(401,)),
+    Step("GET", "/api/auth/me", expect=(200, 404)),
+    Step("POST", "/api/approvisionnement/search", body={"police": "{police}"}),
+    Step("GET", "/api/approvisionnement/list", params={"page": 3, "per_page": 20}),
+    Step("GET", "/api/approvisionnement/dotation-list"),
+    Step("GET", "/api/approvisionnement/mission-list"),
+    Step("GET", "/api/approvisionnement/by-dotation/{dotation_id}"),
+    Step("GET", "/api/approvisionnement/last-km/{police}"),
+    Step("GET", "/api/dotation/available-vehicles", params={"mois": 1, "annee": 2099}),
+    Step("GET", "/api/dotation/available-benificiaires", params={"mois": 1, "annee": 2099}),
+    Step("GET", "/api/dotation/active", params={"page": 3, "per_page": 10, "search": "DACIA"}),
+    Step("GET", "/api/dotation/archived", params={"page": 3, "per_page": 10}),
+    Step("GET", "/api/dotation/reconcile/runs"),
+    Step("POST", "/api/dotation/reconcile/", params={"incremental": True}),
+    Step("POST", "/api/dotation/rollover/preview", body={"mois": 1, "annee": 2099}),
+    Step("POST", "/api/dotation/import-excel/analyze", upload="excel"),
+    Step("POST", "/api/dotation/bulk/quota", body={"service_id": "{service_id}", "increment": 10, "dry_run": True}),
+    Step("POST", "/api/vehicules/bulk/deactivate", body={"service_id": "{service_id}", "dry_run": True}),
+    Step("GET", "/api/stats/dashboard"),
+    Step("GET", "/api/stats/consommation-par-jour"),
+    Step("GET", "/api/stats/consommation-par-carburant"),
+    Step("GET", "/api/stats/consommation-par-service"),
+    Step("GET", "/api/stats/consommation-par-type"),
+    Step("GET", "/api/stats/anomalies"),
+    Step("GET", "/api/vehicules/", params={"page": 3, "per_page": 10, "search": "DACIA"}),
+    Step("GET", "/api/vehicules/{vehicule_id}"),
+    Step("GET", "/api/vehicules/by-police/{police}"),
+    Step("GET", "/api/services"),
+    Step("GET", "/api/services/{service_id}"),
+    Step("GET", "/api/directions"),
+    Step("GET", "/api/benificiaires", params={"page": 3, "per_page": 20, "search": "BENEFICIAIRE"}),
+    Step("GET", "/api/benificiaires/by-service/{service_id}"),
+    Step("GET", "/api/benificiaires/{benificiaire_id}"),
+    Step("GET", "/api/sync", save={"sync_token": "token"}),
+    
+    # Writes on rows created by the scenario itself
+    Step("POST", "/api/vehicules/", body={
+        "police": PLAN_POLICE, "ncivil": "PLAN-1", "marque": "DACIA LOGAN", "carburant": "gasoil", "km": 1000
+    }, save={"new_vehicule_id": "id"}),
+    Step("PUT", "/api/vehicules/{vehicule_id}", use={"vehicule_id": "new_vehicule_id"}, body={
+        "police": PLAN_POLICE, "ncivil": "PLAN-1", "marque": "DACIA LOGAN", "carburant": "gasoil", "km": 1000
+    }),
+    Step("POST", "/api/benificiaires", body={
+        "nom": PLAN_BENIFICIAIRE, "fonction": "DISPOSITION", "service_id": "{service_id}"
+    }, save={"new_benificiaire_id": "id"}),
+    Step("PUT", "/api/benificiaires/{benificiaire_id}", use={"benificiaire_id": "new_benificiaire_id"}, body={
+        "matricule": "PLAN-CHECK", "nom": PLAN_BENIFICIAIRE, "fonction": "DISPOSITION", "service_id": "{service_id}"
+    }),
+    Step("POST", "/api/dotation/", body={
+        "vehicule_id": "{new_vehicule_id}", "benificiaire_id": "{new_benificiaire_id}", "mois": 1, "annee": 2099, "qte": 200
+    }, save={"new_dotation_id": "id"}),
+    Step("PUT", "/api/dotation/{dotation_id}", use={"dotation_id": "new_dotation_id"}, body={
+        "vehicule_id": "{new_vehicule_id}", "benificiaire_id": "{new_benificiaire_id}", "mois": 1, "annee": 2099, "qte": 250
+    }),
+    Step("POST", "/api/approvisionnement/dotation", body={
+        "dotation_id": "{new_dotation_id}", "qte": 20, "km_precedent": 1000, "km": 1200
+    }, save={"new_bon_id": "id"}),
+    Step("DELETE", "/api/approvisionnement/{appro_id}", use={"appro_id": "new_bon_id"}),
+    Step("PUT", "/api/dotation/{dotation_id}/close", use={"dotation_id": "new_dotation_id"}),
+    Step("DELETE", "/api/dotation/{dotation_id}", use={"dotation_id": "new_dotation_id"}),
+    Step("DELETE", "/api/benificiaires/{benificiaire_id}", use={"benificiaire_id": "new_benificiaire_id"}),
+    Step("DELETE", "/api/vehicules/{vehicule_id}", use={"vehicule_id": "new_vehicule_id"}),
+    # Delta of the writes above
+    Step("GET", "/api/sync", params={"since": "{sync_token}"}),
+]
+
+
+def fill(value, context: dict):
+    """Format "{name}" placeholders; a placeholder alone keeps the value's type"""
+    if isinstance(value, str):
+        match = re.fullmatch(r"\{(\w+)\}", value)
+        if match:
+            return context[match.group(1)]
+        return value.format(**context)
+    if isinstance(value, dict):
+        return {k: fill(v, context) for k, v in value.items()}
+    return value
+
+
+# ============= Capture =============
+class Capture:
+    """Statements executed by the timed cursors while `route` is set, with their plans"""
+    
+    def __init__(self):
+        self.route = None
+        self.statements = {}
+    
+    def install(self):
+        # app modules read DATABASE_URL at import: imported once main() set it
+        from app.db import database
+        original = database.TimedCursorMixin.execute
+        capture = self
+        
+        def execute(cursor, query, vars=None):
+            if capture.route is not None:
+                capture.record(cursor, query, vars)
+            return original(cursor, query, vars)
+        
+        database.TimedCursorMixin.execute = execute
+    
+    def record(self, cursor, query, vars):
+        from app.core import metrics, slow_queries
+        if not isinstance(query, str):
+            query = query.as_string(cursor.connection) if hasattr(query, "as_string") else query.decode("utf-8", "replace")
+        normalized = slow_queries.normalize(query)
+        key = slow_queries.fingerprint(normalized)
+        statements = self.statements.setdefault(self.route, {})
+        if key in statements:
+            statements[key]["calls"] += 1
+            return
+        plan = None
+        if metrics.statement_type(query) in slow_queries.EXPLAINABLE:
+            plan = slow_queries.explain(cursor, query, vars)
+        statements[key] = {"query": normalized, "calls": 1, "plan": plan}
+
+
+def run_scenario(client, capture: Capture) -> list:
+    """Run SCENARIO; returns the steps that did not answer as expected"""
+    context = seed_context(client)
+    failures = []
+    for step in SCENARIO:
+        try:
+            values = {**context, **{name: context[key] for name, key in step.use.items()}}
+            path, body, params = fill(step.path, values), fill(step.body, values), fill(step.params, values)
+        except KeyError as e:
+            failures.append(f"{step.route}: {e.args[0]} indisponible (étape précédente en échec)")
+            continue
+        files = None
+        if step.upload:
+            files = {"file": ("dotations.xlsx", context[step.upload], XLSX)}
+        capture.route = step.route
+        try:
+            response = client.request(step.method, path, json=body, params=params, files=files)
+        finally:
+            capture.route = None
+        if response.status_code not in step.expect:
+            failures.append(f"{step.route}: HTTP {response.status_code} {response.text[:200]}")
+            continue
+        for name, field in (step.save or {}).items():
+            context[name] = response.json()[field]
+    return failures
+
+
+def seed_context(client) -> dict:
+    """Ids of existing rows used by the read steps, and the Excel file"""
+    dotation = client.get("/api/dotation/active", params={"page": 1, "per_page": 1}).json()["items"][0]
+    benificiaire = client.get("/api/benificiaires", params={"page": 1, "per_page": 1}).json()["items"][0]
+    return {
+        "dotation_id": dotation["id"],
+        "vehicule_id": dotation["vehicule_id"],
+        "police": dotation["police"],
+        "benificiaire_id": benificiaire["id"],
+        "service_id": benificiaire["service_id"],
+        "excel": ImportWorkload.setup(client)["excel"]
+    }
+
+
+def cleanup(conn):
+    """Rows left by an interrupted scenario"""
+    cur = conn.cursor()
+    cur.execute("""
+        DELETE FROM approvisionnement WHERE dotation_id IN (
+            SELECT d.id FROM dotation d JOIN vehicule v ON v.id = d.vehicule_id WHERE v.police = %s
+        )
+    """, (PLAN_POLICE,))
+    cur.execute("DELETE FROM dotation WHERE vehicule_id IN (SELECT id FROM vehicule WHERE police = %s)", (PLAN_POLICE,))
+    cur.execute("DELETE FROM vehicule WHERE police = %s", (PLAN_POLICE,))
+    cur.execute("""
+        DELETE FROM benificiaire b WHERE b.nom = %s
+        AND NOT EXISTS (SELECT 1 FROM dotation d WHERE d.benificiaire_id = b.id)
+    """, (PLAN_BENIFICIAIRE,))
+    conn.commit()
+
+
+def last_reconcile_run(conn) -> int:
+    cur = conn.cursor()
+    cur.execute("SELECT COALESCE(MAX(id), 0) FROM dotation_reconciliation_run")
+    return cur.fetchone()[0]
+
+
+def forget_reconcile_runs(conn, after: int):
+    """Runs logged by the scenario's reconciliation: a growing history would
+    move the cost of /reconcile/runs at every check"""
+    cur = conn.cursor()
+    cur.execute("DELETE FROM dotation_reconciliation_run WHERE id > %s", (after,))
+    conn.commit()
+
+
+# ============= Plan properties =============
+def plan_nodes(node: dict, depth: int = 0):
+    yield node, depth
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child, depth + 1)
+
+
+def describe(plan) -> dict:
+    """Diffable summary of an EXPLAIN (FORMAT JSON) result"""
+    if plan is None:
+        return {"shape": None, "total_cost": None, "seq_scans": [], "indexes": []}
+    if isinstance(plan, dict) and "error" in plan:
+        return {"shape": [f"EXPLAIN impossible: {plan['error']}"], "total_cost": None, "seq_scans": [], "indexes": []}
+    
+    root = plan[0]["Plan"]
+    shape, seq_scans, indexes = [], set(), set()
+    for node, depth in plan_nodes(root):
+        line = "  " * depth + node["Node Type"]
+        if "Relation Name" in node:
+            line += f" on {node['Relation Name']}"
+        if "Index Name" in node:
+            line += f" using {node['Index Name']}"
+            indexes.add(node["Index Name"])
+        shape.append(line)
+        if node["Node Type"] == "Seq Scan":
+            seq_scans.add(node["Relation Name"])
+    return {
+        "shape": shape,
+        "total_cost": root["Total Cost"],
+        "seq_scans": sorted(seq_scans),
+        "indexes": sorted(indexes)
+    }
+
+
+def large_tables(conn, min_rows: int) -> set:
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT c.relname FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relkind IN ('r', 'p') AND n.nspname = 'public' AND c.reltuples >= %s
+    """, (min_rows,))
+    return {r[0] for r in cur.fetchall()}
+
+
+def check(route: str, key: str, statement: dict, baseline: dict, large: set) -> list:
+    problems = []
+    if baseline is None:
+        return [f"{route} [{key}] requête absente de la référence: {statement['query'][:120]}"]
+    current = describe(statement["plan"])
+    for table in current["seq_scans"]:
+        if table in large and table not in baseline.get("allow_seq_scan", []):
+            problems.append(f"{route} [{key}] Seq Scan sur {table}")
+    max_cost = baseline.get("max_cost")
+    if max_cost is not None and current["total_cost"] is not None and current["total_cost"] > max(max_cost, COST_FLOOR):
+        problems.append(f"{route} [{key}] coût estimé {current['total_cost']} > {max_cost}")
+    for index in baseline.get("indexes", []):
+        if index not in current["indexes"]:
+            problems.append(f"{route} [{key}] index {index} plus utilisé")
+    return problems
+
+
+# ============= Baselines =============
+def baseline_path(route: str) -> str:
+    name = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_")
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def load_baseline(route: str) -> dict:
+    try:
+        with open(baseline_path(route), encoding="utf-8") as f:
+            return json.load(f)["statements"]
+    except FileNotFoundError:
+        return {}
+
+
+def write_baseline(route: str, statements: dict):
+    previous = load_baseline(route)
+    entries = {}
+    for key, statement in sorted(statements.items()):
+        current = describe(statement["plan"])
+        cost = current["total_cost"]
+        max_cost = round(cost * COST_TOLERANCE, 2) if cost is not None else None
+        kept = previous.get(key, {}).get("max_cost")
+        if kept is not None and cost is not None and cost <= kept:
+            max_cost = kept
+        entries[key] = {
+            "query": statement["query"],
+            "calls": statement["calls"],
+            "shape": current["shape"],
+            "total_cost": cost,
+            "max_cost": max_cost,
+            "indexes": current["indexes"],
+            # Allowing a seq scan is a reviewed, hand edit: --update keeps it
+            "allow_seq_scan": previous.get(key, {}).get("allow_seq_scan", [])
+        }
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    with open(baseline_path(route), "w", encoding="utf-8") as f:
+        json.dump({"route": route, "statements": entries}, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+
+
+def uncovered_routes(app) -> list:
+    covered = {step.route for step in SCENARIO} | set(IGNORED)
+    routes = []
+    for route in app.routes:
+        for method in sorted(getattr(route, "methods", None) or []):
+            name = f"{method} {route.path}"
+            if route.path.startswith("/api") and method != "HEAD" and name not in covered:
+                routes.append(name)
+    return sorted(set(routes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vérifie les plans d'exécution des requêtes de l'API")
+    parser.add_argument("--dsn", required=True, help="Base remplie par benchmarks.datagen")
+    parser.add_argument("--update", action="store_true", help="Réécrit les références avec les plans actuels")
+    parser.add_argument("--large-rows", type=int, default=10000, help="Taille (lignes estimées) d'une grande table")
+    args = parser.parse_args()
+    
+    os.environ["DATABASE_URL"] = args.dsn
+    import psycopg2
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.core.security import create_access_token
+    
+    conn = psycopg2.connect(args.dsn)
+    try:
+        cleanup(conn)
+        large = large_tables(conn, args.large_rows)
+        last_run = last_reconcile_run(conn)
+    finally:
+        conn.close()
+    
+    capture = Capture()
+    capture.install()
+    with TestClient(app) as client:
+        client.headers["Authorization"] = "Bearer " + create_access_token({"sub": BENCH_USER, "role": "ADMIN"})
+        failures = run_scenario(client, capture)
+    
+    conn = psycopg2.connect(args.dsn)
+    try:
+        forget_reconcile_runs(conn, last_run)
+    finally:
+        conn.close()
+    for failure in failures:
+        print(f"[PLANS] étape en échec: {failure}")
+    
+    if args.update and not failures and os.path.isdir(BASELINE_DIR):
+        for name in os.listdir(BASELINE_DIR):
+            os.remove(os.path.join(BASELINE_DIR, name))
+    
+    problems = []
+    for route, statements in sorted(capture.statements.items()):
+        if args.update:
+            write_baseline(route, statements)
+            continue
+        baseline = load_baseline(route)
+        for key, statement in sorted(statements.items()):
+            problems.extend(check(route, key, statement, baseline.get(key), large))
+    
+    for route in uncovered_routes(app):
+        print(f"[PLANS] route non couverte par le scénario: {route}")
+    
+    if args.update:
+        print(f"[PLANS] {len(capture.statements)} référence(s) écrite(s) dans {BASELINE_DIR}")
+    else:
+        for problem in problems:
+            print(f"[PLANS] {problem}")
+        count = sum(len(s) for s in capture.statements.values())
+        print(f"[PLANS] {count} requête(s) sur {len(capture.statements)} route(s), {len(problems)} régression(s)")
+    
+    if problems or failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
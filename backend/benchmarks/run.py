@@ -0,0 +1,275 @@
+"""
+Benchmark runner.
+
+Runs the scripted workloads of benchmarks.workloads one after the other,
+each for --duration seconds with --concurrency threads ("login+pump" runs
+both at the same time, --concurrency threads each), and writes
+throughput and p50/p95/p99 latencies per workload and per operation as
+JSON, together with the git commit and the dataset size, so runs can be
+compared across commits with benchmarks.compare.
+
+In-process against a database (the app is imported with DATABASE_URL=--dsn):
+
+    python -m benchmarks.run --dsn postgresql://postgres@localhost/dpa_bench \\
+        --workloads pump,dashboard --duration 30 --concurrency 4 --output before.json
+
+Against a running server:
+
+    python -m benchmarks.run --base-url http://localhost:8000 --username admin --password ...
+
+The pump workload writes bons: run it on a database filled by
+benchmarks.datagen, never on production.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from benchmarks.datagen import BENCH_USER
+from benchmarks.workloads import WORKLOADS
+
+COUNTED_TABLES = ['service', 'vehicule', 'benificiaire', 'dotation', 'dotation_archive', 'approvisionnement']
+
+
+class CallResult:
+    ok = False
+    wire_bytes = 0
+    body_bytes = 0
+
+
+class Recorder:
+    """Durations per (workload, operation), shared by the worker threads"""
+    
+    def __init__(self):
+        self.durations = {}
+        self.errors = {}
+        # (workload, operation) -> [wire bytes, body bytes]
+        self.bytes = {}
+        self.lock = threading.Lock()
+        self.enabled = True
+    
+    @contextmanager
+    def time(self, workload: str, operation: str):
+        result = CallResult()
+        start = time.perf_counter()
+        try:
+            yield result
+        finally:
+            duration = time.perf_counter() - start
+            if self.enabled:
+                key = (workload, operation)
+                with self.lock:
+                    self.durations.setdefault(key, []).append(duration)
+                    if not result.ok:
+                        self.errors[key] = self.errors.get(key, 0) + 1
+                    transferred = self.bytes.setdefault(key, [0, 0])
+                    transferred[0] += result.wire_bytes
+                    transferred[1] += result.body_bytes
+
+
+def percentile(sorted_values, pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(durations, errors: int, elapsed: float, transferred=(0, 0)) -> dict:
+    values = sorted(durations)
+    wire, body = transferred
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(1000 * sum(values) / len(values), 2) if values else 0.0,
+            "p50": round(1000 * percentile(values, 50), 2),
+            "p95": round(1000 * percentile(values, 95), 2),
+            "p99": round(1000 * percentile(values, 99), 2),
+            "max": round(1000 * values[-1], 2) if values else 0.0
+        },
+        # Response bodies: as received (compressed, empty for a 304) and decoded
+        "bytes": {
+            "wire": wire,
+            "body": body,
+            "wire_per_request": round(wire / len(values)) if values else 0
+        }
+    }
+
+
+def run_workload(workload_classes, client, args) -> dict:
+    """Run the workloads together, each with args.concurrency threads"""
+    contexts = {cls.name: cls.setup(client) for cls in workload_classes}
+    recorder = Recorder()
+    iterations = {cls.name: [0] * args.concurrency for cls in workload_classes}
+    failures = []
+    stop = threading.Event()
+    
+    def worker(cls, index: int):
+        workload = cls(client, recorder, index, args.concurrency, random.Random(args.seed + index))
+        while not stop.is_set():
+            try:
+                workload.iteration(contexts[cls.name])
+            except Exception as e:
+                failures.append(f"{cls.name}: {e}")
+                return
+            if recorder.enabled:
+                iterations[cls.name][index] += 1
+    
+    threads = [
+        threading.Thread(target=worker, args=(cls, i), daemon=True)
+        for cls in workload_classes for i in range(args.concurrency)
+    ]
+    recorder.enabled = False
+    for t in threads:
+        t.start()
+    time.sleep(args.warmup)
+    
+    with recorder.lock:
+        recorder.durations.clear()
+        recorder.errors.clear()
+        recorder.bytes.clear()
+        recorder.enabled = True
+        for counts in iterations.values():
+            counts[:] = [0] * args.concurrency
+        start = time.perf_counter()
+    time.sleep(args.duration)
+    with recorder.lock:
+        recorder.enabled = False
+        elapsed = time.perf_counter() - start
+    stop.set()
+    for t in threads:
+        t.join()
+    
+    if failures:
+        raise RuntimeError(failures[0])
+    
+    all_durations = [d for durations in recorder.durations.values() for d in durations]
+    totals = [sum(b[i] for b in recorder.bytes.values()) for i in (0, 1)]
+    result = summarize(all_durations, sum(recorder.errors.values()), elapsed, totals)
+    total_iterations = sum(sum(counts) for counts in iterations.values())
+    result["iterations"] = total_iterations
+    result["iterations_per_s"] = round(total_iterations / elapsed, 2)
+    # Operations of concurrent workloads are prefixed with their workload
+    grouped = len(workload_classes) > 1
+    result["operations"] = {
+        f"{name}/{operation}" if grouped else operation: summarize(durations, recorder.errors.get((name, operation), 0), elapsed, recorder.bytes.get((name, operation), (0, 0)))
+        for (name, operation), durations in sorted(recorder.durations.items())
+    }
+    return result
+
+
+def git_commit() -> dict:
+    def git(*command):
+        try:
+            return subprocess.run(["git", *command], capture_output=True, text=True, timeout=10).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ""
+    return {"commit": git("rev-parse", "HEAD") or None, "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def dataset_counts(dsn: str) -> dict:
+    import psycopg2
+    conn = psycopg2.connect(dsn)
+    try:
+        cur = conn.cursor()
+        counts = {}
+        for table in COUNTED_TABLES:
+            cur.execute(f"SELECT COUNT(*) FROM {table}")
+            counts[table] = cur.fetchone()[0]
+        return counts
+    finally:
+        conn.close()
+
+
+def make_client(args):
+    if args.base_url:
+        import httpx
+        client = httpx.Client(base_url=args.base_url, timeout=120)
+        if args.token:
+            token = args.token
+        else:
+            response = client.post("/api/auth/login", json={"username": args.username, "password": args.password})
+            response.raise_for_status()
+            token = response.json()["access_token"]
+    else:
+        os.environ["DATABASE_URL"] = args.dsn
+        from fastapi.testclient import TestClient
+        from app.main import app
+        from app.core.security import create_access_token
+        client = TestClient(app)
+        # Tokens are checked against the users table: use the datagen user
+        token = args.token or create_access_token({"sub": BENCH_USER, "role": "ADMIN"})
+    
+    client.headers["Authorization"] = f"Bearer {token}"
+    return client
+
+
+def run_workloads(names, client, args) -> dict:
+    report = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "git": git_commit(),
+        "target": args.base_url or "in-process",
+        "dataset": dataset_counts(args.dsn) if args.dsn else None,
+        "config": {"duration_s": args.duration, "warmup_s": args.warmup, "concurrency": args.concurrency, "seed": args.seed},
+        "python": sys.version.split()[0],
+        "workloads": {}
+    }
+    
+    for name in names:
+        print(f"[BENCH] {name}...", file=sys.stderr)
+        result = run_workload([WORKLOADS[w] for w in name.split("+")], client, args)
+        report["workloads"][name] = result
+        print(
+            f"[BENCH] {name}: {result['throughput_rps']} req/s, p50 {result['latency_ms']['p50']} ms, "
+            f"p95 {result['latency_ms']['p95']} ms, p99 {result['latency_ms']['p99']} ms, {result['errors']} erreur(s)",
+            file=sys.stderr
+        )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks des parcours API")
+    parser.add_argument("--dsn", help="Base de données (exécution in-process, et comptage du jeu de données)")
+    parser.add_argument("--base-url", help="Serveur à tester au lieu de l'application in-process")
+    parser.add_argument("--token", help="JWT à utiliser (sinon généré in-process ou obtenu via --username/--password)")
+    parser.add_argument("--username")
+    parser.add_argument("--password")
+    parser.add_argument(
+        "--workloads", default="pump,dashboard,lists,import",
+        help=f"Parmi {', '.join(WORKLOADS)}; a+b lance a et b en même temps"
+    )
+    parser.add_argument("--duration", type=float, default=20, help="Secondes mesurées par workload")
+    parser.add_argument("--warmup", type=float, default=3, help="Secondes d'échauffement non mesurées")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Fichier JSON (sinon sortie standard)")
+    args = parser.parse_args()
+    
+    if not args.base_url and not args.dsn:
+        parser.error("--dsn ou --base-url est requis")
+    names = [n.strip() for n in args.workloads.split(",") if n.strip()]
+    unknown = [w for n in names for w in n.split("+") if w not in WORKLOADS]
+    if unknown:
+        parser.error(f"Workload inconnu: {', '.join(unknown)}")
+    
+    # Entering the client runs the application startup (cache listener)
+    with make_client(args) as client:
+        report = run_workloads(names, client, args)
+    
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Serialization benchmark of large list responses (app.core.json_rows).
+
+Fetches --rows rows of the /api/approvisionnement/list query and turns them
+into the response body both ways, --repeat times each:
+- dict: RealDictCursor, dict(r) copies, response_model=dict validation and
+  JSONResponse, the path list endpoints used before json_rows
+- tuple: tuple cursor, fetch_rows() and orjson (json_rows.encode)
+
+Prints the median time of the fetch and of the encoding, and the peak
+memory allocated (tracemalloc) on the way. Then, for the same rows, the
+size (raw and gzip) and the median encode and decode times of each list
+format (json, columns, msgpack):
+
+    python -m benchmarks.serialize --dsn postgresql://postgres@localhost/dpa_bench --rows 10000
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import statistics
+import time
+import tracemalloc
+
+LIST_QUERY = """
+    SELECT
+        a.id, a.type_approvi, a.date, a.qte, a.km_precedent, a.km, a.anomalie,
+        a.dotation_id, a.vhc_provisoire, a.km_provisoire, a.matricule_conducteur,
+        a.service_affecte as service_externe, a.destination as ville_origine,
+        a.ordre_mission, a.observations, a.numero_bon,
+        v.ncivil, v.marque, v.carburant, v.police, a.police_vehicule,
+        b.nom as benificiaire_nom, s.nom as service_nom, b.fonction, s.direction
+    FROM approvisionnement a
+    LEFT JOIN dotation_all d ON a.dotation_id = d.id
+    LEFT JOIN vehicule v ON d.vehicule_id = v.id
+    LEFT JOIN benificiaire b ON d.benificiaire_id = b.id
+    LEFT JOIN service s ON b.service_id = s.id
+    ORDER BY a.date DESC, a.id DESC
+    LIMIT %s
+"""
+
+
+def dict_path(conn, rows: int):
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_response_field
+    from app.db.database import get_db_cursor
+    
+    start = time.perf_counter()
+    cur = get_db_cursor(conn)
+    cur.execute(LIST_QUERY, (rows,))
+    content = {"items": [dict(r) for r in cur.fetchall()], "page": 1}
+    fetched = time.perf_counter()
+    field = create_response_field(name="response", type_=dict)
+    body = JSONResponse(asyncio.run(serialize_response(field=field, response_content=content, is_coroutine=True))).body
+    return fetched - start, time.perf_counter() - fetched, len(body)
+
+
+def tuple_path(conn, rows: int):
+    from app.core.json_rows import encode, fetch_rows
+    from app.db.database import get_tuple_cursor
+    
+    start = time.perf_counter()
+    cur = get_tuple_cursor(conn)
+    cur.execute(LIST_QUERY, (rows,))
+    content = {"items": fetch_rows(cur), "page": 1}
+    fetched = time.perf_counter()
+    body = encode(None, content)
+    return fetched - start, time.perf_counter() - fetched, len(body)
+
+
+def measure(path, conn, rows: int, repeat: int) -> dict:
+    path(conn, rows)  # warm-up
+    fetch, encode, peaks = [], [], []
+    for _ in range(repeat):
+        tracemalloc.start()
+        fetch_s, encode_s, size = path(conn, rows)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        # Timings without tracemalloc overhead
+        fetch_s, encode_s, size = path(conn, rows)
+        fetch.append(fetch_s)
+        encode.append(encode_s)
+    return {
+        "fetch_ms": statistics.median(fetch) * 1000,
+        "encode_ms": statistics.median(encode) * 1000,
+        "peak_kib": max(peaks) / 1024,
+        "bytes": size
+    }
+
+
+def median_ms(fn, repeat: int) -> float:
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations) * 1000
+
+
+def measure_formats(conn, rows: int, repeat: int) -> dict:
+    from app.core import json_rows
+    from app.db.database import get_tuple_cursor
+    
+    cur = get_tuple_cursor(conn)
+    cur.execute(LIST_QUERY, (rows,))
+    content = {"items": json_rows.fetch_rows(cur), "page": 1}
+    loads = json_rows.orjson.loads if json_rows.orjson is not None else json.loads
+    
+    results = {}
+    for fmt in ("json", "columns", "msgpack"):
+        variant = None if fmt == "json" else fmt
+        if fmt == "msgpack":
+            if json_rows.msgpack is None:
+                continue
+            decode = json_rows.msgpack.unpackb
+        else:
+            decode = loads
+        body = json_rows.encode(variant, content)
+        results[fmt] = {
+            "bytes": len(body),
+            "gzip_bytes": len(gzip.compress(body, 6)),
+            "encode_ms": median_ms(lambda: json_rows.encode(variant, content), repeat),
+            "decode_ms": median_ms(lambda: decode(body), repeat)
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare la sérialisation dict et tuple des grandes listes")
+    parser.add_argument("--dsn", required=True, help="Base remplie par benchmarks.datagen")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+    
+    os.environ["DATABASE_URL"] = args.dsn
+    from app.db.database import get_db
+    
+    with get_db() as conn:
+        results = {name: measure(path, conn, args.rows, args.repeat) for name, path in (("dict", dict_path), ("tuple", tuple_path))}
+        formats = measure_formats(conn, args.rows, args.repeat)
+    
+    print(f"{'chemin':<8} {'fetch ms':>10} {'encodage ms':>12} {'total ms':>10} {'pic KiB':>10} {'octets':>10}")
+    for name, r in results.items():
+        print(f"{name:<8} {r['fetch_ms']:>10.1f} {r['encode_ms']:>12.1f} {r['fetch_ms'] + r['encode_ms']:>10.1f} {r['peak_kib']:>10.0f} {r['bytes']:>10}")
+    
+    print()
+    print(f"{'format':<8} {'octets':>10} {'gzip':>10} {'encodage ms':>12} {'décodage ms':>12}")
+    for name, r in formats.items():
+        print(f"{name:<8} {r['bytes']:>10} {r['gzip_bytes']:>10} {r['encode_ms']:>12.1f} {r['decode_ms']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""
+Row-level vs statement-level triggers (migration 002).
+
+Replays the same dotation and bon workload twice on a database filled by
+benchmarks.datagen, each time in a transaction that is rolled back:
+
+- row: the FOR EACH ROW triggers of newv.sql (set_numordre_dotation as
+  amended by migration 001), installed for the transaction in place of
+  those of migration 002
+- statement: the triggers installed by migration 002
+
+The workload creates the dotations of the month following the latest one
+and bons on them: first one statement per row (dotations, then bons), then
+multi-row INSERTs on other vehicles (dotations, then several DOTATION bons
+per dotation, some using it up, and MISSION bons). After each part, the
+states are compared: qte_consomme, reste, cloture and numordre of every
+dotation (by vehicle and month, ids differing between the runs) and km of
+every vehicle. numordre is only expected to match after the single-row
+part: multi-row statements number each dotation once, in id order. Prints
+the time of each phase for both sets and the differences; exits with
+status 1 when the states differ.
+
+    python -m benchmarks.triggers --dsn postgresql://postgres@localhost/dpa_bench
+"""
+import argparse
+import random
+import sys
+import time
+import psycopg2
+import psycopg2.extras
+
+STATEMENT_TRIGGERS = (
+    ("trg_update_qte_consomme", "approvisionnement"),
+    ("trg_update_km_after_appro", "approvisionnement"),
+    ("trg_close_previous_dotation", "dotation"),
+    ("trg_assign_numordre_dotation", "dotation"),
+    ("trg_renumber_dotation", "dotation"),
+)
+
+# newv.sql and migration 001, under other names so that the functions of
+# migration 002 stay in place for the statement run
+ROW_TRIGGERS = """
+CREATE FUNCTION row_set_numordre_dotation()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_numordre INT;
+    v_direction VARCHAR(100);
+BEGIN
+    SELECT s.direction INTO v_direction
+    FROM benificiaire b
+    JOIN service s ON b.service_id = s.id
+    WHERE b.id = NEW.benificiaire_id;
+    
+    SELECT COALESCE(MAX(d.numordre), 0) INTO v_numordre
+    FROM dotation d
+    JOIN benificiaire b ON d.benificiaire_id = b.id
+    JOIN service s ON b.service_id = s.id
+    WHERE s.direction = v_direction;
+    
+    SELECT GREATEST(v_numordre, COALESCE(MAX(numordre), 0)) INTO v_numordre
+    FROM dotation_archive_numordre
+    WHERE direction = v_direction;
+    
+    NEW.numordre := v_numordre + 1;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION row_update_qte_consomme()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.type_approvi = 'DOTATION' THEN
+        UPDATE dotation
+        SET qte_consomme = qte_consomme + NEW.qte
+        WHERE id = NEW.dotation_id;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION row_update_vehicle_km()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.type_approvi = 'DOTATION' THEN
+        IF NEW.vhc_provisoire IS NULL THEN
+            UPDATE vehicule
+            SET km = NEW.km
+            WHERE id = (SELECT vehicule_id FROM dotation WHERE id = NEW.dotation_id)
+              AND NEW.km > km;
+        END IF;
+    ELSIF NEW.type_approvi = 'MISSION' THEN
+        UPDATE vehicule
+        SET km = NEW.km
+        WHERE police = NEW.police_vehicule
+          AND NEW.km > km;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION row_close_previous_dotation()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE dotation
+    SET cloture = TRUE
+    WHERE vehicule_id = NEW.vehicule_id
+      AND cloture = FALSE
+      AND id != NEW.id
+      AND ((annee < NEW.annee) OR (annee = NEW.annee AND mois < NEW.mois));
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_set_numordre_dotation
+    BEFORE INSERT OR UPDATE ON dotation
+    FOR EACH ROW EXECUTE FUNCTION row_set_numordre_dotation();
+
+CREATE TRIGGER trg_update_qte_consomme
+    AFTER INSERT ON approvisionnement
+    FOR EACH ROW EXECUTE FUNCTION row_update_qte_consomme();
+
+CREATE TRIGGER trg_update_km_after_appro
+    AFTER INSERT ON approvisionnement
+    FOR EACH ROW EXECUTE FUNCTION row_update_vehicle_km();
+
+CREATE TRIGGER trg_close_previous_dotation
+    AFTER INSERT ON dotation
+    FOR EACH ROW EXECUTE FUNCTION row_close_previous_dotation();
+"""
+
+FIELDS = ("qte_consomme", "reste", "cloture", "numordre")
+
+BON_COLUMNS = "INSERT INTO approvisionnement (type_approvi, qte, km_precedent, km, dotation_id, police_vehicule, ordre_mission)"
+
+
+def install_row_triggers(cur):
+    for name, table in STATEMENT_TRIGGERS:
+        cur.execute(f"DROP TRIGGER {name} ON {table}")
+    cur.execute(ROW_TRIGGERS)
+
+
+def target_month(cur):
+    """Month after the latest dotation"""
+    cur.execute("SELECT annee, mois FROM dotation ORDER BY annee DESC, mois DESC LIMIT 1")
+    annee, mois = cur.fetchone()
+    return (annee + 1, 1) if mois == 12 else (annee, mois + 1)
+
+
+def run_workload(cur, args, timings: dict, snapshots: dict):
+    """The workload, identical for both trigger sets (same seed, same data):
+    single-row statements first, then multi-row ones on other vehicles"""
+    rng = random.Random(args.seed)
+    annee, mois = target_month(cur)
+    
+    # Source of the new month: the latest dotation of every active vehicle
+    cur.execute("""
+        SELECT DISTINCT ON (d.vehicule_id) d.vehicule_id, d.benificiaire_id, d.qte
+        FROM dotation d
+        JOIN vehicule v ON v.id = d.vehicule_id
+        WHERE v.actif = TRUE
+        ORDER BY d.vehicule_id, d.annee DESC, d.mois DESC
+    """)
+    sources = cur.fetchall()[:args.single_dotations + args.bulk_dotations]
+    single, bulk = sources[:args.single_dotations], sources[args.single_dotations:]
+    km, reste = {}, {}
+    
+    def timed(phase, fn):
+        start = time.perf_counter()
+        fn()
+        timings[phase] = time.perf_counter() - start
+    
+    def new_dotations(vehicles) -> list:
+        """(dotation id, vehicle id, police) of the target month, remembering km and reste"""
+        cur.execute("""
+            SELECT d.id, d.vehicule_id, d.qte, v.km, v.police
+            FROM dotation d
+            JOIN vehicule v ON v.id = d.vehicule_id
+            WHERE d.annee = %s AND d.mois = %s AND d.vehicule_id = ANY(%s)
+            ORDER BY d.vehicule_id
+        """, (annee, mois, [v for v, _, _ in vehicles]))
+        rows = cur.fetchall()
+        for dotation_id, vehicule_id, qte, vehicle_km, _ in rows:
+            km[vehicule_id] = vehicle_km or 0
+            reste[dotation_id] = float(qte)
+        return [(dotation_id, vehicule_id, police) for dotation_id, vehicule_id, _, _, police in rows]
+    
+    def bon(dotation_id, vehicule_id, qte):
+        previous = km[vehicule_id]
+        km[vehicule_id] = previous + rng.randint(50, 400)
+        reste[dotation_id] -= qte
+        return ('DOTATION', qte, previous, km[vehicule_id], dotation_id, None, None)
+    
+    # 1. Single-row statements: dotations, then bons on them
+    def insert_single_dotations():
+        for v, b, q in single:
+            cur.execute(
+                "INSERT INTO dotation (vehicule_id, benificiaire_id, mois, annee, qte) VALUES (%s, %s, %s, %s, %s)",
+                (v, b, mois, annee, q)
+            )
+    
+    timed("dotations (une par instruction)", insert_single_dotations)
+    dotations = new_dotations(single)
+    single_bons = []
+    for _ in range(args.single_bons if dotations else 0):
+        dotation_id, vehicule_id, _ = rng.choice(dotations)
+        qte = round(min(reste[dotation_id], rng.uniform(5, 15)), 2)
+        if qte > 0:
+            single_bons.append(bon(dotation_id, vehicule_id, qte))
+    
+    def insert_single_bons():
+        for row in single_bons:
+            cur.execute(BON_COLUMNS + " VALUES (%s, %s, %s, %s, %s, %s, %s)", row)
+    
+    timed("bons (un par instruction)", insert_single_bons)
+    snapshots["single"] = snapshot(cur)
+    
+    # 2. Multi-row statements: dotations, then several bons per dotation,
+    # every fifth dotation being used up exactly, and MISSION bons
+    def insert_bulk_dotations():
+        psycopg2.extras.execute_values(cur, """
+            INSERT INTO dotation (vehicule_id, benificiaire_id, mois, annee, qte) VALUES %s
+        """, [(v, b, mois, annee, q) for v, b, q in bulk], page_size=len(bulk) or 1)
+    
+    timed("dotations (multi-lignes)", insert_bulk_dotations)
+    dotations = new_dotations(bulk)
+    bulk_bons = []
+    for i, (dotation_id, vehicule_id, police) in enumerate(rng.sample(dotations, min(len(dotations), args.bulk_bons // 3))):
+        if reste[dotation_id] < 3:
+            continue
+        if i % 5 == 0:
+            parts = [round(reste[dotation_id] / 3, 2)] * 2
+            parts.append(round(reste[dotation_id] - sum(parts), 2))
+        else:
+            parts = [round(min(reste[dotation_id] / 4, rng.uniform(1, 10)), 2) for _ in range(3)]
+        for qte in parts:
+            bulk_bons.append(bon(dotation_id, vehicule_id, qte))
+        if i % 7 == 0:
+            previous = km[vehicule_id]
+            km[vehicule_id] = previous + rng.randint(50, 400)
+            bulk_bons.append(('MISSION', round(rng.uniform(10, 40), 2), previous, km[vehicule_id], None, police, f"OM-BENCH-{i}"))
+    
+    def insert_bulk_bons():
+        if bulk_bons:
+            psycopg2.extras.execute_values(cur, BON_COLUMNS + " VALUES %s", bulk_bons, page_size=len(bulk_bons))
+    
+    timed("bons (multi-lignes)", insert_bulk_bons)
+    snapshots["bulk"] = snapshot(cur)
+    return len(single), len(single_bons), len(bulk), len(bulk_bons)
+
+
+def snapshot(cur) -> dict:
+    cur.execute("SELECT vehicule_id, annee, mois, qte_consomme, reste, cloture, numordre FROM dotation")
+    dotations = {(r[0], r[1], r[2]): r[3:] for r in cur.fetchall()}
+    cur.execute("SELECT id, km FROM vehicule")
+    return {"dotations": dotations, "km": dict(cur.fetchall())}
+
+
+def run(dsn: str, mode: str, args):
+    conn = psycopg2.connect(dsn)
+    try:
+        cur = conn.cursor()
+        if mode == "row":
+            install_row_triggers(cur)
+        timings, snapshots = {}, {}
+        counts = run_workload(cur, args, timings, snapshots)
+        return timings, counts, snapshots
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def differences(row: dict, statement: dict, fields=FIELDS) -> list:
+    diffs = []
+    for key in sorted(set(row["dotations"]) | set(statement["dotations"])):
+        a, b = row["dotations"].get(key), statement["dotations"].get(key)
+        label = f"dotation véhicule {key[0]} {key[2]:02d}/{key[1]}"
+        if a is None or b is None:
+            diffs.append(f"{label}: {'absente' if a is None else 'présente'} (ligne) / {'absente' if b is None else 'présente'} (instruction)")
+            continue
+        for field, x, y in zip(FIELDS, a, b):
+            if field in fields and x != y:
+                diffs.append(f"{label} {field}: {x} (ligne) / {y} (instruction)")
+    for vehicule_id in sorted(set(row["km"]) | set(statement["km"])):
+        x, y = row["km"].get(vehicule_id), statement["km"].get(vehicule_id)
+        if x != y:
+            diffs.append(f"véhicule {vehicule_id} km: {x} (ligne) / {y} (instruction)")
+    return diffs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare les triggers par ligne et par instruction (migration 002)")
+    parser.add_argument("--dsn", required=True, help="Base remplie par benchmarks.datagen (rien n'y est écrit)")
+    parser.add_argument("--single-dotations", type=int, default=100)
+    parser.add_argument("--single-bons", type=int, default=300)
+    parser.add_argument("--bulk-dotations", type=int, default=500)
+    parser.add_argument("--bulk-bons", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    
+    results = {mode: run(args.dsn, mode, args) for mode in ("row", "statement")}
+    (row_timings, counts, row_states), (statement_timings, _, statement_states) = results["row"], results["statement"]
+    
+    print("{} dotations et {} bons une instruction par ligne, {} dotations et {} bons en une instruction".format(*counts))
+    print(f"{'phase':<34} {'ligne ms':>10} {'instruction ms':>15} {'gain':>6}")
+    for phase, row_time in row_timings.items():
+        statement_time = statement_timings[phase]
+        gain = row_time / statement_time if statement_time else 0.0
+        print(f"{phase:<34} {row_time * 1000:>10.1f} {statement_time * 1000:>15.1f} {gain:>5.1f}x")
+    
+    # Single-row statements: same state, numordre included. Multi-row
+    # statements: numordre is handed out once per dotation and statement,
+    # in id order, instead of once per row, so only its changes are counted
+    checks = (
+        ("après les instructions d'une ligne", differences(row_states["single"], statement_states["single"])),
+        ("après les instructions multi-lignes", differences(row_states["bulk"], statement_states["bulk"], FIELDS[:-1])),
+    )
+    failed = False
+    for label, diffs in checks:
+        if diffs:
+            failed = True
+            print(f"\n{len(diffs)} différence(s) {label}:")
+            for line in diffs[:50]:
+                print(f"  {line}")
+        else:
+            print(f"\nÉtat identique {label}")
+    renumbered = len(differences(row_states["bulk"], statement_states["bulk"], FIELDS[-1:]))
+    print(f"numordre différent après les instructions multi-lignes: {renumbered} dotation(s)")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
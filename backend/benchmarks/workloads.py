@@ -0,0 +1,236 @@
+"""
+Scripted workloads.
+
+A workload is a class whose iteration() performs one scripted user action
+(possibly several HTTP calls) through `self.call`, which times each call
+under an operation name. setup() runs once, before the timed phase, to
+fetch what the iterations need (police numbers, an Excel file...).
+"""
+import random
+from io import BytesIO
+import openpyxl
+from benchmarks.datagen import BENCH_USER
+
+
+class Workload:
+    name = None
+    
+    def __init__(self, client, recorder, worker: int, workers: int, rng: random.Random):
+        self.client = client
+        self.recorder = recorder
+        self.worker = worker
+        self.workers = workers
+        self.rng = rng
+    
+    @classmethod
+    def setup(cls, client) -> dict:
+        return {}
+    
+    def call(self, operation: str, method: str, url: str, expected=(200,), **kwargs):
+        with self.recorder.time(self.name, operation) as result:
+            response = self.client.request(method, url, **kwargs)
+            result.ok = response.status_code in expected
+            # On the wire (compressed) and decoded sizes of the body
+            result.wire_bytes = response.num_bytes_downloaded
+            result.body_bytes = len(response.content)
+        return response
+    
+    def iteration(self, context: dict):
+        raise NotImplementedError
+
+
+def active_dotations(client, limit: int = 1000) -> list:
+    response = client.get("/api/dotation/active", params={"page": 1, "per_page": limit})
+    response.raise_for_status()
+    return response.json()["items"]
+
+
+class PumpWorkload(Workload):
+    """Pump attendant: search a police number, then record a DOTATION bon"""
+    name = "pump"
+    
+    @classmethod
+    def setup(cls, client) -> dict:
+        return {"polices": [d["police"] for d in active_dotations(client) if float(d["reste"]) >= 10]}
+    
+    def iteration(self, context: dict):
+        # Each worker owns its vehicles so concurrent bons never race on km
+        polices = context["polices"][self.worker::self.workers]
+        police = self.rng.choice(polices)
+        response = self.call("search", "POST", "/api/approvisionnement/search", json={"police": police}, expected=(200, 404))
+        if response.status_code != 200:
+            return
+        
+        vehicle = response.json()
+        if vehicle["reste"] < 1:
+            return
+        km = vehicle["km"] or 0
+        self.call("insert", "POST", "/api/approvisionnement/dotation", json={
+            "dotation_id": vehicle["dotation_id"],
+            "qte": round(min(vehicle["reste"], self.rng.uniform(5, 15)), 2),
+            "km_precedent": km,
+            "km": km + self.rng.randint(50, 400)
+        })
+
+
+class DashboardWorkload(Workload):
+    """Dashboard page: the stats endpoints it loads"""
+    name = "dashboard"
+    
+    ENDPOINTS = [
+        ("dashboard", "/api/stats/dashboard"),
+        ("par-jour", "/api/stats/consommation-par-jour"),
+        ("par-carburant", "/api/stats/consommation-par-carburant"),
+        ("par-service", "/api/stats/consommation-par-service"),
+        ("par-type", "/api/stats/consommation-par-type"),
+        ("anomalies", "/api/stats/anomalies"),
+    ]
+    
+    def iteration(self, context: dict):
+        for operation, url in self.ENDPOINTS:
+            self.call(operation, "GET", url)
+
+
+class ListsWorkload(Workload):
+    """Paged lists, and the per_page=1000 fetches the pages use for export"""
+    name = "lists"
+    
+    def iteration(self, context: dict):
+        page = self.rng.randint(1, 20)
+        self.call("approvisionnement", "GET", "/api/approvisionnement/list", params={"page": page, "per_page": 20})
+        self.call("dotation-active", "GET", "/api/dotation/active", params={"page": page, "per_page": 10})
+        self.call("dotation-archived", "GET", "/api/dotation/archived", params={"page": page, "per_page": 10})
+        
+        if self.rng.random() < 0.2:
+            self.call("export-approvisionnement", "GET", "/api/approvisionnement/list", params={"page": 1, "per_page": 1000})
+            self.call("export-dotation", "GET", "/api/dotation/active", params={"page": 1, "per_page": 1000})
+
+
+class ReferenceWorkload(Workload):
+    """Reference data the forms and the Vehicules/Benificiaires pages load"""
+    name = "reference"
+    
+    @classmethod
+    def setup(cls, client) -> dict:
+        response = client.get("/api/services")
+        response.raise_for_status()
+        return {"services": [s["id"] for s in response.json()]}
+    
+    def iteration(self, context: dict):
+        service_id = self.rng.choice(context["services"])
+        self.call("services", "GET", "/api/services")
+        self.call("directions", "GET", "/api/directions")
+        self.call("service", "GET", f"/api/services/{service_id}")
+        self.call("by-service", "GET", f"/api/benificiaires/by-service/{service_id}")
+        self.call("available-vehicles", "GET", "/api/dotation/available-vehicles", params={"mois": self.rng.randint(1, 12), "annee": 2025})
+        self.call("vehicules-page", "GET", "/api/vehicules/", params={"page": 1, "per_page": 1000})
+        self.call("benificiaires-page", "GET", "/api/benificiaires", params={"page": 1, "per_page": 1000})
+        if self.rng.random() < 0.3:
+            self.call("vehicules-search", "GET", "/api/vehicules/", params={"search": self.rng.choice("ABCDEFGH")})
+
+
+class PagesWorkload(Workload):
+    """Page visits of a browser with an HTTP cache: the lists the pages load,
+    revalidated with If-None-Match once fetched (run with pump to see bons
+    invalidating the approvisionnement list)"""
+    name = "pages"
+    
+    PAGES = [
+        ("vehicules", "/api/vehicules/", {"page": 1, "per_page": 1000}),
+        ("benificiaires", "/api/benificiaires", {"page": 1, "per_page": 1000}),
+        ("services", "/api/services", {}),
+        ("approvisionnement", "/api/approvisionnement/list", {"page": 1, "per_page": 5000}),
+    ]
+    
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.etags = {}
+    
+    def iteration(self, context: dict):
+        operation, url, params = self.rng.choice(self.PAGES)
+        headers = {"If-None-Match": self.etags[operation]} if operation in self.etags else {}
+        response = self.call(operation, "GET", url, expected=(200, 304), params=params, headers=headers)
+        if "etag" in response.headers:
+            self.etags[operation] = response.headers["etag"]
+
+
+class FieldsWorkload(Workload):
+    """Large lists fetched whole, then with the few fields a picker or an
+    export needs (?fields=): compare the full-* and narrow-* operations"""
+    name = "fields"
+    
+    LISTS = [
+        ("approvisionnement", "/api/approvisionnement/list", {"page": 1, "per_page": 1000}, "id,date,qte,police"),
+        ("dotation-active", "/api/dotation/active", {"page": 1, "per_page": 1000}, "id,police,reste"),
+        ("vehicules", "/api/vehicules/", {"page": 1, "per_page": 1000}, "id,police"),
+    ]
+    
+    def iteration(self, context: dict):
+        operation, url, params, fields = self.rng.choice(self.LISTS)
+        self.call(f"full-{operation}", "GET", url, params=params)
+        self.call(f"narrow-{operation}", "GET", url, params={**params, "fields": fields})
+
+
+class ImportWorkload(Workload):
+    """Excel import analysis of a monthly dotation file"""
+    name = "import"
+    
+    ROWS = 500
+    
+    @classmethod
+    def setup(cls, client) -> dict:
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.append(['N° POLICE', 'N° CIVIL', 'MARQUE', 'CARBURANT', 'KM', 'SERVICE',
+                   'NOM ET PRENOM DU BENEFICIAIRE', 'QTE', 'QUALITE'])
+        dotations = active_dotations(client, cls.ROWS)
+        for d in dotations:
+            ws.append([d["police"], d["nCivil"], d["marque"], d["carburant"], 0, d["service_nom"],
+                       d["benificiaire_nom"], d["qte"], d["benificiaire_fonction"]])
+        # A few vehicles the import would create
+        for i in range(max(0, cls.ROWS - len(dotations))):
+            ws.append([f"BENCH-{i:05d}", f"{90000 + i}-T-1", "DACIA LOGAN", "gasoil", 1000,
+                       dotations[0]["service_nom"] if dotations else "DEB", f"NOUVEAU {i:05d}", 200, "DISPOSITION"])
+        
+        data = BytesIO()
+        wb.save(data)
+        return {"excel": data.getvalue()}
+    
+    def iteration(self, context: dict):
+        self.call("analyze", "POST", "/api/dotation/import-excel/analyze", files={
+            "file": ("dotations.xlsx", context["excel"], "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        })
+
+
+class ReportsWorkload(Workload):
+    """Back office at month start: full lists, dashboard and database reports
+    fired without pause; run as pump+reports to check that the pump keeps
+    its latency while they are admitted a few at a time (the 503s of the
+    shed ones count as errors)"""
+    name = "reports"
+    
+    REPORTS = [
+        ("approvisionnement-full", "/api/approvisionnement/list", {"page": 1, "per_page": 5000}),
+        ("dashboard", "/api/stats/dashboard", {}),
+        ("par-service", "/api/stats/consommation-par-service", {}),
+        ("anomalies", "/api/stats/anomalies", {}),
+        ("db-indexes", "/api/admin/db/indexes", {}),
+        ("db-bloat", "/api/admin/db/bloat", {}),
+    ]
+    
+    def iteration(self, context: dict):
+        operation, url, params = self.rng.choice(self.REPORTS)
+        self.call(operation, "GET", url, params=params)
+
+
+class LoginWorkload(Workload):
+    """Logins of the user created by benchmarks.datagen (bcrypt check)"""
+    name = "login"
+    
+    USERNAME = PASSWORD = BENCH_USER
+    
+    def iteration(self, context: dict):
+        self.call("login", "POST", "/api/auth/login", json={"username": self.USERNAME, "password": self.PASSWORD})
+
+
+WORKLOADS = {w.name: w for w in (PumpWorkload, DashboardWorkload, ListsWorkload, ReferenceWorkload, PagesWorkload, FieldsWorkload, ImportWorkload, ReportsWorkload, LoginWorkload)}
@@ -2,8 +2,9 @@ import { useState } from 'react';
 import { useQuery, useMutation, useQueryClient } from '@tanstack/react-query';
 import { Printer, Trash2, Download, Search, ChevronLeft, ChevronRight, FileSpreadsheet } from 'lucide-react';
 import { approvisionnementService } from '../services/approvisionnement';
-import { exportToExcel } from '../utils/excelExport';
+import { jobsService } from '../services/jobs';
 import { getUser } from '../services/auth';
+import { useLiveRefresh } from '../services/events';
 import TypeBadge from './TypeBadge';
 import toast from 'react-hot-toast';
 import { format } from 'date-fns';
@@ -13,6 +14,7 @@ export default function ApprovisionnementList({ typeFilter: initialTypeFilter =
   const [currentPage, setCurrentPage] = useState(1);
   const [searchTerm, setSearchTerm] = useState('');
   const [typeFilter, setTypeFilter] = useState(initialTypeFilter);
+  const [exporting, setExporting] = useState(false);
   const itemsPerPage = 10;
   
   const user = getUser();
@@ -25,6 +27,9 @@ export default function ApprovisionnementList({ typeFilter: initialTypeFilter =
     queryFn: () => approvisionnementService.getList(1, 5000, typeFilter === 'all' ? null : typeFilter)
   });
 
+  // New bons appear without reloading
+  useLiveRefresh([['approvisionnements']]);
+
   // Extract items from response
   const approvisionnements = response?.items || [];
 
@@ -71,18 +76,33 @@ export default function ApprovisionnementList({ typeFilter: initialTypeFilter =
     toast.success('Impression du bon en cours...');
   };
 
-  const handleExportExcel = () => {
+  const handleExportExcel = async () => {
     if (!filteredData || filteredData.length === 0) {
       toast.error('Aucune donnée à exporter');
       return;
     }
 
+    // Built by a background job on the server, every matching bon included
+    setExporting(true);
+    const toastId = toast.loading('Export en cours...');
     try {
-      const filename = exportToExcel(filteredData);
-      toast.success(`Fichier Excel exporté: ${filename}`);
+      const { job_id } = await approvisionnementService.export({
+        type_filter: typeFilter === 'all' ? null : typeFilter,
+        search: searchTerm || null
+      });
+      const job = await jobsService.waitFor(job_id, (j) => {
+        toast.loading(`Export en cours... ${j.progress}%`, { id: toastId });
+      });
+      if (job.status !== 'succeeded') {
+        throw new Error(job.message);
+      }
+      const filename = await jobsService.downloadFile(job_id);
+      toast.success(`Fichier Excel exporté: ${filename}`, { id: toastId });
     } catch (error) {
       console.error('Export error:', error);
-      toast.error('Erreur lors de l\'export Excel');
+      toast.error(error.jobTimeout ? error.message : 'Erreur lors de l\'export Excel', { id: toastId });
+    } finally {
+      setExporting(false);
     }
   };
 
@@ -165,6 +185,7 @@ export default function ApprovisionnementList({ typeFilter: initialTypeFilter =
           {/* Export Excel */}
           <button
             onClick={handleExportExcel}
+            disabled={exporting}
             className="btn-secondary flex items-center gap-2"
           >
             <FileSpreadsheet className="h-4 w-4" />
@@ -1,6 +1,7 @@
 import { useState } from 'react';
 import { X, Upload, FileSpreadsheet, AlertCircle, CheckCircle, XCircle, Loader } from 'lucide-react';
 import toast from 'react-hot-toast';
+import { jobsService } from '../services/jobs';
 
 export default function ExcelImportModal({ isOpen, onClose, onSuccess }) {
   const [file, setFile] = useState(null);
@@ -8,6 +9,7 @@ export default function ExcelImportModal({ isOpen, onClose, onSuccess }) {
   const [annee, setAnnee] = useState(new Date().getFullYear());
   const [analyzing, setAnalyzing] = useState(false);
   const [importing, setImporting] = useState(false);
+  const [importProgress, setImportProgress] = useState(0);
   const [previewData, setPreviewData] = useState(null);
 
   if (!isOpen) return null;
@@ -80,10 +82,11 @@ export default function ExcelImportModal({ isOpen, onClose, onSuccess }) {
     }
 
     setImporting(true);
+    setImportProgress(0);
 
     try {
       const response = await fetch(
-        `${import.meta.env.VITE_API_URL || 'http://localhost:8000/api'}/dotation/import-excel/execute?mois=${mois}&annee=${annee}`,
+        `${import.meta.env.VITE_API_URL || 'http://localhost:8000/api'}/dotation/import-excel/execute?mois=${mois}&annee=${annee}&background=true`,
         {
           method: 'POST',
           headers: {
@@ -96,7 +99,17 @@ export default function ExcelImportModal({ isOpen, onClose, onSuccess }) {
         }
       );
 
-      const result = await response.json();
+      const queued = await response.json();
+      if (!response.ok) {
+        throw new Error(queued.detail || 'Erreur import');
+      }
+
+      // The import runs in a background job: poll it until it is finished
+      const job = await jobsService.waitFor(queued.job_id, (j) => setImportProgress(j.progress));
+      if (job.status !== 'succeeded') {
+        throw new Error(job.message || 'Erreur import');
+      }
+      const result = job.result;
 
       if (!result.success) {
         // Display detailed errors
@@ -336,7 +349,7 @@ export default function ExcelImportModal({ isOpen, onClose, onSuccess }) {
                 {importing ? (
                   <>
                     <Loader className="h-5 w-5 animate-spin" />
-                    Import en cours...
+                    Import en cours... {importProgress}%
                   </>
                 ) : (
                   <>Importer {previewData.summary.valid_rows} dotation(s)</>
@@ -3,6 +3,7 @@ import { Link } from 'react-router-dom';
 import { Car, FileText, Fuel, MapPin, AlertTriangle, TrendingUp, Activity } from 'lucide-react';
 import { statsService } from '../services/stats';
 import { getUser } from '../services/auth';
+import { useLiveRefresh } from '../services/events';
 
 export default function Dashboard() {
   const user = getUser();
@@ -20,6 +21,9 @@ export default function Dashboard() {
     queryFn: () => statsService.getConsommationParType()
   });
 
+  // New bons and quota changes refresh the figures
+  useLiveRefresh([['dashboard-stats'], ['type-stats']]);
+
   if (isLoading) {
     return (
       <div className="flex items-center justify-center h-64">
@@ -1,8 +1,8 @@
-import { useState } from 'react';
-import { useQuery, useMutation, useQueryClient } from '@tanstack/react-query';
+import { useState, useEffect } from 'react';
+import { useQuery, useMutation, useQueryClient, keepPreviousData } from '@tanstack/react-query';
 import { Plus, Calendar, Users, Fuel, FileText, AlertCircle, ChevronRight, ChevronDown, Search, FileSpreadsheet } from 'lucide-react';
 import { dotationService } from '../services/dotation';
-import { vehiculesService } from '../services/vehicules';
+import { vehiculesService, servicesService } from '../services/vehicules';
 import { benificiairesService } from '../services/vehicules';
 import { approvisionnementService } from '../services/approvisionnement';
 import { exportDotationsToExcel } from '../utils/excelExport';
@@ -20,6 +20,9 @@ export default function Dotation() {
   const [activeTab, setActiveTab] = useState('active');
   const [page, setPage] = useState(1);
   const [searchTerm, setSearchTerm] = useState('');
+  const [debouncedSearch, setDebouncedSearch] = useState('');
+  const [filters, setFilters] = useState({ mois: '', annee: '', direction: '', carburant: '', conso_min: '' });
+  const [sort, setSort] = useState('');
   const [expandedDotation, setExpandedDotation] = useState(null);
   const perPage = 10;
   
@@ -35,45 +38,59 @@ export default function Dotation() {
   const isAdmin = user?.role === 'ADMIN';
   const queryClient = useQueryClient();
 
-  // Fetch dotations - Get ALL for client-side search/pagination
+  // Search is sent to the API once typing pauses
+  useEffect(() => {
+    const timer = setTimeout(() => setDebouncedSearch(searchTerm), 300);
+    return () => clearTimeout(timer);
+  }, [searchTerm]);
+
+  // A year is only sent once complete: "2", "20"... are refused by the API (annee >= 2020)
+  const apiFilters = {
+    ...filters,
+    annee: /^\d{4}$/.test(filters.annee) && Number(filters.annee) >= 2020 ? filters.annee : ''
+  };
+
+  // Filters, sort and pagination are applied by the API: fetch only the visible page
+  const listParams = {
+    ...apiFilters,
+    search: debouncedSearch,
+    sort,
+    active_only: activeTab === 'active'
+  };
   const { data: paginationData, isLoading } = useQuery({
-    queryKey: ['dotations', activeTab],
-    queryFn: () => dotationService.getAll({
-      page: 1,
-      per_page: 1000, // Get all dotations
-      active_only: activeTab === 'active'
-    })
+    queryKey: ['dotations', activeTab, page, debouncedSearch, apiFilters, sort],
+    queryFn: () => dotationService.getAll({ ...listParams, page, per_page: perPage }),
+    placeholderData: keepPreviousData
   });
 
-  const allData = paginationData?.items || [];
-
-  // Client-side search filter - searches ALL data
-  const filteredData = allData.filter(dotation => {
-    if (!searchTerm) return true;
-    const search = searchTerm.toLowerCase();
-    return (
-      dotation.police?.toLowerCase().includes(search) ||
-      dotation.marque?.toLowerCase().includes(search) ||
-      dotation.benificiaire_nom?.toLowerCase().includes(search) ||
-      dotation.service_nom?.toLowerCase().includes(search)||
-      dotation.direction?.toLowerCase().includes(search)
+  const currentData = paginationData?.items || [];
+  const totalItems = paginationData?.total || 0;
+  const totalPages = paginationData?.pages || 0;
+  const sums = paginationData?.sums;
+  const hasFilters = !!searchTerm || Object.values(filters).some(Boolean);
 
-    );
+  const { data: directions } = useQuery({
+    queryKey: ['directions'],
+    queryFn: () => servicesService.getDirections()
   });
 
-  // Client-side pagination - paginate filtered results
-  const totalItems = filteredData.length;
-  const totalPages = Math.ceil(totalItems / perPage);
-  const startIndex = (page - 1) * perPage;
-  const endIndex = startIndex + perPage;
-  const currentData = filteredData.slice(startIndex, endIndex);
-
-  // Reset to page 1 when search changes
+  // Reset to page 1 when search or a filter changes
   const handleSearchChange = (e) => {
     setSearchTerm(e.target.value);
     setPage(1);
   };
 
+  const handleFilterChange = (name, value) => {
+    setFilters({ ...filters, [name]: value });
+    setPage(1);
+  };
+
+  const clearFilters = () => {
+    setSearchTerm('');
+    setFilters({ mois: '', annee: '', direction: '', carburant: '', conso_min: '' });
+    setPage(1);
+  };
+
   // Fetch AVAILABLE vehicles for form (only those without active dotation)
   const { data: vehiclesData } = useQuery({
     queryKey: ['available-vehicles', formData.mois, formData.annee],
@@ -143,14 +160,16 @@ export default function Dotation() {
     }
   };
 
-  const handleExportExcel = () => {
-    if (!filteredData || filteredData.length === 0) {
+  const handleExportExcel = async () => {
+    if (totalItems === 0) {
       toast.error('Aucune donnée à exporter');
       return;
     }
 
     try {
-      const filename = exportDotationsToExcel(filteredData);
+      // Every matching dotation, not only the visible page
+      const all = await dotationService.getAll({ ...listParams, page: 1, per_page: totalItems });
+      const filename = exportDotationsToExcel(all.items);
       toast.success(`Fichier Excel exporté: ${filename}`);
     } catch (error) {
       console.error('Export error:', error);
@@ -404,6 +423,73 @@ export default function Dotation() {
         </button>
       </div>
 
+      {/* Filters + Sort */}
+      <div className="card p-4 grid grid-cols-2 md:grid-cols-6 gap-3">
+        <select
+          value={filters.mois}
+          onChange={(e) => handleFilterChange('mois', e.target.value)}
+          className="input-field"
+        >
+          <option value="">Tous les mois</option>
+          {months.map(m => (
+            <option key={m.value} value={m.value}>{m.label}</option>
+          ))}
+        </select>
+        <input
+          type="number"
+          value={filters.annee}
+          onChange={(e) => handleFilterChange('annee', e.target.value)}
+          className="input-field"
+          placeholder="Année"
+          min="2020"
+          max="2030"
+        />
+        <select
+          value={filters.direction}
+          onChange={(e) => handleFilterChange('direction', e.target.value)}
+          className="input-field"
+        >
+          <option value="">Toutes les directions</option>
+          {directions?.map(d => (
+            <option key={d} value={d}>{d}</option>
+          ))}
+        </select>
+        <select
+          value={filters.carburant}
+          onChange={(e) => handleFilterChange('carburant', e.target.value)}
+          className="input-field"
+        >
+          <option value="">Tout carburant</option>
+          <option value="gasoil">Gasoil</option>
+          <option value="essence">Essence</option>
+        </select>
+        <select
+          value={filters.conso_min}
+          onChange={(e) => handleFilterChange('conso_min', e.target.value)}
+          className="input-field"
+        >
+          <option value="">Toute consommation</option>
+          <option value="50">Consommé ≥ 50 %</option>
+          <option value="80">Consommé ≥ 80 %</option>
+          <option value="100">Quota épuisé</option>
+        </select>
+        <select
+          value={sort}
+          onChange={(e) => {
+            setSort(e.target.value);
+            setPage(1);
+          }}
+          className="input-field"
+        >
+          <option value="">Tri par défaut</option>
+          <option value="service">Service</option>
+          <option value="police">Véhicule</option>
+          <option value="periode">Période</option>
+          <option value="reste">Reste (croissant)</option>
+          <option value="consommation">Consommé (décroissant)</option>
+        </select>
+      </div>
+
       {/* Tabs */}
       <div className="flex gap-2 border-b border-gray-200">
         <button
@@ -411,6 +497,7 @@ export default function Dotation() {
             setActiveTab('active');
             setPage(1);
             setSearchTerm('');
+            setSort('');
           }}
           className={`px-4 py-2 font-medium transition-colors border-b-2 ${
             activeTab === 'active'
@@ -425,6 +512,7 @@ export default function Dotation() {
             setActiveTab('archived');
             setPage(1);
             setSearchTerm('');
+            setSort('');
           }}
           className={`px-4 py-2 font-medium transition-colors border-b-2 ${
             activeTab === 'archived'
@@ -436,31 +524,31 @@ export default function Dotation() {
         </button>
       </div>
 
-      {/* Stats Summary */}
-      {filteredData && filteredData.length > 0 && (
+      {/* Stats Summary (every matching dotation, computed by the API) */}
+      {totalItems > 0 && sums && (
         <div className="flex items-start gap-4">
           {/* Stats Cards */}
           <div className="flex-1 grid grid-cols-1 md:grid-cols-4 gap-4">
             <div className="card p-4 bg-gradient-to-br from-blue-50 to-blue-100">
               <p className="text-sm text-blue-600 mb-1">Total Dotations</p>
-              <p className="text-2xl font-bold text-blue-900">{filteredData.length}</p>
+              <p className="text-2xl font-bold text-blue-900">{totalItems}</p>
             </div>
             <div className="card p-4 bg-gradient-to-br from-green-50 to-green-100">
               <p className="text-sm text-green-600 mb-1">QTE Mensuel Total</p>
               <p className="text-2xl font-bold text-green-900">
-                {filteredData.reduce((sum, d) => sum + d.qte, 0)} L
+                {sums.qte} L
               </p>
             </div>
             <div className="card p-4 bg-gradient-to-br from-orange-50 to-orange-100">
               <p className="text-sm text-orange-600 mb-1">Consommé</p>
               <p className="text-2xl font-bold text-orange-900">
-                {filteredData.reduce((sum, d) => sum + d.qte_consomme, 0).toFixed(0)} L
+                {sums.qte_consomme.toFixed(0)} L
               </p>
             </div>
             <div className="card p-4 bg-gradient-to-br from-purple-50 to-purple-100">
               <p className="text-sm text-purple-600 mb-1">Reste</p>
               <p className="text-2xl font-bold text-purple-900">
-                {filteredData.reduce((sum, d) => sum + d.reste, 0).toFixed(0)} L
+                {sums.reste.toFixed(0)} L
               </p>
             </div>
           </div>
@@ -640,19 +728,16 @@ export default function Dotation() {
           <div className="p-12 text-center">
             <Fuel className="h-12 w-12 text-gray-400 mx-auto mb-4" />
             <p className="text-gray-600">
-              {searchTerm
+              {hasFilters
                 ? 'Aucun résultat trouvé pour votre recherche'
                 : activeTab === 'active'
                   ? 'Aucune dotation active pour le moment'
                   : 'Aucune dotation archivée'
               }
             </p>
-            {searchTerm && (
+            {hasFilters && (
               <button
-                onClick={() => {
-                  setSearchTerm('');
-                  setPage(1);
-                }}
+                onClick={clearFilters}
                 className="mt-3 text-sm text-primary-600 hover:text-primary-700"
               >
                 Effacer la recherche
@@ -663,7 +748,7 @@ export default function Dotation() {
       </div>
 
       {/* Pagination Info & Controls */}
-      {filteredData && filteredData.length > 0 && (
+      {totalItems > 0 && (
         <div className="flex items-center justify-between">
           <p className="text-sm text-gray-600">
             Affichage de {((page - 1) * perPage) + 1} à {Math.min(page * perPage, totalItems)} sur {totalItems} dotation(s)
@@ -53,6 +53,19 @@ export const approvisionnementService = {
     return response.data;
   },
 
+  /**
+   * Queue the Excel export of the bons matching the filters
+   * (type_filter, date_from, date_to, mois, annee, search); returns { job_id }
+   */
+  async export(filters = {}) {
+    const params = {};
+    Object.entries(filters).forEach(([key, value]) => {
+      if (value !== '' && value !== null && value !== undefined) params[key] = value;
+    });
+    const response = await api.post('/approvisionnement/export', null, { params });
+    return response.data;
+  },
+
   /**
    * Get DOTATION approvisionnements only
    */
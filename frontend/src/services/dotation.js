@@ -2,13 +2,17 @@ import api from './api';
 
 export const dotationService = {
   /**
-   * Get all dotations (active or archived)
+   * Get a page of dotations (active or archived), filtered and sorted by the API
+   * filters: search, mois, annee, direction, service_id, carburant,
+   * benificiaire_id, conso_min, conso_max, sort (empty values are left out)
    */
-  async getAll({ page = 1, per_page = 20, active_only = true }) {
+  async getAll({ page = 1, per_page = 20, active_only = true, ...filters }) {
     const endpoint = active_only ? '/dotation/active' : '/dotation/archived';
-    const response = await api.get(endpoint, {
-      params: { page, per_page }
+    const params = { page, per_page };
+    Object.entries(filters).forEach(([key, value]) => {
+      if (value !== '' && value !== null && value !== undefined) params[key] = value;
     });
+    const response = await api.get(endpoint, { params });
     return response.data;
   },
 
@@ -0,0 +1,76 @@
+import { useEffect } from 'react';
+import { useQueryClient } from '@tanstack/react-query';
+import api from './api';
+
+// Bursts of events (a bulk import) trigger a single refetch
+const DEBOUNCE_MS = 500;
+// Delay before reopening a stream the server refused or closed
+const RECONNECT_MS = 5000;
+
+/**
+ * Refetch the given queries when a bon is created or a dotation changes
+ * (server-sent events of /events/stream). The stream is opened with a
+ * short-lived ticket (POST /events/ticket), never with the access token:
+ * EventSource would reconnect with an expired ticket, so a closed stream is
+ * reopened with a new one.
+ */
+export function useLiveRefresh(queryKeys, filters = {}) {
+  const queryClient = useQueryClient();
+  const keys = JSON.stringify(queryKeys);
+  const { serviceId, direction } = filters;
+
+  useEffect(() => {
+    const token = localStorage.getItem('token');
+    if (!token || typeof EventSource === 'undefined') return undefined;
+
+    let source = null;
+    let closed = false;
+    let timer = null;
+    let retry = null;
+    let reopened = false;
+
+    const refresh = () => {
+      clearTimeout(timer);
+      timer = setTimeout(() => {
+        JSON.parse(keys).forEach((queryKey) => queryClient.invalidateQueries({ queryKey }));
+      }, DEBOUNCE_MS);
+    };
+
+    const reconnect = () => {
+      if (source) source.close();
+      source = null;
+      clearTimeout(retry);
+      retry = setTimeout(connect, RECONNECT_MS);
+    };
+
+    async function connect() {
+      let ticket;
+      try {
+        ({ data: { ticket } } = await api.post('/events/ticket'));
+      } catch (error) {
+        if (!closed) reconnect();
+        return;
+      }
+      if (closed) return;
+
+      const params = new URLSearchParams({ access_token: ticket });
+      if (serviceId) params.set('service_id', serviceId);
+      if (direction) params.set('direction', direction);
+      source = new EventSource(`${api.defaults.baseURL}/events/stream?${params}`);
+      ['bon', 'dotation', 'refresh', 'overflow', 'resync'].forEach((type) => source.addEventListener(type, refresh));
+      source.onerror = reconnect;
+      // Events sent while the stream was closed are lost
+      if (reopened) source.onopen = refresh;
+      reopened = true;
+    }
+
+    connect();
+
+    return () => {
+      closed = true;
+      clearTimeout(timer);
+      clearTimeout(retry);
+      if (source) source.close();
+    };
+  }, [queryClient, keys, serviceId, direction]);
+}
@@ -0,0 +1,72 @@
+import api from './api';
+
+const FINISHED = ['succeeded', 'failed', 'cancelled'];
+// Longest wait for a worker to take a job (none running: python -m app.worker)
+const QUEUED_TIMEOUT = 60 * 1000;
+// Longest wait for a job to finish
+const TIMEOUT = 30 * 60 * 1000;
+
+export const jobsService = {
+  /**
+   * Get a background job (status, progress, message, result)
+   */
+  async get(id) {
+    const response = await api.get(`/jobs/${id}`);
+    return response.data;
+  },
+
+  /**
+   * Cancel a job (at once if queued, at its next progress report if running)
+   */
+  async cancel(id) {
+    const response = await api.post(`/jobs/${id}/cancel`);
+    return response.data;
+  },
+
+  /**
+   * Poll a job until it is finished; onProgress(job) at every poll.
+   * Throws (error.jobTimeout) and cancels the job when no worker took it
+   * within queuedTimeout ms, or when it is not finished within timeout ms
+   */
+  async waitFor(id, onProgress = null, interval = 1000, { queuedTimeout = QUEUED_TIMEOUT, timeout = TIMEOUT } = {}) {
+    const start = Date.now();
+    for (;;) {
+      const job = await this.get(id);
+      if (onProgress) onProgress(job);
+      if (FINISHED.includes(job.status)) return job;
+
+      // Never taken (a job waiting for its retry is queued too)
+      const untaken = job.status === 'queued' && job.attempts === 0;
+      const elapsed = Date.now() - start;
+      if ((untaken && elapsed > queuedTimeout) || elapsed > timeout) {
+        await this.cancel(id).catch(() => {});
+        const error = new Error(
+          untaken
+            ? 'Aucun worker disponible pour cette tâche, réessayez plus tard'
+            : 'La tâche n\'a pas abouti dans le délai prévu'
+        );
+        error.jobTimeout = true;
+        throw error;
+      }
+      await new Promise((resolve) => setTimeout(resolve, interval));
+    }
+  },
+
+  /**
+   * Download the file of a succeeded job (exports)
+   */
+  async downloadFile(id, fallbackName = 'export.xlsx') {
+    const response = await api.get(`/jobs/${id}/file`, { responseType: 'blob' });
+    const disposition = response.headers['content-disposition'] || '';
+    const match = disposition.match(/filename="?([^";]+)"?/);
+    const filename = match ? match[1] : fallbackName;
+
+    const url = URL.createObjectURL(response.data);
+    const link = document.createElement('a');
+    link.href = url;
+    link.download = filename;
+    link.click();
+    URL.revokeObjectURL(url);
+    return filename;
+  }
+};
@@ -0,0 +1,188 @@
+-- ============================================================================
+-- 001 - HOT/COLD SPLIT FOR CLOSED DOTATIONS
+-- ============================================================================
+-- Closed dotations older than a configurable age are moved out of `dotation`
+-- into `dotation_archive`, so the active path (pump search, triggers,
+-- dashboard) only ever touches the current months.
+-- Usage: SELECT archive_closed_dotations(12);
+-- ============================================================================
+
+-- Archive Table (same layout as dotation)
+CREATE TABLE IF NOT EXISTS dotation_archive (
+    id INTEGER PRIMARY KEY,
+    vehicule_id INTEGER NOT NULL,
+    benificiaire_id INTEGER NOT NULL,
+    mois INTEGER NOT NULL CHECK (mois BETWEEN 1 AND 12),
+    annee INTEGER NOT NULL CHECK (annee >= 2020),
+    qte INTEGER NOT NULL,
+    qte_consomme NUMERIC(6,2) DEFAULT 0 CHECK (qte_consomme >= 0),
+    reste NUMERIC(6,2) GENERATED ALWAYS AS (qte - qte_consomme) STORED,
+    cloture BOOLEAN NOT NULL DEFAULT TRUE CHECK (cloture = TRUE),
+    created_at TIMESTAMP,
+    numordre INTEGER,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (vehicule_id, mois, annee),
+    FOREIGN KEY (benificiaire_id) REFERENCES benificiaire(id) ON DELETE RESTRICT,
+    FOREIGN KEY (vehicule_id) REFERENCES vehicule(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_dotation_archive_periode ON dotation_archive (annee DESC, mois DESC);
+CREATE INDEX IF NOT EXISTS idx_dotation_archive_benificiaire ON dotation_archive (benificiaire_id);
+
+-- Highest numordre per direction among archived rows, so set_numordre_dotation
+-- never reuses a number (numero_bon is built from it) without scanning the archive.
+CREATE TABLE IF NOT EXISTS dotation_archive_numordre (
+    direction TEXT PRIMARY KEY,
+    numordre INTEGER NOT NULL
+);
+
+-- ============================================================================
+-- PARTIAL INDEXES ON THE HOT SET
+-- ============================================================================
+
+CREATE INDEX IF NOT EXISTS idx_dotation_open_vehicule ON dotation (vehicule_id) WHERE cloture = FALSE;
+CREATE INDEX IF NOT EXISTS idx_dotation_open_benificiaire ON dotation (benificiaire_id, annee, mois) WHERE cloture = FALSE;
+CREATE INDEX IF NOT EXISTS idx_dotation_closed_periode ON dotation (annee DESC, mois DESC) WHERE cloture = TRUE;
+
+-- ============================================================================
+-- approvisionnement.dotation_id may now point to either table
+-- ============================================================================
+-- The FK cannot span two tables: existence on insert is already enforced by
+-- check_dotation_status(), deletion is guarded by the triggers below.
+
+ALTER TABLE approvisionnement DROP CONSTRAINT IF EXISTS approvisionnement_dotation_id_fkey;
+
+CREATE OR REPLACE FUNCTION restrict_dotation_delete()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- A row already copied to the archive is being moved, not deleted
+    IF TG_TABLE_NAME = 'dotation'
+       AND EXISTS (SELECT 1 FROM dotation_archive WHERE id = OLD.id) THEN
+        RETURN OLD;
+    END IF;
+
+    IF EXISTS (SELECT 1 FROM approvisionnement WHERE dotation_id = OLD.id) THEN
+        RAISE EXCEPTION 'Dotation % référencée par des approvisionnements', OLD.id
+            USING ERRCODE = 'foreign_key_violation';
+    END IF;
+
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_restrict_dotation_delete ON dotation;
+CREATE TRIGGER trg_restrict_dotation_delete
+    BEFORE DELETE ON dotation
+    FOR EACH ROW
+    EXECUTE FUNCTION restrict_dotation_delete();
+
+DROP TRIGGER IF EXISTS trg_restrict_dotation_archive_delete ON dotation_archive;
+CREATE TRIGGER trg_restrict_dotation_archive_delete
+    BEFORE DELETE ON dotation_archive
+    FOR EACH ROW
+    EXECUTE FUNCTION restrict_dotation_delete();
+
+-- ============================================================================
+-- numordre must keep growing once old rows have left the hot table
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION set_numordre_dotation()
+RETURNS TRIGGER AS
+$$
+DECLARE
+    v_numordre INT;
+    v_direction VARCHAR(100);
+BEGIN
+    -- 1. Récupérer la direction (utilise NEW.benificiaire_id, pas NEW.id)
+    SELECT s.direction
+    INTO v_direction
+    FROM benificiaire b
+    JOIN service s ON b.service_id = s.id
+    WHERE b.id = NEW.benificiaire_id;
+
+    -- 2. Trouver le max (COALESCE pour gérer NULL)
+    SELECT COALESCE(MAX(d.numordre), 0)
+    INTO v_numordre
+    FROM dotation d
+    JOIN benificiaire b ON d.benificiaire_id = b.id
+    JOIN service s ON b.service_id = s.id
+    WHERE s.direction = v_direction;
+
+    -- 2b. Ne jamais redescendre sous le max déjà archivé
+    SELECT GREATEST(v_numordre, COALESCE(MAX(numordre), 0))
+    INTO v_numordre
+    FROM dotation_archive_numordre
+    WHERE direction = v_direction;
+
+    -- 3. Incrémenter
+    NEW.numordre := v_numordre + 1;
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================================================
+-- ARCHIVING
+-- ============================================================================
+
+-- Move closed dotations older than p_age_months (relative to the current
+-- month) into dotation_archive. Returns the number of rows moved.
+CREATE OR REPLACE FUNCTION archive_closed_dotations(p_age_months INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    v_limit INTEGER;
+    v_ids INTEGER[];
+BEGIN
+    -- Months are compared as annee * 12 + mois
+    v_limit := EXTRACT(YEAR FROM CURRENT_DATE)::INTEGER * 12
+             + EXTRACT(MONTH FROM CURRENT_DATE)::INTEGER
+             - p_age_months;
+
+    WITH moved AS (
+        INSERT INTO dotation_archive (
+            id, vehicule_id, benificiaire_id, mois, annee,
+            qte, qte_consomme, cloture, created_at, numordre
+        )
+        SELECT id, vehicule_id, benificiaire_id, mois, annee,
+               qte, qte_consomme, TRUE, created_at, numordre
+        FROM dotation
+        WHERE cloture = TRUE
+          AND annee * 12 + mois < v_limit
+        RETURNING id, benificiaire_id, numordre
+    ), floors AS (
+        INSERT INTO dotation_archive_numordre (direction, numordre)
+        SELECT s.direction, MAX(m.numordre)
+        FROM moved m
+        JOIN benificiaire b ON b.id = m.benificiaire_id
+        JOIN service s ON s.id = b.service_id
+        WHERE m.numordre IS NOT NULL
+        GROUP BY s.direction
+        ON CONFLICT (direction) DO UPDATE
+            SET numordre = GREATEST(dotation_archive_numordre.numordre, EXCLUDED.numordre)
+    )
+    SELECT COALESCE(array_agg(id), '{}') INTO v_ids FROM moved;
+
+    -- Separate statement: restrict_dotation_delete() must see the archived copies
+    DELETE FROM dotation WHERE id = ANY(v_ids);
+
+    RETURN COALESCE(array_length(v_ids, 1), 0);
+END;
+$$ LANGUAGE plpgsql;
+
+-- ============================================================================
+-- VIEWS
+-- ============================================================================
+
+-- Every dotation, hot or archived. Used wherever historical bons are joined
+-- back to their dotation (listings, statistics).
+CREATE OR REPLACE VIEW dotation_all AS
+SELECT id, vehicule_id, benificiaire_id, mois, annee, qte, qte_consomme,
+       reste, cloture, created_at, numordre
+FROM dotation
+UNION ALL
+SELECT id, vehicule_id, benificiaire_id, mois, annee, qte, qte_consomme,
+       reste, cloture, created_at, numordre
+FROM dotation_archive;
+
+COMMENT ON TABLE dotation_archive IS 'Dotations clôturées déplacées hors de la table active (voir archive_closed_dotations)';
+COMMENT ON VIEW dotation_all IS 'Dotations actives et archivées';
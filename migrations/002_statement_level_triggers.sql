@@ -0,0 +1,283 @@
+-- ============================================================================
+-- 002 - STATEMENT-LEVEL TRIGGERS FOR BULK WRITES
+-- ============================================================================
+-- update_qte_consomme, update_vehicle_km, close_previous_dotation and
+-- set_numordre_dotation used to run once per inserted/updated row. They now
+-- run once per statement and read the affected rows from transition tables,
+-- so a 1,000-row insert costs a handful of set-based UPDATEs.
+--
+-- Row-level semantics are preserved; where several rows of one statement hit
+-- the same dotation/direction, rows are processed in id order (the order
+-- PostgreSQL used for the row triggers in practice).
+-- Requires 001_dotation_archive.sql (dotation_archive_numordre).
+-- ============================================================================
+
+DROP TRIGGER IF EXISTS trg_update_qte_consomme ON approvisionnement;
+DROP TRIGGER IF EXISTS trg_update_km_after_appro ON approvisionnement;
+DROP TRIGGER IF EXISTS trg_close_previous_dotation ON dotation;
+DROP TRIGGER IF EXISTS trg_set_numordre_dotation ON dotation;
+DROP TRIGGER IF EXISTS trg_assign_numordre_dotation ON dotation;
+DROP TRIGGER IF EXISTS trg_renumber_dotation ON dotation;
+
+-- ============================================================================
+-- 1. numordre of new and updated dotations
+-- ============================================================================
+-- Each row gets max(numordre of its direction) + 1, rows of the same
+-- statement being numbered one after the other. This used to be a
+-- BEFORE INSERT OR UPDATE row trigger, so it is kept for both events.
+--
+-- Statements of this file that update dotation themselves set numordre in
+-- the same UPDATE and raise the dpa.renumbering flag, so the row is written
+-- once; trg_renumber_dotation handles every other UPDATE.
+
+-- Next numordre for p_ids. Rows in p_exclude are ignored when looking for the
+-- current max (rows of an INSERT statement, not numbered yet).
+CREATE OR REPLACE FUNCTION next_numordres(p_ids INTEGER[], p_exclude INTEGER[])
+RETURNS TABLE (id INTEGER, numordre INTEGER) AS $$
+DECLARE
+    v_direction TEXT;
+    v_numordre INT;
+BEGIN
+    IF array_length(p_ids, 1) = 1 THEN
+        -- Single row (every bon, every API write): same lookups as the
+        -- former row trigger, without planning the set-based query
+        SELECT s.direction
+        INTO v_direction
+        FROM dotation d
+        JOIN benificiaire b ON b.id = d.benificiaire_id
+        JOIN service s ON s.id = b.service_id
+        WHERE d.id = p_ids[1];
+
+        SELECT COALESCE(MAX(d.numordre), 0)
+        INTO v_numordre
+        FROM dotation d
+        JOIN benificiaire b ON d.benificiaire_id = b.id
+        JOIN service s ON b.service_id = s.id
+        WHERE s.direction = v_direction
+          AND d.id <> ALL(p_exclude);
+
+        SELECT GREATEST(v_numordre, COALESCE(MAX(f.numordre), 0))
+        INTO v_numordre
+        FROM dotation_archive_numordre f
+        WHERE f.direction = v_direction;
+
+        id := p_ids[1];
+        numordre := v_numordre + 1;
+        RETURN NEXT;
+        RETURN;
+    END IF;
+
+    RETURN QUERY
+    WITH cibles AS (
+        SELECT d.id, s.direction,
+               ROW_NUMBER() OVER (PARTITION BY s.direction ORDER BY d.id) AS rang
+        FROM dotation d
+        JOIN benificiaire b ON b.id = d.benificiaire_id
+        JOIN service s ON s.id = b.service_id
+        WHERE d.id = ANY(p_ids)
+    ), maxima AS (
+        SELECT s.direction, MAX(d.numordre) AS numordre
+        FROM dotation d
+        JOIN benificiaire b ON d.benificiaire_id = b.id
+        JOIN service s ON b.service_id = s.id
+        WHERE s.direction IN (SELECT c.direction FROM cibles c)
+          AND d.id <> ALL(p_exclude)
+        GROUP BY s.direction
+    )
+    SELECT c.id,
+           (GREATEST(COALESCE(m.numordre, 0), COALESCE(f.numordre, 0)) + c.rang)::INTEGER
+    FROM cibles c
+    LEFT JOIN maxima m ON m.direction = c.direction
+    LEFT JOIN dotation_archive_numordre f ON f.direction = c.direction;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION set_numordre_dotation()
+RETURNS TRIGGER AS
+$$
+DECLARE
+    v_ids INTEGER[];
+BEGIN
+    IF current_setting('dpa.renumbering', TRUE) = 'on' THEN
+        RETURN NULL;
+    END IF;
+
+    SELECT ARRAY_AGG(r.id) INTO v_ids FROM new_rows r;
+    IF v_ids IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    PERFORM set_config('dpa.renumbering', 'on', TRUE);
+
+    UPDATE dotation d
+    SET numordre = n.numordre
+    FROM next_numordres(
+        v_ids,
+        -- New rows start without a number; updated rows keep competing with
+        -- their previous one
+        CASE WHEN TG_OP = 'INSERT' THEN v_ids ELSE '{}' END
+    ) n
+    WHERE d.id = n.id;
+
+    PERFORM set_config('dpa.renumbering', 'off', TRUE);
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- "assign" sorts before "close": new rows are numbered before
+-- close_previous_dotation() renumbers the rows it closes.
+CREATE TRIGGER trg_assign_numordre_dotation
+    AFTER INSERT ON dotation
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION set_numordre_dotation();
+
+CREATE TRIGGER trg_renumber_dotation
+    AFTER UPDATE ON dotation
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION set_numordre_dotation();
+
+-- ============================================================================
+-- 2. qte_consomme after approvisionnement
+-- ============================================================================
+-- One UPDATE per dotation with the summed quantity. check_and_close_dotation()
+-- (row-level, unchanged) only looks at reste *before* each update, so with
+-- one update per bon a dotation ended up closed when the reste left before the
+-- last bon of the statement was <= 0. That condition is applied explicitly.
+CREATE OR REPLACE FUNCTION update_qte_consomme()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_ids INTEGER[];
+BEGIN
+    SELECT ARRAY_AGG(DISTINCT r.dotation_id) INTO v_ids
+    FROM new_rows r
+    WHERE r.type_approvi = 'DOTATION';
+
+    IF v_ids IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    PERFORM set_config('dpa.renumbering', 'on', TRUE);
+
+    UPDATE dotation d
+    SET qte_consomme = d.qte_consomme + n.total,
+        cloture = d.cloture OR (d.reste - n.total_sauf_dernier <= 0),
+        numordre = nn.numordre
+    FROM (
+        SELECT r.dotation_id,
+               SUM(r.qte) AS total,
+               SUM(r.qte) - (ARRAY_AGG(r.qte ORDER BY r.id DESC))[1] AS total_sauf_dernier
+        FROM new_rows r
+        WHERE r.type_approvi = 'DOTATION'
+        GROUP BY r.dotation_id
+    ) n
+    JOIN next_numordres(v_ids, '{}') nn ON nn.id = n.dotation_id
+    WHERE d.id = n.dotation_id;
+
+    PERFORM set_config('dpa.renumbering', 'off', TRUE);
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_update_qte_consomme
+    AFTER INSERT ON approvisionnement
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION update_qte_consomme();
+
+-- ============================================================================
+-- 3. Vehicle kilometrage after approvisionnement
+-- ============================================================================
+-- KM only ever goes up, so applying the highest KM per vehicle once gives the
+-- same result as applying every bon in turn.
+CREATE OR REPLACE FUNCTION update_vehicle_km()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- DOTATION: via dotation_id → vehicule_id, only when no provisoire vehicle
+    UPDATE vehicule v
+    SET km = n.km
+    FROM (
+        SELECT d.vehicule_id, MAX(r.km) AS km
+        FROM new_rows r
+        JOIN dotation d ON d.id = r.dotation_id
+        WHERE r.type_approvi = 'DOTATION'
+          AND r.vhc_provisoire IS NULL
+        GROUP BY d.vehicule_id
+    ) n
+    WHERE v.id = n.vehicule_id
+      AND n.km > v.km;
+
+    -- MISSION: via police_vehicule
+    UPDATE vehicule v
+    SET km = n.km
+    FROM (
+        SELECT r.police_vehicule, MAX(r.km) AS km
+        FROM new_rows r
+        WHERE r.type_approvi = 'MISSION'
+        GROUP BY r.police_vehicule
+    ) n
+    WHERE v.police = n.police_vehicule
+      AND n.km > v.km;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_update_km_after_appro
+    AFTER INSERT ON approvisionnement
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION update_vehicle_km();
+
+-- ============================================================================
+-- 4. Auto-close previous month dotations when new dotations are created
+-- ============================================================================
+-- Only the latest new month per vehicle matters: anything older than it,
+-- including other rows of the same statement, is closed.
+CREATE OR REPLACE FUNCTION close_previous_dotation()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_ids INTEGER[];
+BEGIN
+    SELECT ARRAY_AGG(d.id ORDER BY d.id) INTO v_ids
+    FROM dotation d
+    JOIN (
+        SELECT DISTINCT ON (r.vehicule_id) r.vehicule_id, r.annee, r.mois
+        FROM new_rows r
+        ORDER BY r.vehicule_id, r.annee DESC, r.mois DESC
+    ) n ON d.vehicule_id = n.vehicule_id
+    WHERE d.cloture = FALSE
+      AND (d.annee, d.mois) < (n.annee, n.mois);
+
+    IF v_ids IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    PERFORM set_config('dpa.renumbering', 'on', TRUE);
+
+    UPDATE dotation d
+    SET cloture = TRUE,
+        numordre = nn.numordre
+    FROM next_numordres(v_ids, '{}') nn
+    WHERE d.id = nn.id;
+
+    PERFORM set_config('dpa.renumbering', 'off', TRUE);
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_close_previous_dotation
+    AFTER INSERT ON dotation
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION close_previous_dotation();
+
+COMMENT ON TRIGGER trg_update_qte_consomme ON approvisionnement IS 'Met à jour qte_consomme dans dotation (une mise à jour par instruction)';
+COMMENT ON TRIGGER trg_update_km_after_appro ON approvisionnement IS 'Met à jour le kilométrage des véhicules (une mise à jour par instruction)';
+COMMENT ON TRIGGER trg_close_previous_dotation ON dotation IS 'Clôture les dotations précédentes lors de la création de nouvelles';
+COMMENT ON TRIGGER trg_assign_numordre_dotation ON dotation IS 'Attribue numordre aux nouvelles dotations';
+COMMENT ON TRIGGER trg_renumber_dotation ON dotation IS 'Réattribue numordre aux dotations modifiées';
@@ -0,0 +1,254 @@
+-- ============================================================================
+-- 003 - KEEP qte_consomme EXACT AND RECONCILE IT WITH THE BONS
+-- ============================================================================
+-- qte_consomme was only ever incremented (update_qte_consomme), so deleting or
+-- editing a bon left consumption, reste and closure out of sync. Deletes and
+-- updates of approvisionnement now adjust the counter, and
+-- reconcile_dotations() recomputes it from the bons to report/repair the
+-- drift accumulated so far.
+-- Requires 002_statement_level_triggers.sql.
+-- ============================================================================
+
+-- Dotations whose bons changed since the last reconciliation (incremental mode)
+CREATE TABLE IF NOT EXISTS dotation_reconciliation_queue (
+    dotation_id INTEGER PRIMARY KEY,
+    touched_at TIMESTAMP NOT NULL DEFAULT clock_timestamp()
+);
+
+CREATE TABLE IF NOT EXISTS dotation_reconciliation_run (
+    id SERIAL PRIMARY KEY,
+    started_at TIMESTAMP NOT NULL,
+    finished_at TIMESTAMP NOT NULL,
+    incremental BOOLEAN NOT NULL,
+    repair BOOLEAN NOT NULL,
+    checked INTEGER NOT NULL,
+    mismatches INTEGER NOT NULL,
+    repaired INTEGER NOT NULL
+);
+
+-- Bons of one dotation (reconciliation, /approvisionnement/by-dotation)
+CREATE INDEX IF NOT EXISTS idx_approvisionnement_dotation ON approvisionnement (dotation_id);
+
+DROP TRIGGER IF EXISTS trg_adjust_qte_consomme_delete ON approvisionnement;
+DROP TRIGGER IF EXISTS trg_adjust_qte_consomme_update ON approvisionnement;
+DROP TRIGGER IF EXISTS trg_queue_reconciliation_insert ON approvisionnement;
+DROP TRIGGER IF EXISTS trg_queue_reconciliation_update ON approvisionnement;
+DROP TRIGGER IF EXISTS trg_queue_reconciliation_delete ON approvisionnement;
+
+-- ============================================================================
+-- 1. qte_consomme after DELETE / UPDATE of approvisionnement
+-- ============================================================================
+-- One UPDATE per statement with the net change per dotation (deleted bons
+-- count negative). Closure is left to check_and_close_dotation() as for
+-- inserts; a dotation is never reopened automatically since it may have been
+-- closed by the rollover or by an admin.
+-- Archived dotations are adjusted too so their history stays exact.
+CREATE OR REPLACE FUNCTION adjust_qte_consomme()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_ids INTEGER[];
+    v_deltas NUMERIC[];
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        SELECT ARRAY_AGG(x.dotation_id), ARRAY_AGG(x.delta)
+        INTO v_ids, v_deltas
+        FROM (
+            SELECT o.dotation_id, -SUM(o.qte) AS delta
+            FROM old_rows o
+            WHERE o.type_approvi = 'DOTATION'
+            GROUP BY o.dotation_id
+        ) x;
+    ELSE
+        SELECT ARRAY_AGG(x.dotation_id), ARRAY_AGG(x.delta)
+        INTO v_ids, v_deltas
+        FROM (
+            SELECT y.dotation_id, SUM(y.qte) AS delta
+            FROM (
+                SELECT n.dotation_id, n.qte FROM new_rows n WHERE n.type_approvi = 'DOTATION'
+                UNION ALL
+                SELECT o.dotation_id, -o.qte FROM old_rows o WHERE o.type_approvi = 'DOTATION'
+            ) y
+            GROUP BY y.dotation_id
+            HAVING SUM(y.qte) <> 0
+        ) x;
+    END IF;
+
+    IF v_ids IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    -- GREATEST: a counter that already drifted below the real total must not
+    -- make the delete fail on the qte_consomme >= 0 check
+    UPDATE dotation d
+    SET qte_consomme = GREATEST(d.qte_consomme + t.delta, 0)
+    FROM unnest(v_ids, v_deltas) AS t(dotation_id, delta)
+    WHERE d.id = t.dotation_id;
+
+    UPDATE dotation_archive d
+    SET qte_consomme = GREATEST(d.qte_consomme + t.delta, 0)
+    FROM unnest(v_ids, v_deltas) AS t(dotation_id, delta)
+    WHERE d.id = t.dotation_id;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_adjust_qte_consomme_delete
+    AFTER DELETE ON approvisionnement
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION adjust_qte_consomme();
+
+CREATE TRIGGER trg_adjust_qte_consomme_update
+    AFTER UPDATE ON approvisionnement
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION adjust_qte_consomme();
+
+-- ============================================================================
+-- 2. Incremental reconciliation queue
+-- ============================================================================
+CREATE OR REPLACE FUNCTION queue_dotation_reconciliation()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO dotation_reconciliation_queue (dotation_id)
+        SELECT DISTINCT n.dotation_id FROM new_rows n WHERE n.dotation_id IS NOT NULL
+        ON CONFLICT (dotation_id) DO UPDATE SET touched_at = EXCLUDED.touched_at;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO dotation_reconciliation_queue (dotation_id)
+        SELECT DISTINCT o.dotation_id FROM old_rows o WHERE o.dotation_id IS NOT NULL
+        ON CONFLICT (dotation_id) DO UPDATE SET touched_at = EXCLUDED.touched_at;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_queue_reconciliation_insert
+    AFTER INSERT ON approvisionnement
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION queue_dotation_reconciliation();
+
+CREATE TRIGGER trg_queue_reconciliation_update
+    AFTER UPDATE ON approvisionnement
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION queue_dotation_reconciliation();
+
+CREATE TRIGGER trg_queue_reconciliation_delete
+    AFTER DELETE ON approvisionnement
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION queue_dotation_reconciliation();
+
+-- ============================================================================
+-- 3. Reconciliation
+-- ============================================================================
+-- Recomputes consumption of (open and closed) dotations from the bons with a
+-- single grouped scan and returns the rows whose qte_consomme differs.
+-- p_incremental: only dotations queued since the last run.
+-- p_repair: also set qte_consomme to the real value.
+-- Queue entries are consumed by repair runs, and by report runs for the
+-- dotations found correct.
+CREATE OR REPLACE FUNCTION reconcile_dotations(
+    p_incremental BOOLEAN DEFAULT FALSE,
+    p_repair BOOLEAN DEFAULT FALSE
+)
+RETURNS TABLE (
+    dotation_id INTEGER,
+    qte INTEGER,
+    qte_consomme NUMERIC,
+    qte_reelle NUMERIC,
+    ecart NUMERIC,
+    cloture BOOLEAN
+) AS $$
+DECLARE
+    v_started TIMESTAMP := clock_timestamp();
+    v_ids INTEGER[];
+    v_checked INTEGER;
+    v_mismatches INTEGER;
+    v_repaired INTEGER := 0;
+BEGIN
+    IF p_incremental THEN
+        SELECT COALESCE(ARRAY_AGG(q.dotation_id), '{}') INTO v_ids
+        FROM dotation_reconciliation_queue q
+        WHERE q.touched_at <= v_started;
+
+        SELECT COUNT(*) INTO v_checked FROM dotation d WHERE d.id = ANY(v_ids);
+    ELSE
+        SELECT COUNT(*) INTO v_checked FROM dotation;
+    END IF;
+
+    CREATE TEMP TABLE IF NOT EXISTS tmp_reconciliation (
+        dotation_id INTEGER PRIMARY KEY,
+        qte INTEGER,
+        qte_consomme NUMERIC,
+        qte_reelle NUMERIC,
+        cloture BOOLEAN
+    ) ON COMMIT DROP;
+    TRUNCATE tmp_reconciliation;
+
+    IF p_incremental THEN
+        INSERT INTO tmp_reconciliation
+        SELECT d.id, d.qte, d.qte_consomme, COALESCE(r.total, 0), d.cloture
+        FROM dotation d
+        LEFT JOIN (
+            SELECT a.dotation_id, SUM(a.qte) AS total
+            FROM approvisionnement a
+            WHERE a.type_approvi = 'DOTATION'
+              AND a.dotation_id = ANY(v_ids)
+            GROUP BY a.dotation_id
+        ) r ON r.dotation_id = d.id
+        WHERE d.id = ANY(v_ids)
+          AND d.qte_consomme <> COALESCE(r.total, 0);
+    ELSE
+        INSERT INTO tmp_reconciliation
+        SELECT d.id, d.qte, d.qte_consomme, COALESCE(r.total, 0), d.cloture
+        FROM dotation d
+        LEFT JOIN (
+            SELECT a.dotation_id, SUM(a.qte) AS total
+            FROM approvisionnement a
+            WHERE a.type_approvi = 'DOTATION'
+            GROUP BY a.dotation_id
+        ) r ON r.dotation_id = d.id
+        WHERE d.qte_consomme <> COALESCE(r.total, 0);
+    END IF;
+
+    GET DIAGNOSTICS v_mismatches = ROW_COUNT;
+
+    IF p_repair AND v_mismatches > 0 THEN
+        UPDATE dotation d
+        SET qte_consomme = t.qte_reelle
+        FROM tmp_reconciliation t
+        WHERE d.id = t.dotation_id;
+
+        GET DIAGNOSTICS v_repaired = ROW_COUNT;
+    END IF;
+
+    DELETE FROM dotation_reconciliation_queue q
+    WHERE q.touched_at <= v_started
+      AND (v_ids IS NULL OR q.dotation_id = ANY(v_ids))
+      AND (p_repair OR NOT EXISTS (
+          SELECT 1 FROM tmp_reconciliation t WHERE t.dotation_id = q.dotation_id
+      ));
+
+    INSERT INTO dotation_reconciliation_run
+        (started_at, finished_at, incremental, repair, checked, mismatches, repaired)
+    VALUES
+        (v_started, clock_timestamp(), p_incremental, p_repair, v_checked, v_mismatches, v_repaired);
+
+    RETURN QUERY
+    SELECT t.dotation_id, t.qte, t.qte_consomme, t.qte_reelle,
+           t.qte_reelle - t.qte_consomme, t.cloture
+    FROM tmp_reconciliation t
+    ORDER BY t.dotation_id;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON TRIGGER trg_adjust_qte_consomme_delete ON approvisionnement IS 'Décrémente qte_consomme à la suppression des bons';
+COMMENT ON TRIGGER trg_adjust_qte_consomme_update ON approvisionnement IS 'Corrige qte_consomme à la modification des bons';
+COMMENT ON FUNCTION reconcile_dotations(BOOLEAN, BOOLEAN) IS 'Compare qte_consomme aux bons et corrige les écarts';
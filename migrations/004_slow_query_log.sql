@@ -0,0 +1,20 @@
+-- ============================================================================
+-- 004 - SLOW QUERY LOG
+-- ============================================================================
+-- Optional persistent copy of the slow queries captured by the API
+-- (SLOW_QUERY_LOG_TABLE=true). Parameters are never stored, only their types.
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS slow_query_log (
+    id BIGSERIAL PRIMARY KEY,
+    captured_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    fingerprint VARCHAR(16) NOT NULL,
+    route VARCHAR(200),
+    duration_ms NUMERIC(12,1) NOT NULL,
+    query TEXT NOT NULL,
+    bind_shapes JSONB,
+    plan JSONB
+);
+
+CREATE INDEX IF NOT EXISTS idx_slow_query_log_captured ON slow_query_log (captured_at DESC);
+CREATE INDEX IF NOT EXISTS idx_slow_query_log_fingerprint ON slow_query_log (fingerprint, captured_at DESC);
@@ -0,0 +1,37 @@
+-- ============================================================================
+-- 005 - USERS CHANGE NOTIFICATIONS
+-- ============================================================================
+-- Every API process caches users (status, role) for token authentication and
+-- LISTENs on dpa_users. The payload is the username whose row changed (both
+-- names on a rename), '*' after a TRUNCATE.
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION notify_users_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_LEVEL = 'STATEMENT' THEN
+        PERFORM pg_notify('dpa_users', '*');
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM pg_notify('dpa_users', OLD.username);
+    END IF;
+    IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.username IS DISTINCT FROM OLD.username) THEN
+        PERFORM pg_notify('dpa_users', NEW.username);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_notify_users_change ON users;
+CREATE TRIGGER trg_notify_users_change
+    AFTER INSERT OR UPDATE OR DELETE ON users
+    FOR EACH ROW
+    EXECUTE FUNCTION notify_users_change();
+
+DROP TRIGGER IF EXISTS trg_notify_users_truncate ON users;
+CREATE TRIGGER trg_notify_users_truncate
+    AFTER TRUNCATE ON users
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_users_change();
@@ -0,0 +1,38 @@
+-- ============================================================================
+-- 006 - REFERENCE TABLES CHANGE NOTIFICATIONS
+-- ============================================================================
+-- Every API process caches service, vehicule and benificiaire (app.core.
+-- ref_cache) and LISTENs on dpa_ref. The payload is the table name; the
+-- whole table is reloaded, so one notification per statement is enough.
+-- NOTIFY is delivered at commit, and identical notifications of one
+-- transaction are sent once.
+--
+-- vehicule.km is updated by every bon: the vehicle snapshot is then reloaded
+-- by the next read of the vehicle lists, not by the bon itself.
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION notify_reference_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('dpa_ref', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_notify_service_change ON service;
+CREATE TRIGGER trg_notify_service_change
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON service
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_reference_change();
+
+DROP TRIGGER IF EXISTS trg_notify_vehicule_change ON vehicule;
+CREATE TRIGGER trg_notify_vehicule_change
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON vehicule
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_reference_change();
+
+DROP TRIGGER IF EXISTS trg_notify_benificiaire_change ON benificiaire;
+CREATE TRIGGER trg_notify_benificiaire_change
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON benificiaire
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_reference_change();
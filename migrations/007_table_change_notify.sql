@@ -0,0 +1,37 @@
+-- ============================================================================
+-- 007 - CHANGE NOTIFICATIONS OF THE BON TABLES
+-- ============================================================================
+-- approvisionnement, dotation and dotation_archive are too large to cache in
+-- the API processes; they only keep a change counter per table
+-- (app.core.table_versions) to build the ETags of the lists computed from
+-- them. The payload is the table name, once per statement. Reference tables
+-- notify on dpa_ref (006).
+--
+-- Requires 001_dotation_archive.sql.
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION notify_table_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('dpa_tables', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_notify_approvisionnement_change ON approvisionnement;
+CREATE TRIGGER trg_notify_approvisionnement_change
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON approvisionnement
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_table_change();
+
+DROP TRIGGER IF EXISTS trg_notify_dotation_change ON dotation;
+CREATE TRIGGER trg_notify_dotation_change
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON dotation
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_table_change();
+
+DROP TRIGGER IF EXISTS trg_notify_dotation_archive_change ON dotation_archive;
+CREATE TRIGGER trg_notify_dotation_archive_change
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON dotation_archive
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_table_change();
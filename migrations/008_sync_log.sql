@@ -0,0 +1,114 @@
+-- ============================================================================
+-- 008 - CHANGE LOG FOR DELTA SYNC
+-- ============================================================================
+-- GET /api/sync lets pump terminals and the SPA keep a local replica of
+-- service, vehicule, benificiaire and the open dotations. sync_log holds one
+-- entry per row ever written: the id of the last transaction that inserted,
+-- updated or deleted it (txid_current(), 64-bit, never wraps). It is
+-- compacted by construction, so a delta costs an index range scan on xid
+-- whatever the size of the tables.
+--
+-- A sync token is the xmin of the snapshot the previous sync read: every
+-- transaction still running then has an xid >= xmin, so `xid >= token`
+-- returns everything committed since, without ever skipping a transaction
+-- that committed late (rows may be sent twice; clients upsert).
+--
+-- Deletions are kept as tombstones (deleted = TRUE). prune_sync_log() drops
+-- old tombstones and raises sync_horizon; tokens older than the horizon, or
+-- than a TRUNCATE, get a full resync.
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS sync_log (
+    table_name TEXT NOT NULL,
+    row_id INTEGER NOT NULL,
+    deleted BOOLEAN NOT NULL DEFAULT FALSE,
+    xid BIGINT NOT NULL,
+    changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (table_name, row_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_sync_log_xid ON sync_log (xid);
+
+-- Oldest token still answered with a delta
+CREATE TABLE IF NOT EXISTS sync_horizon (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    xid BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO sync_horizon (id, xid) VALUES (TRUE, 0) ON CONFLICT (id) DO NOTHING;
+
+-- Rows are locked in id order: concurrent bulk statements cannot deadlock
+CREATE OR REPLACE FUNCTION sync_log_upsert()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO sync_log (table_name, row_id, deleted, xid)
+    SELECT TG_TABLE_NAME, n.id, FALSE, txid_current()
+    FROM new_rows n
+    ORDER BY n.id
+    ON CONFLICT (table_name, row_id) DO UPDATE
+    SET deleted = FALSE, xid = EXCLUDED.xid, changed_at = CURRENT_TIMESTAMP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION sync_log_delete()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO sync_log (table_name, row_id, deleted, xid)
+    SELECT TG_TABLE_NAME, o.id, TRUE, txid_current()
+    FROM old_rows o
+    ORDER BY o.id
+    ON CONFLICT (table_name, row_id) DO UPDATE
+    SET deleted = TRUE, xid = EXCLUDED.xid, changed_at = CURRENT_TIMESTAMP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- No rows to log: every client resyncs
+CREATE OR REPLACE FUNCTION sync_log_truncate()
+RETURNS TRIGGER AS $$
+BEGIN
+    DELETE FROM sync_log WHERE table_name = TG_TABLE_NAME;
+    UPDATE sync_horizon SET xid = GREATEST(xid, txid_current() + 1);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION prune_sync_log(p_keep INTERVAL DEFAULT INTERVAL '30 days')
+RETURNS INTEGER AS $$
+DECLARE
+    v_count INTEGER;
+    v_xid BIGINT;
+BEGIN
+    WITH pruned AS (
+        DELETE FROM sync_log
+        WHERE deleted AND changed_at < CURRENT_TIMESTAMP - p_keep
+        RETURNING xid
+    )
+    SELECT COUNT(*), MAX(xid) INTO v_count, v_xid FROM pruned;
+
+    IF v_xid IS NOT NULL THEN
+        UPDATE sync_horizon SET xid = GREATEST(xid, v_xid + 1);
+    END IF;
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    v_table TEXT;
+BEGIN
+    FOREACH v_table IN ARRAY ARRAY['service', 'vehicule', 'benificiaire', 'dotation'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_sync_log_insert ON %I', v_table);
+        EXECUTE format('CREATE TRIGGER trg_sync_log_insert AFTER INSERT ON %I
+            REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION sync_log_upsert()', v_table);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_sync_log_update ON %I', v_table);
+        EXECUTE format('CREATE TRIGGER trg_sync_log_update AFTER UPDATE ON %I
+            REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION sync_log_upsert()', v_table);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_sync_log_delete ON %I', v_table);
+        EXECUTE format('CREATE TRIGGER trg_sync_log_delete AFTER DELETE ON %I
+            REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION sync_log_delete()', v_table);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_sync_log_truncate ON %I', v_table);
+        EXECUTE format('CREATE TRIGGER trg_sync_log_truncate AFTER TRUNCATE ON %I
+            FOR EACH STATEMENT EXECUTE FUNCTION sync_log_truncate()', v_table);
+    END LOOP;
+END $$;
@@ -0,0 +1,124 @@
+-- ============================================================================
+-- 009 - LIVE EVENTS (NOTIFY dpa_events)
+-- ============================================================================
+-- GET /api/events/stream pushes these to the Dashboard and Historique
+-- screens. One JSON payload per row, with the service and direction the
+-- screens filter on:
+--   {"type": "bon", "id", "type_approvi", "qte", "date", "dotation_id",
+--    "police", "service_id", "direction"}
+--   {"type": "dotation", "op": "insert"|"update", "id", "qte", "cloture",
+--    "vehicule_id", "service_id", "direction"}
+-- Dotation updates are only sent when the quota or the closure changed
+-- (consumption is carried by the bon events).
+--
+-- Statements touching more than push_events_max_rows() rows (imports,
+-- rollover, bulk quota) send a single {"type": "refresh", "table"} instead.
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION push_events_max_rows()
+RETURNS INTEGER AS $$
+    SELECT 50;
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION push_bon_events()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_event TEXT;
+BEGIN
+    IF (SELECT COUNT(*) FROM new_rows) > push_events_max_rows() THEN
+        PERFORM pg_notify('dpa_events', json_build_object('type', 'refresh', 'table', TG_TABLE_NAME)::text);
+        RETURN NULL;
+    END IF;
+
+    FOR v_event IN
+        SELECT json_build_object(
+            'type', 'bon',
+            'id', a.id,
+            'type_approvi', a.type_approvi,
+            'qte', a.qte,
+            'date', a.date,
+            'dotation_id', a.dotation_id,
+            'police', COALESCE(v.police, a.police_vehicule),
+            'service_id', s.id,
+            'direction', s.direction
+        )::text
+        FROM new_rows a
+        LEFT JOIN dotation d ON d.id = a.dotation_id
+        LEFT JOIN vehicule v ON v.id = d.vehicule_id
+        LEFT JOIN benificiaire b ON b.id = d.benificiaire_id
+        LEFT JOIN service s ON s.id = b.service_id
+        ORDER BY a.id
+    LOOP
+        PERFORM pg_notify('dpa_events', v_event);
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION push_dotation_events()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_ids INTEGER[];
+    v_event TEXT;
+BEGIN
+    IF (SELECT COUNT(*) FROM new_rows) > push_events_max_rows() THEN
+        PERFORM pg_notify('dpa_events', json_build_object('type', 'refresh', 'table', TG_TABLE_NAME)::text);
+        RETURN NULL;
+    END IF;
+
+    -- old_rows only exists for UPDATE
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(n.id) INTO v_ids FROM new_rows n;
+    ELSE
+        SELECT array_agg(n.id) INTO v_ids
+        FROM new_rows n
+        JOIN old_rows o ON o.id = n.id
+        WHERE o.qte IS DISTINCT FROM n.qte OR o.cloture IS DISTINCT FROM n.cloture;
+    END IF;
+    IF v_ids IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    FOR v_event IN
+        SELECT json_build_object(
+            'type', 'dotation',
+            'op', lower(TG_OP),
+            'id', n.id,
+            'qte', n.qte,
+            'cloture', n.cloture,
+            'vehicule_id', n.vehicule_id,
+            'service_id', s.id,
+            'direction', s.direction
+        )::text
+        FROM new_rows n
+        JOIN benificiaire b ON b.id = n.benificiaire_id
+        JOIN service s ON s.id = b.service_id
+        WHERE n.id = ANY(v_ids)
+        ORDER BY n.id
+    LOOP
+        PERFORM pg_notify('dpa_events', v_event);
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_push_bon_events ON approvisionnement;
+CREATE TRIGGER trg_push_bon_events
+    AFTER INSERT ON approvisionnement
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION push_bon_events();
+
+DROP TRIGGER IF EXISTS trg_push_dotation_insert_events ON dotation;
+CREATE TRIGGER trg_push_dotation_insert_events
+    AFTER INSERT ON dotation
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION push_dotation_events();
+
+DROP TRIGGER IF EXISTS trg_push_dotation_update_events ON dotation;
+CREATE TRIGGER trg_push_dotation_update_events
+    AFTER UPDATE ON dotation
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION push_dotation_events();
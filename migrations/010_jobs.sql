@@ -0,0 +1,62 @@
+-- ============================================================================
+-- 010 - BACKGROUND JOBS (app.core.jobs, python -m app.worker)
+-- ============================================================================
+-- Long tasks (Excel import, exports, maintenance) are queued here by the API
+-- and run by worker processes. A worker claims the oldest due job with
+--   SELECT ... FOR UPDATE SKIP LOCKED
+-- so any number of workers share the queue without running a job twice.
+--
+-- status: queued -> running -> succeeded | failed | cancelled
+-- A failed attempt goes back to queued (run_after = now + backoff) until
+-- max_attempts; a running job whose heartbeat stopped (worker killed) is
+-- requeued the same way. result_file is a file under JOBS_RESULT_DIR, removed
+-- with the row once expires_at has passed.
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS job (
+    id               BIGSERIAL PRIMARY KEY,
+    kind             VARCHAR(50) NOT NULL,
+    params           JSONB NOT NULL DEFAULT '{}',
+    status           VARCHAR(20) NOT NULL DEFAULT 'queued'
+                     CHECK (status IN ('queued', 'running', 'succeeded', 'failed', 'cancelled')),
+    progress         SMALLINT NOT NULL DEFAULT 0 CHECK (progress BETWEEN 0 AND 100),
+    message          TEXT,
+    result           JSONB,
+    result_file      TEXT,
+    attempts         SMALLINT NOT NULL DEFAULT 0,
+    max_attempts     SMALLINT NOT NULL DEFAULT 3,
+    cancel_requested BOOLEAN NOT NULL DEFAULT FALSE,
+    run_after        TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    worker           VARCHAR(100),
+    heartbeat_at     TIMESTAMP,
+    created_by       VARCHAR(50),
+    created_at       TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    started_at       TIMESTAMP,
+    finished_at      TIMESTAMP,
+    expires_at       TIMESTAMP
+);
+
+-- Claim: oldest due queued job
+CREATE INDEX IF NOT EXISTS idx_job_queued ON job (run_after, id) WHERE status = 'queued';
+-- Stale running jobs (heartbeat too old)
+CREATE INDEX IF NOT EXISTS idx_job_running ON job (heartbeat_at) WHERE status = 'running';
+-- GET /api/jobs: a user's latest jobs
+CREATE INDEX IF NOT EXISTS idx_job_created_by ON job (created_by, id DESC);
+-- Purge of expired jobs and result files
+CREATE INDEX IF NOT EXISTS idx_job_expires ON job (expires_at) WHERE expires_at IS NOT NULL;
+
+-- Wake the idle workers (LISTEN dpa_jobs) when jobs are queued; they also
+-- poll, for retries whose run_after has come and missed notifications
+CREATE OR REPLACE FUNCTION notify_job_queued()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('dpa_jobs', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_notify_job_queued ON job;
+CREATE TRIGGER trg_notify_job_queued
+    AFTER INSERT ON job
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_job_queued();
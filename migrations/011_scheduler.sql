@@ -0,0 +1,28 @@
+-- ============================================================================
+-- 011 - SCHEDULER RUN HISTORY (app.core.scheduler)
+-- ============================================================================
+-- Every uvicorn worker runs a scheduler thread; the one holding the session
+-- advisory lock hashtext('dpa_scheduler') is the leader and alone runs the
+-- scheduled tasks. A run is claimed by inserting its (task, scheduled_for)
+-- row, so a slot runs once even when the leadership moves during a run.
+--
+-- status: running -> succeeded | failed
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS scheduler_run (
+    id            BIGSERIAL PRIMARY KEY,
+    task          VARCHAR(50) NOT NULL,
+    scheduled_for TIMESTAMP NOT NULL,
+    status        VARCHAR(20) NOT NULL DEFAULT 'running'
+                  CHECK (status IN ('running', 'succeeded', 'failed')),
+    worker        VARCHAR(100),
+    started_at    TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    finished_at   TIMESTAMP,
+    duration_ms   INTEGER,
+    result        JSONB,
+    error         TEXT,
+    UNIQUE (task, scheduled_for)
+);
+
+-- GET /api/admin/scheduler/runs: latest runs, of one task or all
+CREATE INDEX IF NOT EXISTS idx_scheduler_run_started ON scheduler_run (started_at DESC);
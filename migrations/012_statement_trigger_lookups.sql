@@ -0,0 +1,195 @@
+-- ============================================================================
+-- 012 - INDEXED LOOKUPS IN THE STATEMENT-LEVEL TRIGGERS (migration 002)
+-- ============================================================================
+-- The UPDATEs of set_numordre_dotation(), update_qte_consomme() and
+-- close_previous_dotation() joined dotation to next_numordres() (estimated
+-- at 1000 rows) and close_previous_dotation() joined it to the transition
+-- table: both were planned as a Seq Scan of dotation, paid by every bon and
+-- every single-row dotation insert (benchmarks.triggers: 2-3x slower than
+-- the former row triggers). The rows are now reached through the primary
+-- key and the (vehicule_id, mois, annee) index. next_numordres() only
+-- filters out the excluded rows (d.id <> ALL(...) doubled the cost of its
+-- MAX) when one of them already has a numordre. Same results.
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION next_numordres(p_ids INTEGER[], p_exclude INTEGER[])
+RETURNS TABLE (id INTEGER, numordre INTEGER) AS $$
+DECLARE
+    v_direction TEXT;
+    v_numordre INT;
+BEGIN
+    IF array_length(p_ids, 1) = 1 THEN
+        -- Single row (every bon, every API write): same lookups as the
+        -- former row trigger, without planning the set-based query
+        SELECT s.direction
+        INTO v_direction
+        FROM dotation d
+        JOIN benificiaire b ON b.id = d.benificiaire_id
+        JOIN service s ON s.id = b.service_id
+        WHERE d.id = p_ids[1];
+
+        -- Rows of an INSERT have no numordre yet: nothing to exclude
+        IF EXISTS (
+            SELECT 1 FROM dotation d
+            WHERE d.id = ANY(p_exclude) AND d.numordre IS NOT NULL
+        ) THEN
+            SELECT COALESCE(MAX(d.numordre), 0)
+            INTO v_numordre
+            FROM dotation d
+            JOIN benificiaire b ON d.benificiaire_id = b.id
+            JOIN service s ON b.service_id = s.id
+            WHERE s.direction = v_direction
+              AND d.id <> ALL(p_exclude);
+        ELSE
+            SELECT COALESCE(MAX(d.numordre), 0)
+            INTO v_numordre
+            FROM dotation d
+            JOIN benificiaire b ON d.benificiaire_id = b.id
+            JOIN service s ON b.service_id = s.id
+            WHERE s.direction = v_direction;
+        END IF;
+
+        SELECT GREATEST(v_numordre, COALESCE(MAX(f.numordre), 0))
+        INTO v_numordre
+        FROM dotation_archive_numordre f
+        WHERE f.direction = v_direction;
+
+        id := p_ids[1];
+        numordre := v_numordre + 1;
+        RETURN NEXT;
+        RETURN;
+    END IF;
+
+    RETURN QUERY
+    WITH cibles AS (
+        SELECT d.id, s.direction,
+               ROW_NUMBER() OVER (PARTITION BY s.direction ORDER BY d.id) AS rang
+        FROM dotation d
+        JOIN benificiaire b ON b.id = d.benificiaire_id
+        JOIN service s ON s.id = b.service_id
+        WHERE d.id = ANY(p_ids)
+    ), maxima AS (
+        SELECT s.direction, MAX(d.numordre) AS numordre
+        FROM dotation d
+        JOIN benificiaire b ON d.benificiaire_id = b.id
+        JOIN service s ON b.service_id = s.id
+        WHERE s.direction IN (SELECT c.direction FROM cibles c)
+          AND d.id <> ALL(p_exclude)
+        GROUP BY s.direction
+    )
+    SELECT c.id,
+           (GREATEST(COALESCE(m.numordre, 0), COALESCE(f.numordre, 0)) + c.rang)::INTEGER
+    FROM cibles c
+    LEFT JOIN maxima m ON m.direction = c.direction
+    LEFT JOIN dotation_archive_numordre f ON f.direction = c.direction;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION set_numordre_dotation()
+RETURNS TRIGGER AS
+$$
+DECLARE
+    v_ids INTEGER[];
+BEGIN
+    IF current_setting('dpa.renumbering', TRUE) = 'on' THEN
+        RETURN NULL;
+    END IF;
+
+    SELECT ARRAY_AGG(r.id) INTO v_ids FROM new_rows r;
+    IF v_ids IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    PERFORM set_config('dpa.renumbering', 'on', TRUE);
+
+    UPDATE dotation d
+    SET numordre = n.numordre
+    FROM next_numordres(
+        v_ids,
+        -- New rows start without a number; updated rows keep competing with
+        -- their previous one
+        CASE WHEN TG_OP = 'INSERT' THEN v_ids ELSE '{}' END
+    ) n
+    WHERE d.id = ANY(v_ids)
+      AND d.id = n.id;
+
+    PERFORM set_config('dpa.renumbering', 'off', TRUE);
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION update_qte_consomme()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_ids INTEGER[];
+BEGIN
+    SELECT ARRAY_AGG(DISTINCT r.dotation_id) INTO v_ids
+    FROM new_rows r
+    WHERE r.type_approvi = 'DOTATION';
+
+    IF v_ids IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    PERFORM set_config('dpa.renumbering', 'on', TRUE);
+
+    UPDATE dotation d
+    SET qte_consomme = d.qte_consomme + n.total,
+        cloture = d.cloture OR (d.reste - n.total_sauf_dernier <= 0),
+        numordre = nn.numordre
+    FROM (
+        SELECT r.dotation_id,
+               SUM(r.qte) AS total,
+               SUM(r.qte) - (ARRAY_AGG(r.qte ORDER BY r.id DESC))[1] AS total_sauf_dernier
+        FROM new_rows r
+        WHERE r.type_approvi = 'DOTATION'
+        GROUP BY r.dotation_id
+    ) n
+    JOIN next_numordres(v_ids, '{}') nn ON nn.id = n.dotation_id
+    WHERE d.id = ANY(v_ids)
+      AND d.id = n.dotation_id;
+
+    PERFORM set_config('dpa.renumbering', 'off', TRUE);
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION close_previous_dotation()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_ids INTEGER[];
+    v_vehicules INTEGER[];
+BEGIN
+    SELECT ARRAY_AGG(DISTINCT r.vehicule_id) INTO v_vehicules FROM new_rows r;
+
+    SELECT ARRAY_AGG(d.id ORDER BY d.id) INTO v_ids
+    FROM dotation d
+    JOIN (
+        SELECT DISTINCT ON (r.vehicule_id) r.vehicule_id, r.annee, r.mois
+        FROM new_rows r
+        ORDER BY r.vehicule_id, r.annee DESC, r.mois DESC
+    ) n ON d.vehicule_id = n.vehicule_id
+    WHERE d.vehicule_id = ANY(v_vehicules)
+      AND d.cloture = FALSE
+      AND (d.annee, d.mois) < (n.annee, n.mois);
+
+    IF v_ids IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    PERFORM set_config('dpa.renumbering', 'on', TRUE);
+
+    UPDATE dotation d
+    SET cloture = TRUE,
+        numordre = nn.numordre
+    FROM next_numordres(v_ids, '{}') nn
+    WHERE d.id = ANY(v_ids)
+      AND d.id = nn.id;
+
+    PERFORM set_config('dpa.renumbering', 'off', TRUE);
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
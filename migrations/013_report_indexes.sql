@@ -0,0 +1,12 @@
+-- ============================================================================
+-- 013 - INDEXES OF THE BON LISTS AND ANOMALY REPORT (benchmarks.plans)
+-- ============================================================================
+-- The paged bon lists (ORDER BY date DESC LIMIT) and the daily consumption
+-- chart (date >= CURRENT_DATE - 30 days) read approvisionnement through
+-- idx_approvisionnement_date instead of sorting the whole table. Only bons
+-- flagged as km anomalies are in idx_approvisionnement_anomalie, so it costs
+-- nothing to the pump inserts of regular bons.
+-- ============================================================================
+
+CREATE INDEX IF NOT EXISTS idx_approvisionnement_date ON approvisionnement (date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_approvisionnement_anomalie ON approvisionnement (date DESC) WHERE anomalie = TRUE;
@@ -0,0 +1,15 @@
+-- ============================================================================
+-- 014 - VEHICULE NOTIFICATIONS WITHOUT KM (migration 006)
+-- ============================================================================
+-- update_vehicle_km() updates vehicule.km on every bon: the statement
+-- trigger of migration 006 then sent NOTIFY dpa_ref for every pump
+-- transaction, every worker reloaded the whole vehicle snapshot and the
+-- /vehicules ETag changed. km is no longer in the snapshot (/vehicules reads
+-- it for the rows of the page), so only writes of the cached columns notify.
+-- ============================================================================
+
+DROP TRIGGER IF EXISTS trg_notify_vehicule_change ON vehicule;
+CREATE TRIGGER trg_notify_vehicule_change
+    AFTER INSERT OR UPDATE OF police, ncivil, marque, carburant, actif OR DELETE OR TRUNCATE ON vehicule
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION notify_reference_change();
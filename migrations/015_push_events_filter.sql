@@ -0,0 +1,56 @@
+-- ============================================================================
+-- 015 - DOTATION EVENTS COUNTED AFTER FILTERING (migration 009)
+-- ============================================================================
+-- push_dotation_events() compared every updated row to
+-- push_events_max_rows() before keeping the quota and closure changes: a
+-- statement updating qte_consomme of more than 50 dotations (bulk bons,
+-- reconciliation) sent "refresh" to every screen although no event was due.
+-- The rows are filtered first, then counted.
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION push_dotation_events()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_ids INTEGER[];
+    v_event TEXT;
+BEGIN
+    -- old_rows only exists for UPDATE
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(n.id) INTO v_ids FROM new_rows n;
+    ELSE
+        SELECT array_agg(n.id) INTO v_ids
+        FROM new_rows n
+        JOIN old_rows o ON o.id = n.id
+        WHERE o.qte IS DISTINCT FROM n.qte OR o.cloture IS DISTINCT FROM n.cloture;
+    END IF;
+    IF v_ids IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    IF array_length(v_ids, 1) > push_events_max_rows() THEN
+        PERFORM pg_notify('dpa_events', json_build_object('type', 'refresh', 'table', TG_TABLE_NAME)::text);
+        RETURN NULL;
+    END IF;
+
+    FOR v_event IN
+        SELECT json_build_object(
+            'type', 'dotation',
+            'op', lower(TG_OP),
+            'id', n.id,
+            'qte', n.qte,
+            'cloture', n.cloture,
+            'vehicule_id', n.vehicule_id,
+            'service_id', s.id,
+            'direction', s.direction
+        )::text
+        FROM new_rows n
+        JOIN benificiaire b ON b.id = n.benificiaire_id
+        JOIN service s ON s.id = b.service_id
+        WHERE n.id = ANY(v_ids)
+        ORDER BY n.id
+    LOOP
+        PERFORM pg_notify('dpa_events', v_event);
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,138 @@
+-- ============================================================================
+-- 016 - RECONCILIATION OF THE ARCHIVED DOTATIONS (migration 003)
+-- ============================================================================
+-- adjust_qte_consomme() also corrects qte_consomme of dotation_archive when
+-- the bons of an archived month are edited or deleted, but
+-- reconcile_dotations() only compared the hot table: a drift of an archived
+-- counter was never reported nor repaired. Both tables are now reconciled
+-- the same way; the new `archive` column tells where each row is.
+-- ============================================================================
+
+DROP FUNCTION IF EXISTS reconcile_dotations(BOOLEAN, BOOLEAN);
+
+CREATE FUNCTION reconcile_dotations(
+    p_incremental BOOLEAN DEFAULT FALSE,
+    p_repair BOOLEAN DEFAULT FALSE
+)
+RETURNS TABLE (
+    dotation_id INTEGER,
+    qte INTEGER,
+    qte_consomme NUMERIC,
+    qte_reelle NUMERIC,
+    ecart NUMERIC,
+    cloture BOOLEAN,
+    archive BOOLEAN
+) AS $$
+DECLARE
+    v_started TIMESTAMP := clock_timestamp();
+    v_ids INTEGER[];
+    v_checked INTEGER;
+    v_mismatches INTEGER;
+    v_repaired INTEGER := 0;
+    v_count INTEGER;
+BEGIN
+    IF p_incremental THEN
+        SELECT COALESCE(ARRAY_AGG(q.dotation_id), '{}') INTO v_ids
+        FROM dotation_reconciliation_queue q
+        WHERE q.touched_at <= v_started;
+
+        SELECT (SELECT COUNT(*) FROM dotation d WHERE d.id = ANY(v_ids))
+             + (SELECT COUNT(*) FROM dotation_archive d WHERE d.id = ANY(v_ids))
+        INTO v_checked;
+    ELSE
+        SELECT (SELECT COUNT(*) FROM dotation) + (SELECT COUNT(*) FROM dotation_archive)
+        INTO v_checked;
+    END IF;
+
+    CREATE TEMP TABLE IF NOT EXISTS tmp_reconciliation (
+        dotation_id INTEGER PRIMARY KEY,
+        qte INTEGER,
+        qte_consomme NUMERIC,
+        qte_reelle NUMERIC,
+        cloture BOOLEAN,
+        archive BOOLEAN
+    ) ON COMMIT DROP;
+    TRUNCATE tmp_reconciliation;
+
+    -- An archived dotation keeps its id: it is in one of the two tables only
+    IF p_incremental THEN
+        INSERT INTO tmp_reconciliation
+        SELECT d.id, d.qte, d.qte_consomme, COALESCE(r.total, 0), d.cloture, d.archive
+        FROM (
+            SELECT h.id, h.qte, h.qte_consomme, h.cloture, FALSE AS archive
+            FROM dotation h
+            WHERE h.id = ANY(v_ids)
+            UNION ALL
+            SELECT c.id, c.qte, c.qte_consomme, c.cloture, TRUE
+            FROM dotation_archive c
+            WHERE c.id = ANY(v_ids)
+        ) d
+        LEFT JOIN (
+            SELECT a.dotation_id, SUM(a.qte) AS total
+            FROM approvisionnement a
+            WHERE a.type_approvi = 'DOTATION'
+              AND a.dotation_id = ANY(v_ids)
+            GROUP BY a.dotation_id
+        ) r ON r.dotation_id = d.id
+        WHERE d.qte_consomme <> COALESCE(r.total, 0);
+    ELSE
+        INSERT INTO tmp_reconciliation
+        SELECT d.id, d.qte, d.qte_consomme, COALESCE(r.total, 0), d.cloture, d.archive
+        FROM (
+            SELECT h.id, h.qte, h.qte_consomme, h.cloture, FALSE AS archive
+            FROM dotation h
+            UNION ALL
+            SELECT c.id, c.qte, c.qte_consomme, c.cloture, TRUE
+            FROM dotation_archive c
+        ) d
+        LEFT JOIN (
+            SELECT a.dotation_id, SUM(a.qte) AS total
+            FROM approvisionnement a
+            WHERE a.type_approvi = 'DOTATION'
+            GROUP BY a.dotation_id
+        ) r ON r.dotation_id = d.id
+        WHERE d.qte_consomme <> COALESCE(r.total, 0);
+    END IF;
+
+    GET DIAGNOSTICS v_mismatches = ROW_COUNT;
+
+    IF p_repair AND v_mismatches > 0 THEN
+        UPDATE dotation d
+        SET qte_consomme = t.qte_reelle
+        FROM tmp_reconciliation t
+        WHERE d.id = t.dotation_id
+          AND NOT t.archive;
+
+        GET DIAGNOSTICS v_repaired = ROW_COUNT;
+
+        UPDATE dotation_archive d
+        SET qte_consomme = t.qte_reelle
+        FROM tmp_reconciliation t
+        WHERE d.id = t.dotation_id
+          AND t.archive;
+
+        GET DIAGNOSTICS v_count = ROW_COUNT;
+        v_repaired := v_repaired + v_count;
+    END IF;
+
+    DELETE FROM dotation_reconciliation_queue q
+    WHERE q.touched_at <= v_started
+      AND (v_ids IS NULL OR q.dotation_id = ANY(v_ids))
+      AND (p_repair OR NOT EXISTS (
+          SELECT 1 FROM tmp_reconciliation t WHERE t.dotation_id = q.dotation_id
+      ));
+
+    INSERT INTO dotation_reconciliation_run
+        (started_at, finished_at, incremental, repair, checked, mismatches, repaired)
+    VALUES
+        (v_started, clock_timestamp(), p_incremental, p_repair, v_checked, v_mismatches, v_repaired);
+
+    RETURN QUERY
+    SELECT t.dotation_id, t.qte, t.qte_consomme, t.qte_reelle,
+           t.qte_reelle - t.qte_consomme, t.cloture, t.archive
+    FROM tmp_reconciliation t
+    ORDER BY t.dotation_id;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION reconcile_dotations(BOOLEAN, BOOLEAN) IS 'Compare qte_consomme (dotation et dotation_archive) aux bons et corrige les écarts';
@@ -0,0 +1,100 @@
+-- ============================================================================
+-- 017 - ONE DOTATION PER VEHICLE AND MONTH ACROSS THE ARCHIVE (migration 001)
+-- ============================================================================
+-- UNIQUE (vehicule_id, mois, annee) exists on dotation and on
+-- dotation_archive, but not on both together: a month could be created
+-- again in dotation once archived, and archive_closed_dotations() then
+-- failed on the archive constraint. Inserts and period changes of dotation
+-- now check the archive, and the archiving leaves in dotation (with a
+-- warning) the rows whose month is already archived.
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION check_dotation_period_archived()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM dotation_archive a
+        WHERE a.vehicule_id = NEW.vehicule_id
+          AND a.mois = NEW.mois
+          AND a.annee = NEW.annee
+    ) THEN
+        RAISE EXCEPTION 'Dotation déjà archivée pour le véhicule % (%/%)', NEW.vehicule_id, NEW.mois, NEW.annee
+            USING ERRCODE = 'unique_violation';
+    END IF;
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Row level: a single index lookup, and UPDATE OF skips the consumption
+-- updates of every bon
+DROP TRIGGER IF EXISTS trg_check_dotation_period_archived ON dotation;
+CREATE TRIGGER trg_check_dotation_period_archived
+    BEFORE INSERT OR UPDATE OF vehicule_id, mois, annee ON dotation
+    FOR EACH ROW
+    EXECUTE FUNCTION check_dotation_period_archived();
+
+CREATE OR REPLACE FUNCTION archive_closed_dotations(p_age_months INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    v_limit INTEGER;
+    v_ids INTEGER[];
+    v_skipped INTEGER;
+BEGIN
+    -- Months are compared as annee * 12 + mois
+    v_limit := EXTRACT(YEAR FROM CURRENT_DATE)::INTEGER * 12
+             + EXTRACT(MONTH FROM CURRENT_DATE)::INTEGER
+             - p_age_months;
+
+    -- Months already archived (created again before migration 017) stay in
+    -- dotation, to be merged by hand
+    SELECT COUNT(*) INTO v_skipped
+    FROM dotation d
+    WHERE d.cloture = TRUE
+      AND d.annee * 12 + d.mois < v_limit
+      AND EXISTS (
+          SELECT 1 FROM dotation_archive a
+          WHERE a.vehicule_id = d.vehicule_id
+            AND a.mois = d.mois
+            AND a.annee = d.annee
+      );
+    IF v_skipped > 0 THEN
+        RAISE WARNING '% dotation(s) non archivée(s) : mois déjà archivé pour le véhicule', v_skipped;
+    END IF;
+
+    WITH moved AS (
+        INSERT INTO dotation_archive (
+            id, vehicule_id, benificiaire_id, mois, annee,
+            qte, qte_consomme, cloture, created_at, numordre
+        )
+        SELECT d.id, d.vehicule_id, d.benificiaire_id, d.mois, d.annee,
+               d.qte, d.qte_consomme, TRUE, d.created_at, d.numordre
+        FROM dotation d
+        WHERE d.cloture = TRUE
+          AND d.annee * 12 + d.mois < v_limit
+          AND NOT EXISTS (
+              SELECT 1 FROM dotation_archive a
+              WHERE a.vehicule_id = d.vehicule_id
+                AND a.mois = d.mois
+                AND a.annee = d.annee
+          )
+        RETURNING id, benificiaire_id, numordre
+    ), floors AS (
+        INSERT INTO dotation_archive_numordre (direction, numordre)
+        SELECT s.direction, MAX(m.numordre)
+        FROM moved m
+        JOIN benificiaire b ON b.id = m.benificiaire_id
+        JOIN service s ON s.id = b.service_id
+        WHERE m.numordre IS NOT NULL
+        GROUP BY s.direction
+        ON CONFLICT (direction) DO UPDATE
+            SET numordre = GREATEST(dotation_archive_numordre.numordre, EXCLUDED.numordre)
+    )
+    SELECT COALESCE(array_agg(id), '{}') INTO v_ids FROM moved;
+
+    -- Separate statement: restrict_dotation_delete() must see the archived copies
+    DELETE FROM dotation WHERE id = ANY(v_ids);
+
+    RETURN COALESCE(array_length(v_ids, 1), 0);
+END;
+$$ LANGUAGE plpgsql;
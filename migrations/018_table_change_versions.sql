@@ -0,0 +1,27 @@
+-- ============================================================================
+-- 018 - SHARED VERSIONS OF THE BON TABLES (migration 007)
+-- ============================================================================
+-- The dpa_tables payload was the table name only: every API process kept its
+-- own change counter, so an ETag of /approvisionnement/list issued by one
+-- uvicorn worker never matched on another, nor after a restart. Each
+-- notification now carries the next value of a sequence of the table
+-- ("approvisionnement:1234"). Notifications are delivered in commit order,
+-- so every worker ends on the value of the last committed change; a
+-- (re)connecting worker reads the current values of the sequences
+-- (app.core.table_versions). nextval() takes no lock and is not rolled back.
+-- ============================================================================
+
+CREATE SEQUENCE IF NOT EXISTS approvisionnement_change_seq;
+CREATE SEQUENCE IF NOT EXISTS dotation_change_seq;
+CREATE SEQUENCE IF NOT EXISTS dotation_archive_change_seq;
+
+CREATE OR REPLACE FUNCTION notify_table_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify(
+        'dpa_tables',
+        TG_TABLE_NAME || ':' || nextval((TG_TABLE_NAME || '_change_seq')::regclass)
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;